@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+# Measures debugger commands, database writes and wall time for register
+# injection, cache injection and reset through the OpenOCD and BDI3000
+# classes, normally against scripts/debugger_stand_in.py
+
+from argparse import ArgumentParser
+from contextlib import contextmanager, redirect_stdout
+from json import dumps, loads
+from os import devnull
+from os.path import abspath, dirname
+from sys import path
+from time import perf_counter
+from types import SimpleNamespace
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from src.jtag.bdi import bdi  # noqa: E402
+from src.jtag.openocd import openocd  # noqa: E402
+from src.jtag.response import response_parser  # noqa: E402
+
+parser = ArgumentParser()
+parser.add_argument('--address', default='127.0.0.1')
+parser.add_argument('--telnet_port', type=int, default=4444)
+parser.add_argument('--tcl_port', type=int, default=6666)
+parser.add_argument('--bdi_port', type=int, default=2323)
+parser.add_argument('-n', '--iterations', type=int, default=20)
+parser.add_argument('--hits', type=int, default=100,
+                    help='breakpoint hits before the first cache target')
+parser.add_argument('--targets', type=int, default=3,
+                    help='cache target accesses per cache injection')
+options = parser.parse_args()
+
+bdi_reset_output = ['- TARGET: processing user reset request',
+                    '- BDI asserts HRESET',
+                    '- Reset JTAG controller passed',
+                    '- JTAG exists check passed',
+                    '- BDI removes HRESET',
+                    '- TARGET: resetting target passed',
+                    '- TARGET: processing target startup \\.\\.\\.\\.',
+                    '- TARGET: processing target startup passed']
+
+
+class benchmark_event(object):
+    def save(self):
+        pass
+
+
+# records what the debugger classes would write to the campaign database
+class benchmark_database(object):
+    def __init__(self):
+        self.campaign = SimpleNamespace(command='', debugger_output='',
+                                        save=lambda: None)
+        self.result = SimpleNamespace(
+            id=1, debugger_output='', save=lambda: None,
+            injection_set=SimpleNamespace(create=self.create_injection))
+        self.iteration = SimpleNamespace(number=1)
+        self.metrics = None
+        self.events = 0
+        self.phases = SimpleNamespace(span=contextmanager(lambda *args:
+                                                          (yield)))
+
+    def log_event(self, *args, **kwargs):
+        self.events += 1
+        return benchmark_event()
+
+    def log_debugger_output(self, buff):
+        self.result.debugger_output += buff
+
+    def create_injection(self, **kwargs):
+        # the injection model fields inject_faults reads
+        return SimpleNamespace(**dict(
+            {'id': 1, 'field': None, 'register_alias': None,
+             'gold_value': None, 'injected_value': None, 'save': lambda: None},
+            **kwargs))
+
+
+# stands in for the trace database, replaying the same plan every iteration
+class benchmark_plans(object):
+    def __init__(self, plan):
+        self.plan = dumps(plan)
+
+    def get_plan_key(self, options):
+        return ''
+
+    def get_plan(self, iteration, key):
+        return loads(self.plan)
+
+
+class counting_telnet(object):
+    def __init__(self, telnet):
+        self.telnet = telnet
+        self.commands = 0
+
+    def __getattr__(self, name):
+        return getattr(self.telnet, name)
+
+    def write(self, buff):
+        self.commands += buff.count(b'\n')
+        self.telnet.write(buff)
+
+
+def connect(debugger_type, tcl_rpc=None, hit_count_proc=True):
+    # the same state open() sets up, without launching OpenOCD or opening
+    # the DUT serial port
+    debugger = debugger_type.__new__(debugger_type)
+    debugger.db = benchmark_database()
+    debugger.options = SimpleNamespace(
+        command='inject', debug=False, debugger_ip_address=options.address,
+        hit_count_proc=hit_count_proc, selected_target_indices=None, smp=True,
+        tcl_rpc=tcl_rpc)
+    debugger.dut = SimpleNamespace(start_timer=lambda: None,
+                                   stop_timer=lambda: None)
+    debugger.timeout = 30
+    if debugger_type is bdi:
+        debugger.prompts = [b'P2020>']
+        debugger.port = options.bdi_port
+    else:
+        debugger.prompts = [b'>']
+        debugger.port = options.telnet_port
+        debugger.rpc = None
+        debugger.register_cache = None
+        debugger.procs_loaded = False
+    debugger.connect_telnet()
+    debugger.telnet.read_until(debugger.prompts[0])
+    debugger.telnet = counting_telnet(debugger.telnet)
+    if debugger_type is openocd:
+        debugger.channel = response_parser(debugger.telnet, debugger.timeout)
+        if tcl_rpc:
+            debugger.connect_rpc()
+    return debugger
+
+
+def commands(debugger):
+    count = debugger.telnet.commands
+    if getattr(debugger, 'rpc', None) is not None:
+        count += debugger.rpc.stats['commands']
+    return count
+
+
+register_plan = benchmark_plans([
+    {'target': 'GPR', 'target_name': 'GPR', 'target_index': 0,
+     'register': 'r3', 'bit': 0, 'time': 0}])
+
+
+def cache_plan(load_registers):
+    # with and without the load register table decoded from the golden run
+    return benchmark_plans([
+        {'target': 'CACHE_L2', 'target_name': 'CACHE_L2', 'target_index': 0,
+         'register': 'cacheline_0000', 'field': 'data_0', 'bit': 0,
+         'time': 0, 'cache': {
+             'data_low': 0, 'skip_count': options.hits,
+             'start_addr': 0x00100100,
+             'targets': [[target, 0x00100300 + 4*target, 0,
+                          'r2' if load_registers else None]
+                         for target in range(options.targets)]}}])
+
+
+def register_injection(debugger):
+    debugger.targets = {'GPR': {'registers': {'r3': {}}}}
+    # fault_injector halts the DUT before injecting into registers
+    debugger.halt_dut()
+    debugger.inject_faults(register_plan)
+
+
+cache_plans = [cache_plan(False), cache_plan(True)]
+
+
+def cache_injection(debugger, load_registers):
+    debugger.targets = {'CACHE_L2': {'registers': {}}}
+    # started by inject_faults, as in a campaign with an application
+    debugger.db.campaign.command = 'benchmark'
+    debugger.inject_faults(cache_plans[load_registers])
+
+
+def reset(debugger):
+    if isinstance(debugger, bdi):
+        debugger.command('reset', bdi_reset_output, 'Error resetting DUT')
+    else:
+        debugger.command('reset',
+                         ['JTAG tap: zynq.dap tap/device found: 0x4ba00477'],
+                         'Error resetting DUT')
+
+
+scenarios = [
+    ('register injection', 'OpenOCD telnet', lambda: connect(openocd),
+     register_injection),
+    ('register injection', 'OpenOCD TCL RPC',
+     lambda: connect(openocd, options.tcl_port), register_injection),
+    ('register injection', 'BDI3000', lambda: connect(bdi),
+     register_injection),
+    ('cache injection', 'telnet, per hit, disassembly',
+     lambda: connect(openocd, hit_count_proc=False),
+     lambda debugger: cache_injection(debugger, False)),
+    ('cache injection', 'telnet', lambda: connect(openocd),
+     lambda debugger: cache_injection(debugger, True)),
+    ('cache injection', 'TCL RPC', lambda: connect(openocd, options.tcl_port),
+     lambda debugger: cache_injection(debugger, True)),
+    ('reset', 'OpenOCD telnet', lambda: connect(openocd), reset),
+    ('reset', 'OpenOCD TCL RPC', lambda: connect(openocd, options.tcl_port),
+     reset),
+    ('reset', 'BDI3000', lambda: connect(bdi), reset)]
+
+print('{:<20}{:<32}{:>10}{:>10}{:>12}'.format(
+    'scenario', 'debugger', 'commands', 'events', 'ms'))
+for name, variant, connect_debugger, scenario in scenarios:
+    debugger = connect_debugger()
+    # inject_faults prints each step
+    with open(devnull, 'w') as null, redirect_stdout(null):
+        scenario(debugger)  # warm up, including loading OpenOCD procedures
+        count = commands(debugger)
+        events = debugger.db.events
+        start = perf_counter()
+        for iteration in range(options.iterations):
+            scenario(debugger)
+        elapsed = perf_counter() - start
+    print('{:<20}{:<32}{:>10.1f}{:>10.1f}{:>12.2f}'.format(
+        name, variant, (commands(debugger) - count) / options.iterations,
+        (debugger.db.events - events) / options.iterations,
+        elapsed / options.iterations * 1000))
+    debugger.telnet.close()
+    if getattr(debugger, 'rpc', None) is not None:
+        debugger.rpc.close()
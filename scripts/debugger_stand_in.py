@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+# Stand-in for OpenOCD (telnet and TCL RPC ports) with a simulated ZedBoard
+# and for a BDI3000 (telnet) with a simulated P2020, used to exercise and time
+# the debugger paths without hardware
+
+from argparse import ArgumentParser
+from socket import IPPROTO_TCP, TCP_NODELAY
+from socketserver import BaseRequestHandler, ThreadingTCPServer
+from threading import Condition, Thread, Timer
+from time import sleep
+
+parser = ArgumentParser()
+parser.add_argument('--telnet_port', type=int, default=4444)
+parser.add_argument('--tcl_port', type=int, default=6666)
+parser.add_argument('--bdi_port', type=int, default=2323)
+parser.add_argument('--latency', type=float, default=0.002,
+                    help='seconds added to each network round trip')
+parser.add_argument('--run_time', type=float, default=0.001,
+                    help='seconds the target runs before hitting a breakpoint')
+parser.add_argument('--reset_time', type=float, default=0.1,
+                    help='seconds taken to reset the target')
+options = parser.parse_args()
+
+halted_message = ('target halted in ARM state due to breakpoint, current '
+                  'mode: System\r\ncpsr: 0x6000001f pc: {}\r\n')
+registers = ['r{}'.format(i) for i in range(13)] + ['sp', 'lr', 'pc', 'cpsr']
+
+
+class target_error(Exception):
+    pass
+
+
+class target(object):
+    def __init__(self):
+        self.condition = Condition()
+        self.listeners = []
+        self.procs = set()
+        self.reset()
+
+    def reset(self):
+        self.registers = {register: 0 for register in registers}
+        self.registers['pc'] = 0x00100000
+        self.registers['cpsr'] = 0x6000001f
+        self.halted = True
+        self.breakpoints = set()
+        self.cycles = 0
+
+    def run(self, address=None):
+        with self.condition:
+            if address is not None:
+                self.registers['pc'] = int(address, base=0)
+            self.halted = False
+            if self.breakpoints:
+                Timer(options.run_time, self.hit,
+                      [min(self.breakpoints)]).start()
+
+    def hit(self, address):
+        with self.condition:
+            if self.halted:
+                return
+            self.halted = True
+            self.registers['pc'] = address
+            self.cycles += 1000
+            self.condition.notify_all()
+            for listener in self.listeners:
+                listener(halted_message.format(hex(address)))
+
+    def execute(self, command):
+        words = command.split()
+        if not words:
+            return ''
+        if words[0] == 'capture':
+            return self.execute(command.split(None, 1)[1].strip('{}'))
+        if words[0] == 'proc':
+            self.procs.add(words[1])
+            return ''
+        if words[0] in self.procs:
+            return getattr(self, words[0])(*words[1:])
+        with self.condition:
+            if words[0] == 'halt':
+                self.halted = True
+                return ''
+            elif words[0] == 'resume':
+                self.run(words[1] if len(words) > 1 else None)
+                return ''
+            elif words[0] == 'step':
+                self.halted = True
+                self.registers['pc'] += 4
+                self.cycles += 1
+                return ''
+            elif words[0] == 'wait_halt':
+                time = int(words[1])/1000 if len(words) > 1 else 5
+                if not self.condition.wait_for(lambda: self.halted, time):
+                    raise target_error(
+                        'timed out while waiting for target halted')
+                return ''
+            elif words[0] == 'bp':
+                self.breakpoints.add(int(words[1], base=0))
+                return 'breakpoint set at {}'.format(words[1])
+            elif words[0] == 'rbp':
+                self.breakpoints.discard(int(words[1], base=0))
+                return ''
+            elif words[0] == 'reg':
+                if len(words) == 1:
+                    return '\n'.join(
+                        '({}) {} (/32): 0x{:08x}'.format(
+                            i, register, self.registers[register])
+                        for i, register in enumerate(registers))
+                # banked and coprocessor registers are created when first used
+                self.registers.setdefault(words[1], 0)
+                if len(words) > 2:
+                    self.registers[words[1]] = int(words[2], base=0)
+                return '{} (/32): 0x{:08x}'.format(
+                    words[1], self.registers[words[1]])
+            elif words[:2] == ['arm', 'mrc']:
+                return str(self.cycles)
+            elif words[:2] == ['arm', 'mcr']:
+                return ''
+            elif words[:2] == ['arm', 'disassemble']:
+                return '{}\t0xe5912000\tLDR r2, [r1]'.format(words[2])
+            elif words[0] == 'mdw':
+                address = int(words[1], base=0)
+                return '\n'.join('0x{:08x}: {}'.format(
+                    address+16*line, ' '.join(['00000000']*4))
+                    for line in range(max(int(words[2])//4, 1)))
+            elif words[0] == 'targets':
+                return ''
+            elif words[0] == 'reset':
+                sleep(options.reset_time)
+                self.reset()
+                return 'JTAG tap: zynq.dap tap/device found: 0x4ba00477'
+            else:
+                raise target_error('invalid command name "{}"'.format(
+                    words[0]))
+
+
+    # the procedures DrSEUs uploads, executed natively
+    def drseus_break_after(self, address, times, timeout):
+        hit = 0
+        self.execute('bp {} 1 hw'.format(address))
+        try:
+            self.execute('resume')
+            self.execute('wait_halt {}'.format(timeout))
+            hit += 1
+            while hit < int(times):
+                self.execute('step')
+                self.execute('resume')
+                self.execute('wait_halt {}'.format(timeout))
+                hit += 1
+        except target_error as error:
+            self.execute('rbp {}'.format(address))
+            self.execute('halt')
+            raise target_error('drseus hits: {} failed: {}'.format(hit, error))
+        self.execute('rbp {}'.format(address))
+        return 'drseus hits: {}'.format(hit)
+
+
+dut = target()
+
+
+class p2020(object):
+    cores = 2
+    reset_output = ['- TARGET: processing user reset request',
+                    '- BDI asserts HRESET',
+                    '- Reset JTAG controller passed',
+                    '- JTAG exists check passed',
+                    '- BDI removes HRESET',
+                    '- TARGET: resetting target passed',
+                    '- TARGET: processing target startup ....',
+                    '- TARGET: processing target startup passed']
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.registers = [{'msr': 0x00029000, 'pc': 0x00100000}
+                          for core in range(self.cores)]
+        self.memory = {}
+        self.halted = [False]*self.cores
+        self.core = 0
+
+    def register(self, name, value=None):
+        registers = self.registers[self.core]
+        registers.setdefault(name, 0)
+        if value is not None:
+            registers[name] = int(value, base=0)
+        return '{:<15}: 0x{:08x}  {}'.format(name, registers[name],
+                                            registers[name])
+
+    def execute(self, command):
+        words = command.split()
+        if not words:
+            return ''
+        elif words[0] == 'halt':
+            cores = [int(core) for core in words[1:]] or [0]
+            for core in cores:
+                self.halted[core] = True
+            return '\n'.join('- TARGET: core #{} has entered debug mode'.format(
+                core) for core in cores)
+        elif words[0] == 'go':
+            for core in [int(core) for core in words[1:]] or [0]:
+                self.halted[core] = False
+            return ''
+        elif words[0] == 'select':
+            self.core = int(words[1])
+            return ('Target CPU      : MPC85xx (e500v2 rev.2)\n'
+                    'Core state      : {}'.format(
+                        'debug mode' if self.halted[self.core] else 'running'))
+        elif words[0] == 'rd':
+            return self.register(words[1])
+        elif words[0] == 'rm':
+            self.register(words[1], words[2])
+            return ''
+        elif words[0] in ('rdspr', 'rdpmr'):
+            return self.register('{} {}'.format(words[0][2:], words[1]))
+        elif words[0] in ('rmspr', 'rmpmr'):
+            self.register('{} {}'.format(words[0][2:], words[1]), words[2])
+            return ''
+        elif words[0] in ('md', 'mdb', 'mdh', 'mdd'):
+            address = int(words[1], base=0)
+            return '{:08x} : 0x{:08x}  {}'.format(
+                address, self.memory.get(address, 0),
+                self.memory.get(address, 0))
+        elif words[0] in ('mm', 'mmb', 'mmh', 'mmd'):
+            self.memory[int(words[1], base=0)] = int(words[2], base=0)
+            return ''
+        elif words[0] == 'reset':
+            sleep(options.reset_time)
+            self.reset()
+            return '\n'.join(self.reset_output)
+        else:
+            return 'syntax error in command'
+
+
+bdi_dut = p2020()
+
+
+def receive(request, separator):
+    buff = b''
+    while True:
+        data = request.recv(65536)
+        if not data:
+            return
+        # the whole chunk arrived together, so it costs one round trip
+        sleep(options.latency)
+        buff += data
+        while separator in buff:
+            message, buff = buff.split(separator, 1)
+            yield message.decode('utf-8', 'replace')
+
+
+class telnet_handler(BaseRequestHandler):
+    def handle(self):
+
+        def send(message):
+            self.request.sendall(message.encode('utf-8'))
+
+        dut.listeners.append(send)
+        try:
+            send('Open On-Chip Debugger\r\n> ')
+            for line in receive(self.request, b'\n'):
+                line = line.strip()
+                if line == 'shutdown':
+                    break
+                try:
+                    output = dut.execute(line)
+                except target_error as error:
+                    output = str(error)
+                send('{}\r\n{}> '.format(
+                    line, output.replace('\n', '\r\n') + '\r\n'
+                    if output else ''))
+        except OSError:
+            pass
+        finally:
+            dut.listeners.remove(send)
+
+
+class tcl_handler(BaseRequestHandler):
+    def handle(self):
+        for message in receive(self.request, b'\x1a'):
+            if message.startswith('proc drseus_rpc '):
+                reply = ''
+            elif message.startswith('drseus_rpc '):
+                try:
+                    reply = '0\n{}'.format(dut.execute(
+                        message.split(None, 1)[1][1:-1]))
+                except target_error as error:
+                    reply = '1\n{}'.format(error)
+            else:
+                try:
+                    reply = dut.execute(message)
+                except target_error as error:
+                    reply = str(error)
+            self.request.sendall(reply.encode('utf-8') + b'\x1a')
+
+
+class bdi_handler(BaseRequestHandler):
+    def handle(self):
+        self.request.sendall(b'BDI3000 stand-in\r\nP2020>')
+        for line in receive(self.request, b'\n'):
+            line = line.strip()
+            if line in ('quit', 'boot'):
+                break
+            output = bdi_dut.execute(line)
+            self.request.sendall('{}P2020>'.format(
+                output.replace('\n', '\r\n') + '\r\n' if output else ''
+            ).encode('utf-8'))
+
+
+class server(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    # like OpenOCD, replies are not held back waiting for acknowledgements
+    def get_request(self):
+        request, address = super().get_request()
+        request.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        return request, address
+
+
+telnet_server = server(('127.0.0.1', options.telnet_port), telnet_handler)
+tcl_server = server(('127.0.0.1', options.tcl_port), tcl_handler)
+bdi_server = server(('127.0.0.1', options.bdi_port), bdi_handler)
+Thread(target=tcl_server.serve_forever, daemon=True).start()
+Thread(target=bdi_server.serve_forever, daemon=True).start()
+print('OpenOCD stand-in listening on telnet port {} and TCL port {}, BDI3000 '
+      'stand-in on port {}'.format(options.telnet_port, options.tcl_port,
+                                   options.bdi_port))
+telnet_server.serve_forever()
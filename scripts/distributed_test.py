@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# Runs a coordinator and several agents with simulated boards on localhost,
+# with boards exiting during iterations (an agent that loses all of its boards
+# is started again), and checks that every iteration of the campaign is
+# completed once, with one stored result, and that agents only receive the
+# campaign files they need. Other options (e.g. --sqlite or --db_name) are
+# passed to drseus.py as the campaign database settings
+
+from argparse import ArgumentParser
+from os import chdir, makedirs
+from os.path import abspath, dirname, exists, join
+from shutil import rmtree
+from socket import create_connection
+from subprocess import Popen
+from sys import executable, exit, path
+from tempfile import mkdtemp
+from time import perf_counter, sleep
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from src import setup_django  # noqa: E402
+from src.arguments import parser as drseus_parser  # noqa: E402
+
+parser = ArgumentParser()
+parser.add_argument('-n', '--iterations', type=int, default=20)
+parser.add_argument('--agents', type=int, default=2)
+parser.add_argument('--boards', type=int, default=2,
+                    help='simulated boards per agent')
+parser.add_argument('--port', type=int, default=9201)
+parser.add_argument('--loss', type=float, default=0.2,
+                    help='probability of a board exiting during an iteration')
+parser.add_argument('--lease_time', type=float, default=10)
+parser.add_argument('--timeout', type=float, default=600)
+parser.add_argument('--keep', action='store_true',
+                    help='keep the campaign and the test directory')
+options, drseus_options = parser.parse_known_args()
+drseus = join(dirname(dirname(abspath(__file__))), 'drseus.py')
+
+directory = mkdtemp(prefix='drseus-distributed-test-')
+makedirs(join(directory, 'coordinator', 'campaign-data'))
+chdir(join(directory, 'coordinator'))
+setup_django(drseus_parser.parse_args(drseus_options+['log']))
+from django.db import connection  # noqa: E402
+from django.db.utils import OperationalError  # noqa: E402
+from src.database import initialize_database  # noqa: E402
+from src.log.models import campaign as campaign_model  # noqa: E402
+
+campaign = campaign_model(architecture='a9', aux=False, command='simulated',
+                          description='distributed test', execution_time=1,
+                          rsakey='', simics=False)
+try:
+    campaign.save()
+except OperationalError:
+    initialize_database(drseus_parser.parse_args(drseus_options+['log']))
+    campaign.save()
+campaign_folder = 'campaign-data/{}'.format(campaign.id)
+makedirs(join(campaign_folder, 'gold'))
+with open(join(campaign_folder, 'gold', 'output.txt'), 'w') as gold_file:
+    gold_file.write('gold\n')
+makedirs(join(campaign_folder, 'sqlite'))
+makedirs(join(campaign_folder, 'results', '0'))
+with open(join(campaign_folder, 'results', '0', 'output.txt'), 'w') as result:
+    result.write('earlier result, not needed by agents\n')
+connection.close()
+
+coordinator = Popen([executable, drseus]+drseus_options+[
+    '-c', str(campaign.id), 'inject', '-n', str(options.iterations),
+    '--coordinator', str(options.port),
+    '--lease_time', str(options.lease_time)])
+for attempt in range(100):
+    try:
+        create_connection(('127.0.0.1', options.port)).close()
+        break
+    except ConnectionRefusedError:
+        sleep(0.1)
+
+
+def start_agent(number):
+    agent_directory = join(directory, 'agent{}'.format(number))
+    if not exists(join(agent_directory, 'campaign-data')):
+        makedirs(join(agent_directory, 'campaign-data'))
+    return Popen([executable, drseus, 'agent', '127.0.0.1', str(options.port),
+                  '-p', str(options.boards), '--simulate',
+                  '--simulate_delay', '0.1', '0.5',
+                  '--simulate_loss', str(options.loss)], cwd=agent_directory)
+
+
+agents = [start_agent(number) for number in range(options.agents)]
+restarts = 0
+start = perf_counter()
+failures = []
+try:
+    while coordinator.poll() is None:
+        if perf_counter() - start > options.timeout:
+            failures.append('campaign did not finish in {} seconds'.format(
+                options.timeout))
+            break
+        for number, agent in enumerate(agents):
+            if agent.poll() is not None:
+                agents[number] = start_agent(number)
+                restarts += 1
+        sleep(0.5)
+finally:
+    for process in agents+[coordinator]:
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
+
+iterations = list(campaign.iteration_set.order_by('number').values_list(
+    'number', 'status', 'result_id'))
+results = campaign.result_set.count()
+print('{} iterations, {} results, {} agent restarts'.format(
+    len(iterations), results, restarts))
+if [number for number, status, result in iterations] != \
+        list(range(1, options.iterations+1)):
+    failures.append('wrong iteration numbers')
+if any(status != 'completed' or result is None
+       for number, status, result in iterations):
+    failures.append('not every iteration was completed')
+if len(set(result for number, status, result in iterations)) != \
+        len(iterations) or results != len(iterations):
+    failures.append('iterations were not completed exactly once')
+for number in range(options.agents):
+    agent_folder = join(directory, 'agent{}'.format(number), campaign_folder)
+    if not exists(join(agent_folder, 'gold', 'output.txt')) or \
+            not exists(join(agent_folder, 'sqlite', 'database.sqlite')):
+        failures.append('agent {} is missing campaign files'.format(number))
+    if exists(join(agent_folder, 'results')):
+        failures.append('agent {} received earlier results'.format(number))
+for failure in failures:
+    print('FAIL: {}'.format(failure))
+if not options.keep:
+    campaign.delete()
+    rmtree(directory)
+print('FAIL' if failures else 'PASS')
+exit(1 if failures else 0)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Compares round trips and latency of the OpenOCD telnet and TCL RPC
+# transports, normally against scripts/debugger_stand_in.py
+
+from argparse import ArgumentParser
+from importlib.util import module_from_spec, spec_from_file_location
+from os.path import abspath, dirname, join
+from telnetlib import Telnet
+from time import perf_counter
+
+parser = ArgumentParser()
+parser.add_argument('--address', default='127.0.0.1')
+parser.add_argument('--telnet_port', type=int, default=4444)
+parser.add_argument('--tcl_port', type=int, default=6666)
+parser.add_argument('-n', '--iterations', type=int, default=100)
+options = parser.parse_args()
+
+# loaded by path since the drseus package requires Django
+spec = spec_from_file_location('tcl_rpc', join(
+    dirname(dirname(abspath(__file__))), 'src', 'jtag', 'tcl_rpc.py'))
+tcl_rpc = module_from_spec(spec)
+spec.loader.exec_module(tcl_rpc)
+
+halted = b'target halted in ARM state due to breakpoint, current mode: System'
+
+
+class telnet_client(object):
+    def __init__(self):
+        self.telnet = Telnet(options.address, options.telnet_port, timeout=30)
+        self.telnet.read_until(b'>')
+        self.round_trips = 0
+
+    # same exchange as jtag.command: drain, write, wait for the echo, then
+    # wait for the prompt
+    def command(self, command):
+        self.telnet.read_very_eager()
+        self.telnet.write(bytes('{}\n'.format(command), encoding='utf-8'))
+        self.telnet.expect([bytes(command, encoding='utf-8')], timeout=30)
+        index, match, buff = self.telnet.expect([b'>'], timeout=30)
+        self.round_trips += 1
+        return buff.decode('utf-8', 'replace')
+
+    def break_dut(self, address):
+        self.telnet.read_very_eager()
+        self.telnet.write(bytes('halt\n', encoding='utf-8'))
+        self.telnet.write(bytes('bp ' + address + ' 1 hw\n', encoding='utf-8'))
+        self.telnet.write(bytes('resume 0x00100000\n', encoding='utf-8'))
+        self.telnet.read_until(halted)
+        self.telnet.write(bytes('rbp ' + address + '\n', encoding='utf-8'))
+        self.telnet.read_until(bytes('rbp ' + address, encoding='utf-8'))
+        self.telnet.read_until(b'>')
+        self.round_trips += 2
+
+
+class rpc_client(object):
+    def __init__(self):
+        self.rpc = tcl_rpc.tcl_rpc(options.address, options.tcl_port)
+        self.rpc.connect()
+
+    @property
+    def round_trips(self):
+        return self.rpc.stats['round_trips']
+
+    def command(self, command):
+        return self.rpc.command(command)
+
+    def break_dut(self, address):
+        self.rpc.batch(['halt', 'bp {} 1 hw'.format(address),
+                        'resume 0x00100000', 'wait_halt 30000',
+                        'rbp {}'.format(address)])
+
+
+operations = {
+    'get register': lambda client: client.command('reg r0'),
+    'set register': lambda client: client.command('reg r0 0x12345678'),
+    'check cycles': lambda client: client.command('arm mrc 15 0 9 13 0'),
+    'break': lambda client: client.break_dut('0x00100100')}
+
+print('{:<16}{:>12}{:>12}{:>12}{:>12}'.format(
+    'operation', 'telnet ms', 'rpc ms', 'telnet rt', 'rpc rt'))
+clients = {'telnet': telnet_client(), 'rpc': rpc_client()}
+for name, operation in operations.items():
+    results = {}
+    for transport, client in clients.items():
+        round_trips = client.round_trips
+        start = perf_counter()
+        for i in range(options.iterations):
+            operation(client)
+        results[transport] = (
+            (perf_counter() - start) / options.iterations * 1000,
+            (client.round_trips - round_trips) / options.iterations)
+    print('{:<16}{:>12.3f}{:>12.3f}{:>12.1f}{:>12.1f}'.format(
+        name, results['telnet'][0], results['rpc'][0],
+        results['telnet'][1], results['rpc'][1]))
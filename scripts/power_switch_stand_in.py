@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# HTTP stand-in for the web power switch, used to exercise the power switch
+# client without the hardware
+
+from argparse import ArgumentParser
+from base64 import b64encode
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock
+from urllib.parse import parse_qsl, urlsplit
+
+parser = ArgumentParser()
+parser.add_argument('-p', '--port', type=int, default=8080)
+parser.add_argument('--user', default='admin')
+parser.add_argument('--password', default='chrec')
+parser.add_argument('--outlets', type=int, default=8)
+options = parser.parse_args()
+
+authorization = 'Basic {}'.format(b64encode('{}:{}'.format(
+    options.user, options.password).encode('utf-8')).decode('utf-8'))
+lock = Lock()
+outlets = {outlet: 'OFF' for outlet in range(1, options.outlets+1)}
+requests = {'index.htm': 0, 'outlet': 0}
+
+
+def status_page():
+    rows = ''.join(
+        '<tr><td>{0}</td><td>Outlet {0}</td><td>{1}</td>'
+        '<td><a href=outlet?{0}={2}>Switch {2}</a></td></tr>'.format(
+            outlet, state, 'OFF' if state == 'ON' else 'ON')
+        for outlet, state in sorted(outlets.items()))
+    return ('<html><body><table><tr><th>Controller: Stand-in</th></tr></table>'
+            '<table><tr><td>Individual Control</td></tr>'
+            '<tr><th>#</th><th>Name</th><th>State</th><th>Action</th></tr>'
+            '{}</table><!-- requests: {} --></body></html>').format(
+                rows, requests)
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.headers.get('Authorization') != authorization:
+            self.send_response(401)
+            self.end_headers()
+            return
+        url = urlsplit(self.path)
+        with lock:
+            if url.path == '/index.htm':
+                requests['index.htm'] += 1
+            elif url.path == '/outlet':
+                requests['outlet'] += 1
+                for outlet, state in parse_qsl(url.query):
+                    state = state.upper()
+                    if outlet == 'a':
+                        for outlet in outlets:
+                            outlets[outlet] = state
+                    else:
+                        outlets[int(outlet)] = state
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            page = status_page().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, format_, *args):
+        pass
+
+
+class server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+print('power switch stand-in listening on port {}'.format(options.port))
+server(('127.0.0.1', options.port), handler).serve_forever()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Checks that power cycle requests made at the same time by several processes
+# (as by the injection process of each board) are served by one off/on cycle
+# of the power switch, using scripts/power_switch_stand_in.py
+
+from argparse import ArgumentParser
+from multiprocessing import Process
+from os import chdir, remove
+from os.path import abspath, dirname, exists, join
+from re import findall, search
+from socket import create_connection
+from subprocess import Popen
+from sys import executable, exit, path
+from tempfile import mkdtemp
+from time import perf_counter, sleep
+from types import SimpleNamespace
+from urllib.request import Request, urlopen
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from src.power_switch import power_switch  # noqa: E402
+
+parser = ArgumentParser()
+parser.add_argument('-p', '--port', type=int, default=8089)
+parser.add_argument('--clients', type=int, choices=range(1, 8), default=4,
+                    help='boards failing at once, fewer than the outlets')
+options = parser.parse_args()
+
+switch_options = SimpleNamespace(
+    power_switch_ip_address='127.0.0.1:{}'.format(options.port),
+    power_switch_username='admin', power_switch_password='chrec',
+    power_switch_cache=2)
+
+
+def client(outlet):
+    power_switch(switch_options).power_cycle_batched(outlet, delay=1)
+
+
+def switch_state():
+    page = urlopen(Request(
+        'http://{}/index.htm'.format(switch_options.power_switch_ip_address),
+        headers={'Authorization': 'Basic YWRtaW46Y2hyZWM='})).read().decode()
+    outlets = {int(outlet): state for outlet, state in findall(
+        r'<tr><td>(\d+)</td><td>[^<]*</td><td>(\w+)</td>', page)}
+    return outlets, int(search(r"'outlet': (\d+)", page).group(1))
+
+
+def power_cycle(outlets):
+    start = perf_counter()
+    clients = [Process(target=client, args=[outlet]) for outlet in outlets]
+    for process in clients:
+        process.start()
+    for process in clients:
+        process.join()
+    if any(process.exitcode for process in clients):
+        raise Exception('power cycle client failed')
+    return perf_counter() - start
+
+
+stand_in = Popen([executable, join(dirname(abspath(__file__)),
+                                   'power_switch_stand_in.py'),
+                  '--port', str(options.port)])
+chdir(mkdtemp())
+failures = 0
+try:
+    for attempt in range(50):
+        try:
+            create_connection(('127.0.0.1', options.port)).close()
+            break
+        except ConnectionRefusedError:
+            sleep(0.1)
+    switch = power_switch(switch_options)
+
+    outlets = list(range(1, options.clients+1))
+    elapsed = power_cycle(outlets)
+    state, requests = switch_state()
+    print('{} simultaneous requests: {} outlet requests in {:.1f} seconds'
+          .format(len(outlets), requests, elapsed))
+    # one off and one on request for each outlet
+    if requests != 2*len(outlets):
+        print('FAIL: requests were not served by one power cycle')
+        failures += 1
+    if any(state[outlet] != 'ON' for outlet in outlets) or \
+            any(state[outlet] != 'OFF' for outlet in state
+                if outlet not in outlets):
+        print('FAIL: wrong outlet states: {}'.format(state))
+        failures += 1
+
+    # a later request gets its own cycle
+    power_cycle([1])
+    if switch_state()[1] != requests+2:
+        print('FAIL: later request was not served by a new power cycle')
+        failures += 1
+    if exists(switch.pending_file):
+        if open(switch.pending_file).read():
+            print('FAIL: requests left queued')
+            failures += 1
+        remove(switch.pending_file)
+finally:
+    stand_in.terminate()
+    stand_in.wait()
+print('FAIL' if failures else 'PASS')
+exit(1 if failures else 0)
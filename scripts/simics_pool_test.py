@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Checks the Simics worker pool against scripts/simics_stand_in.py (given with
+# --simics_binary as to "drseus.py inject"): workers are reused for up to
+# --reuse checkpoints, replaced when clearing them fails and replaced when
+# they exit
+
+from argparse import ArgumentParser
+from os.path import abspath, dirname, join
+from sys import exit, path
+from tempfile import mkdtemp
+from time import sleep
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from src.arguments import parser as drseus_parser  # noqa: E402
+from src.simics import simics  # noqa: E402
+from src.simics.pool import simics_pool  # noqa: E402
+
+parser = ArgumentParser()
+parser.add_argument('--reuse', type=int, default=3)
+options = parser.parse_args()
+stand_in = join(dirname(abspath(__file__)), 'simics_stand_in.py')
+cwd = mkdtemp()
+failures = []
+
+
+def make_pool(*args):
+    pool_options = drseus_parser.parse_args(
+        ['inject', '--pool', '1', '--reuse', str(options.reuse),
+         '--simics_binary', stand_in]+list(args))
+    return simics_pool(
+        [abspath(pool_options.simics_binary), '-no-win', '-no-gui', '-q'],
+        cwd, pool_options.simics_pool, pool_options.simics_reuse,
+        pool_options.simics_clear, error_messages=simics.error_messages)
+
+
+def use(pool, checkpoint):
+    worker = pool.acquire()
+    if worker is None:
+        raise Exception('no Simics worker from pool')
+    buff = worker.command('read-configuration {}'.format(checkpoint))
+    if 'Error' in buff:
+        failures.append('worker was not cleared: {}'.format(buff.strip()))
+    return worker
+
+
+def wait_idle(pool):
+    for attempt in range(300):
+        if pool.idle.qsize():
+            return
+        sleep(0.1)
+    raise Exception('pool did not launch a worker')
+
+
+def check(condition, failure):
+    if not condition:
+        failures.append(failure)
+
+
+pool = make_pool()
+try:
+    # reuse up to --reuse checkpoints, then replaced
+    workers = []
+    for checkpoint in range(options.reuse+1):
+        worker = use(pool, checkpoint)
+        workers.append(worker)
+        pool.release(worker)
+    print('reuse: {}'.format(pool))
+    check(all(worker is workers[0] for worker in workers[:options.reuse]),
+          'worker was not reused for {} checkpoints'.format(options.reuse))
+    check(workers[0].process.poll() is not None,
+          'worker was not replaced after {} checkpoints'.format(options.reuse))
+    check(workers[-1] is not workers[0], 'replaced worker was used again')
+    check(pool.stats['reused'] == options.reuse-1 and
+          pool.stats['recycled'] == 1, 'wrong reuse counts: {}'.format(pool))
+
+    # forced exit while in use
+    worker = use(pool, 'exit')
+    worker.process.kill()
+    worker.process.wait()
+    pool.release(worker)
+    check(pool.stats['recycled'] == 2,
+          'exited worker was not recycled: {}'.format(pool))
+    # forced exit while idle
+    wait_idle(pool)
+    for idle in list(pool.idle.queue):
+        idle.process.kill()
+        idle.process.wait()
+    worker = use(pool, 'replacement')
+    print('forced exit: {}'.format(pool))
+    check(worker.process.poll() is None and worker.healthy(),
+          'exited worker was not replaced')
+    check(pool.stats['unhealthy'] >= 1,
+          'exited idle worker was not detected: {}'.format(pool))
+    pool.release(worker)
+finally:
+    pool.close()
+
+# a clear command rejected by Simics (a configuration is already loaded)
+pool = make_pool('--clear', 'read-configuration cleared')
+try:
+    first = use(pool, 'first')
+    pool.release(first)
+    second = use(pool, 'second')
+    print('failed clear: {}'.format(pool))
+    check(first.process.poll() is not None and second is not first,
+          'worker was reused after a failed clear')
+    check(pool.stats['recycled'] == 1 and pool.stats['reused'] == 0,
+          'wrong counts after a failed clear: {}'.format(pool))
+    pool.release(second)
+finally:
+    pool.close()
+
+for failure in failures:
+    print('FAIL: {}'.format(failure))
+print('FAIL' if failures else 'PASS')
+exit(1 if failures else 0)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Scripted stand-in for the Simics command line, used to exercise the Simics
+# worker pool without a Simics installation or license
+
+from argparse import ArgumentParser
+from os import openpty, ttyname
+from signal import SIGINT, signal
+from sys import stdin, stdout
+from time import sleep
+
+parser = ArgumentParser()
+parser.add_argument('--license_delay', type=float, default=2,
+                    help='seconds to wait before the first prompt')
+parser.add_argument('--fail_after', type=int,
+                    help='exit after reading this many configurations')
+parser.add_argument('-no-win', action='store_true')
+parser.add_argument('-no-gui', action='store_true')
+parser.add_argument('-q', action='store_true')
+options = parser.parse_args()
+
+configuration = None
+configurations = 0
+running = False
+ttys = []
+
+
+def prompt():
+    stdout.write('simics> ')
+    stdout.flush()
+
+
+def interrupt(signum, frame):
+    global running
+    if running:
+        running = False
+        stdout.write('\n[DUT] stopped\n')
+        prompt()
+
+
+signal(SIGINT, interrupt)
+sleep(options.license_delay)
+stdout.write('Simics stand-in\n')
+prompt()
+for line in stdin:
+    command = line.strip().split()
+    if not command:
+        pass
+    elif command[0] == 'quit':
+        break
+    elif command[0] == 'read-configuration':
+        if configuration is not None:
+            stdout.write('Error: a configuration is already loaded\n')
+        else:
+            configuration = command[1]
+            configurations += 1
+            if options.fail_after and configurations > options.fail_after:
+                break
+            master, slave = openpty()
+            ttys.append((master, slave))
+            stdout.write('[DUT] pseudo device opened: {}\n'.format(
+                ttyname(slave)))
+    elif command[0] == 'connect-real-network-port-in':
+        stdout.write('Host TCP port 4022 -> {}:22\n'.format(
+            command[-1].split('=')[-1]))
+    elif command[0] == 'delete-all-objects':
+        configuration = None
+    elif command[0] == 'run':
+        running = True
+        continue
+    if not running:
+        prompt()
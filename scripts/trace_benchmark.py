@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Measures the trace database lookups made for each cache injection on
+# generated golden run traces, scanning the load / store table, using its
+# indexes and, with --trace_index, using the NumPy trace index and, with
+# --columnar, the columnar trace
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from os import devnull, listdir, remove
+from os.path import abspath, dirname, exists, getsize, join
+from random import randint, randrange, random, seed
+from shutil import rmtree
+from sys import path
+from tempfile import gettempdir
+from time import perf_counter
+from types import SimpleNamespace
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from src import setup_django  # noqa: E402
+from src.arguments import parser as drseus_parser  # noqa: E402
+
+# the trace database module imports the campaign models, the campaign
+# database itself is not used
+setup_django(drseus_parser.parse_args(['--sqlite', 'log']))
+from src.sqlite_database import sqlite_database  # noqa: E402
+
+parser = ArgumentParser()
+parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000])
+parser.add_argument('--sets', type=int, default=2048)
+parser.add_argument('--ways', type=int, default=8)
+parser.add_argument('--lines', type=int, default=32768,
+                    help='cache lines accessed by the generated program')
+parser.add_argument('-n', '--injections', type=int, default=100)
+parser.add_argument('--scan_injections', type=int, default=3,
+                    help='injections measured before adding the indexes')
+parser.add_argument('--trace_index', action='store_true',
+                    help='also measure the NumPy trace index')
+parser.add_argument('--columnar', action='store_true',
+                    help='also measure the columnar trace')
+parser.add_argument('--directory', default=gettempdir())
+parser.add_argument('--keep', action='store_true',
+                    help='keep the generated databases')
+options = parser.parse_args()
+
+
+def generate(db, rows):
+    # loads and stores about three cycles apart, from 1024 instructions, to
+    # words in a fixed set of cache lines, with one in ten loads missing
+    def trace():
+        cycles = 0
+        for row in range(rows):
+            cycles += randint(1, 5)
+            address = 32*randrange(options.lines) + 4*randrange(8)
+            load0_store1 = int(random() < 0.3)
+            yield (cycles, 100 if not load0_store1 and random() < 0.1 else 14,
+                   0x00100000 + 4*randrange(1024), load0_store1, address,
+                   'STR' if load0_store1 else 'LDR',
+                   'str r3, [r2]' if load0_store1 else 'ldr r3, [r2]',
+                   (address >> 5) % options.sets)
+    db.store.connect().executemany(
+        'INSERT INTO {} ({}, {}, {}, {}, {}, {}, {}, {}) VALUES '
+        '(?, ?, ?, ?, ?, ?, ?, ?)'.format(
+            db.ldstr_inst_tbl, db.cycles_total_col, db.cycles_diff_col,
+            db.address_col, db.ldstr_col, db.ldstr_addr_col, db.inst_name_col,
+            db.finst_name_col, db.cache_set_col), trace())
+    db.store.commit()
+
+
+def injection(db):
+    # the lookups of the cache path of jtag.inject_faults
+    db.stored_cache_set = None
+    cycle = randint(db.get_start_cycle(), db.get_end_cycle())
+    cache_set = randrange(options.sets)
+    if db.trace_index is not None:
+        candidates = db.trace_index.previous_lines(cycle, cache_set,
+                                                   options.ways)
+    else:
+        candidates = []
+        current_cycle = cycle
+        while len(candidates) < options.ways:
+            current_cycle, address = db.PreviousLdrStr(current_cycle,
+                                                       cache_set)
+            if address is None:
+                break
+            if address not in candidates:
+                candidates.append(address)
+    if candidates:
+        targets = db.NextLdrStr(
+            cycle, cache_set, (candidates[randrange(len(candidates))] << 5) + 16)
+        if targets:
+            prev_cycle = targets[0][0]
+            db.SkipCount(0, prev_cycle, targets[0][1])
+            for target in targets:
+                db.SkipCount(prev_cycle, target[0], target[1])
+    db.get_next_load(cycle)
+
+
+def measure(db, injections):
+    queries = sum(count for count, latency in db.store.stats.values())
+    start = perf_counter()
+    with open(devnull, 'w') as null, redirect_stdout(null):
+        for i in range(injections):
+            injection(db)
+    return ((perf_counter() - start) / injections * 1000,
+            (sum(count for count, latency in db.store.stats.values()) -
+             queries) / injections)
+
+
+if options.trace_index:
+    from src.trace_index import load_trace_index
+if options.columnar:
+    from src.columnar_trace import load_columnar_trace
+
+print('{:>12}{:>12}{:>12}{:>12}{:>14}{:>12}{:>16}{:>14}{:>12}{:>12}'.format(
+    'rows', 'generate s', 'scan ms', 'index s', 'indexed ms', 'queries',
+    'trace index ms', 'columnar ms', 'sqlite MB', 'columnar MB'))
+for rows in options.rows:
+    seed(rows)
+    database = join(options.directory, 'trace-benchmark-{}.sqlite'.format(rows))
+    if exists(database):
+        remove(database)
+    with open(devnull, 'w') as null, redirect_stdout(null):
+        db = sqlite_database(SimpleNamespace(), database)
+    for index in db.indexes:
+        db.store.execute('schema', 'DROP INDEX {}'.format(index))
+    db.store.execute('schema', 'PRAGMA user_version = 0')
+    start = perf_counter()
+    generate(db, rows)
+    generate_time = perf_counter() - start
+    scan_time, queries = measure(db, options.scan_injections)
+    start = perf_counter()
+    with open(devnull, 'w') as null, redirect_stdout(null):
+        db.update_schema()
+    index_time = perf_counter() - start
+    indexed_time, queries = measure(db, options.injections)
+    trace_index_time = '-'
+    if options.trace_index:
+        with open(devnull, 'w') as null, redirect_stdout(null):
+            db.trace_index = load_trace_index(db)
+        trace_index_time = '{:.3f}'.format(
+            measure(db, options.injections)[0])
+    columnar_time = columnar_size = '-'
+    if options.columnar:
+        with open(devnull, 'w') as null, redirect_stdout(null):
+            columnar = load_columnar_trace(db)
+        db.trace_index = columnar
+        columnar_time = '{:.3f}'.format(measure(db, options.injections)[0])
+        columnar_size = '{:.1f}'.format(sum(
+            getsize(join(columnar.path, name))
+            for name in listdir(columnar.path)) / 1e6)
+    print('{:>12}{:>12.1f}{:>12.2f}{:>12.1f}{:>14.3f}{:>12.1f}{:>16}{:>14}'
+          '{:>12.1f}{:>12}'.format(
+              rows, generate_time, scan_time, index_time, indexed_time,
+              queries, trace_index_time, columnar_time,
+              getsize(database) / 1e6, columnar_size))
+    db.store.close()
+    if not options.keep:
+        remove(database)
+        if options.trace_index:
+            rmtree(join(options.directory, 'trace_index'))
+        if options.columnar:
+            rmtree(columnar.path)
@@ -19,8 +19,7 @@ from .arguments import get_options, parser
 # TODO: add support for injection of multi-bit upsets
 
 
-def run():
-    options = get_options()
+def setup_django(options):
     settings.configure(
         DATABASES={
             'default': {
@@ -58,9 +57,18 @@ def run():
         TIME_ZONE='UTC'
     )
     setup()
+
+
+def run():
+    options = get_options()
+    if options.command == 'agent':
+        options.db_postgresql = False
+        options.db_file = options.scratch_db
+    setup_django(options)
     # we can't (indirectly) import anything from log until django is setup
     from . import database
     from . import utilities
+    database.upgrade_database()
     missing_args = []
     campaign = None
     if options.command == 'power' and not options.power_switch_ip_address:
@@ -78,7 +86,8 @@ def run():
                 return
         if options.command != 'regenerate':
             options.architecture = campaign.architecture
-    if options.command in ('new', 'inject', 'supervise'):
+    if options.command in ('new', 'inject', 'supervise') and \
+            not (options.command == 'inject' and options.coordinator):
         if (hasattr(options, 'simics') and not options.simics) or \
                 (campaign and not campaign.simics):
             # not using simics
@@ -212,6 +212,20 @@ debugger_settings.add_argument(
     action='store_false',
     dest='smp',
     help='do not use SMP mode in openocd (only supported for ZedBoards')
+debugger_settings.add_argument(
+    '--tcl_rpc',
+    type=int,
+    nargs='?',
+    const=6666,
+    metavar='PORT',
+    help='send openocd commands over its TCL RPC port instead of telnet '
+         '[default PORT=6666]')
+debugger_settings.add_argument(
+    '--host_breakpoints',
+    action='store_false',
+    dest='hit_count_proc',
+    help='count breakpoint hits from DrSEUs instead of with an openocd '
+         'procedure (one round trip per hit)')
 
 database_settings = parser.add_argument_group('PostgreSQL settings')
 database_settings.add_argument(
@@ -291,6 +305,13 @@ power_settings.add_argument(
     dest='power_switch_password',
     default='chrec',
     help='password [default=chrec]')
+power_settings.add_argument(
+    '--power_cache',
+    type=float,
+    metavar='SECONDS',
+    dest='power_switch_cache',
+    default=2,
+    help='reuse outlet status for up to SECONDS [default=2]')
 
 subparsers = parser.add_subparsers(
     title='commands',
@@ -342,6 +363,11 @@ new_campaign.add_argument(
     metavar='FILE',
     default=[],
     help='file(s) to copy to device')
+new_campaign.add_argument(
+    '--no_cache',
+    action='store_true',
+    help='perform the gold run even if cached artifacts match the campaign '
+         'files and command, replacing the cached artifacts')
 new_campaign.add_argument(
     '-o', '--output_file',
     help='output file to retrieve from DUT')
@@ -419,6 +445,12 @@ inject.add_argument(
     '-n', '--iterations',
     type=int,
     help='number of iterations to perform [default=infinite]')
+inject.add_argument(
+    '--resume',
+    action='store_true',
+    help='continue unfinished iterations of the campaign, returning '
+         'iterations interrupted by a lost host to the queue (only use when '
+         'no other injections are running for the campaign)')
 inject.add_argument(
     '-i', '--injections',
     type=int,
@@ -462,6 +494,79 @@ inject.add_argument(
     default=1,
     help='number of injections to perform in parallel '
          '(only supported for ZedBoards and Simics)')
+inject.add_argument(
+    '--warm',
+    action='store_true',
+    help='skip the DUT reset after an iteration that returned with masked '
+         'faults and no errors or warnings')
+inject.add_argument(
+    '--force_reset',
+    type=int,
+    metavar='ITERATIONS',
+    default=10,
+    help='perform a full DUT reset after at most ITERATIONS warm restarts '
+         '[default=10]')
+inject.add_argument(
+    '--probe_memory',
+    nargs=2,
+    metavar=('ADDRESS', 'WORDS'),
+    help='before a warm restart, compare a checksum of WORDS words of DUT '
+         'memory at ADDRESS to the first clean iteration after a reset')
+inject.add_argument(
+    '--probe_registers',
+    nargs='+',
+    metavar='REGISTER',
+    help='before a warm restart, compare these DUT registers to the first '
+         'clean iteration after a reset')
+inject.add_argument(
+    '--probe_command',
+    metavar='COMMAND',
+    help='before a warm restart, run COMMAND on the DUT and compare its '
+         'output to the first clean iteration after a reset')
+inject.add_argument(
+    '--trace_index',
+    action='store_true',
+    help='answer cache injection lookups from memory mapped NumPy arrays '
+         'built once from the golden run trace instead of SQL queries')
+inject.add_argument(
+    '--columnar',
+    action='store_true',
+    help='read the golden run trace from its columnar copy (see the convert '
+         'command, written first if missing) instead of the SQLite '
+         'load/store table')
+inject.add_argument(
+    '--cache_model',
+    choices=['lru', 'round_robin', 'random'],
+    metavar='POLICY',
+    help='find the lines resident in an L2 cache set from a residency '
+         'timeline simulated once from the golden run trace with the '
+         'CACHE_L2 target geometry and replacement POLICY (lru, round_robin '
+         'or random)')
+inject.add_argument(
+    '--ace',
+    action='store_true',
+    help='inject the L2 cache only where the golden run reads the flipped '
+         'word before it is overwritten or evicted, recording the AVF of the '
+         'cache data as the weight of each injection (requires --cache_model '
+         'and CACHE_L2 as the only target)')
+inject.add_argument(
+    '--metrics_port',
+    type=int,
+    metavar='PORT',
+    help='serve campaign metrics in Prometheus text format on PORT')
+inject.add_argument(
+    '--coordinator',
+    type=int,
+    metavar='PORT',
+    help='lease iterations to agents connecting on PORT and store their '
+         'results instead of injecting locally')
+inject.add_argument(
+    '--lease_time',
+    type=float,
+    metavar='SECONDS',
+    default=300,
+    help='return an iteration to the queue if its agent does not renew the '
+         'lease for SECONDS [default=300]')
 inject_simics = inject.add_argument_group(
     'Simics campaigns',
     'Additional options for Simics campaigns only')
@@ -471,6 +576,35 @@ inject_simics.add_argument(
     help='monitor all checkpoints (only last by default), '
          'IMPORTANT: do NOT use with "-p" or "--processes" when using this '
          'option for the first time in a campaign')
+inject_simics.add_argument(
+    '--pool',
+    type=int,
+    metavar='WORKERS',
+    dest='simics_pool',
+    default=0,
+    help='keep WORKERS Simics processes launched ahead of time and reuse them '
+         'for injected checkpoints [default=0 (disabled)]')
+inject_simics.add_argument(
+    '--reuse',
+    type=int,
+    metavar='USES',
+    dest='simics_reuse',
+    default=10,
+    help='number of checkpoints a pooled Simics process reads before it is '
+         'replaced [default=10]')
+inject_simics.add_argument(
+    '--clear',
+    metavar='COMMAND',
+    dest='simics_clear',
+    default='delete-all-objects',
+    help='Simics command used to clear a pooled process before reuse, '
+         'processes are replaced if it fails [default=delete-all-objects]')
+inject_simics.add_argument(
+    '--simics_binary',
+    metavar='PATH',
+    help='Simics executable, e.g. '
+         'scripts/simics_stand_in.py for testing '
+         '[default=simics-workspace/simics]')
 inject_simics.add_argument(
     '-x', '--extract',
     action='store_true',
@@ -478,6 +612,119 @@ inject_simics.add_argument(
     help='extract diff memory blocks')
 inject.set_defaults(func='inject_campaign')
 
+plan = subparsers.add_parser(
+    'plan',
+    help='plan the injections of JTAG campaign iterations from the golden '
+         'run trace ahead of injecting',
+    description='plan the injections of JTAG campaign iterations from the '
+                'golden run trace ahead of injecting, planned iterations are '
+                'performed with "inject --resume"')
+plan.add_argument(
+    '-n', '--iterations',
+    type=int,
+    help='number of new iterations to plan '
+         '[default=replan the unfinished iterations]')
+plan.add_argument(
+    '-i', '--injections',
+    type=int,
+    dest='injections',
+    default=1,
+    help='number of injections per iteration [default=1]')
+plan.add_argument(
+    '-t', '--targets',
+    nargs='+',
+    metavar='TARGET',
+    dest='selected_targets',
+    help='selected targets for injection (case insensitive)')
+plan.add_argument(
+    '-T', '--target_index',
+    type=int,
+    nargs='+',
+    metavar='INDEX',
+    dest='selected_target_indices',
+    help='selected target indices/cores for injection')
+plan.add_argument(
+    '-r', '--registers',
+    nargs='+',
+    metavar='REGISTER',
+    dest='selected_registers',
+    help='selected registers for injection (case insensitive)')
+plan.add_argument(
+    '-p', '--processes',
+    type=int,
+    help='number of planning processes [default=number of CPUs]')
+plan.add_argument(
+    '--trace_index',
+    action='store_true',
+    help='answer trace lookups from the NumPy trace index')
+plan.add_argument(
+    '--columnar',
+    action='store_true',
+    help='read the golden run trace from its columnar copy')
+plan.add_argument(
+    '--cache_model',
+    choices=['lru', 'round_robin', 'random'],
+    metavar='POLICY',
+    help='find resident lines from a simulated residency timeline '
+         '(see inject)')
+plan.add_argument(
+    '--ace',
+    action='store_true',
+    help='only plan L2 cache injections the golden run reads (see inject)')
+plan.set_defaults(func='plan_campaign')
+
+agent = subparsers.add_parser(
+    'agent',
+    help='perform fault injections for a coordinator',
+    description='perform fault injections for a coordinator using the local '
+                'boards, results are kept in a scratch database until they '
+                'are sent to the coordinator (run from a different directory '
+                'than the coordinator when on the same host)')
+agent.add_argument(
+    dest='coordinator_address',
+    metavar='ADDRESS',
+    help='coordinator address')
+agent.add_argument(
+    dest='coordinator_port',
+    metavar='PORT',
+    type=int,
+    help='coordinator port')
+agent.add_argument(
+    '-d', '--debug',
+    action='store_true',
+    help='display device output and injection information')
+agent.add_argument(
+    '-p', '--processes',
+    type=int,
+    default=1,
+    help='number of local boards to use (only used for ZedBoards and '
+         'simulated boards)')
+agent.add_argument(
+    '--scratch_db',
+    metavar='FILE',
+    default='campaign-data/agent.sqlite',
+    help='local SQLite database for results in progress '
+         '[default=campaign-data/agent.sqlite]')
+agent.add_argument(
+    '--simulate',
+    action='store_true',
+    help='use simulated boards instead of DUTs')
+agent.add_argument(
+    '--simulate_delay',
+    type=float,
+    nargs=2,
+    metavar=('MIN', 'MAX'),
+    default=[0.5, 2],
+    help='seconds per simulated iteration [default=0.5 2]')
+agent.add_argument(
+    '--simulate_loss',
+    type=float,
+    metavar='PROBABILITY',
+    default=0,
+    help='probability of a simulated board exiting during an iteration, used '
+         'to test lease recovery [default=0]')
+agent.set_defaults(func='launch_agent')
+
 supervise = subparsers.add_parser(
     'supervise', aliases=['s'],
     help='run interactive supervisor',
@@ -606,6 +853,123 @@ regenerate.add_argument(
     help='result to regenerate')
 regenerate.set_defaults(func='regenerate')
 
+ingest = subparsers.add_parser(
+    'ingest',
+    help='load a golden run load/store trace into the campaign trace database',
+    description='load a golden run load/store trace into the campaign trace '
+                'database, one load/store per line')
+ingest.add_argument(
+    'source',
+    metavar='FILE',
+    nargs='?',
+    default='-',
+    help='trace file, "-" for standard input [default=-]')
+ingest.add_argument(
+    '--listen',
+    type=int,
+    metavar='PORT',
+    help='read the trace from the first connection to this TCP port instead')
+ingest.add_argument(
+    '--columns',
+    nargs='+',
+    metavar='COLUMN',
+    help='load/store table columns of each line '
+         '[default=all, in table order]')
+ingest.add_argument(
+    '--separator',
+    default='|',
+    help='field separator [default=|]')
+ingest.add_argument(
+    '--batch',
+    type=int,
+    metavar='ROWS',
+    default=100000,
+    dest='batch_size',
+    help='rows inserted at a time [default=100000]')
+ingest.add_argument(
+    '--replace',
+    action='store_true',
+    help='delete the existing trace first')
+ingest.set_defaults(func='ingest_trace')
+
+convert = subparsers.add_parser(
+    'convert',
+    help='convert the golden run trace between the SQLite load/store table '
+         'and the columnar trace format',
+    description='convert the golden run trace between the SQLite load/store '
+                'table and the columnar trace format')
+convert.add_argument(
+    'format',
+    choices=['columnar', 'sqlite'],
+    help='format to convert to')
+convert.add_argument(
+    '--drop',
+    action='store_true',
+    help='delete the load/store table rows after converting to columnar '
+         '(use with "inject --columnar")')
+convert.set_defaults(func='convert_trace')
+
+inspect = subparsers.add_parser(
+    'inspect',
+    help='print or export rows of the campaign trace database',
+    description='print or export rows of the campaign trace database, '
+                'streaming them from a read-only connection (safe while a '
+                'campaign is injecting from it)')
+inspect.add_argument(
+    'table',
+    metavar='TABLE',
+    nargs='?',
+    default='ls_inst',
+    help='trace database table [default=ls_inst]')
+inspect.add_argument(
+    '--columns',
+    nargs='+',
+    metavar='COLUMN',
+    help='columns to output [default=all]')
+inspect.add_argument(
+    '--cycles',
+    type=int,
+    nargs=2,
+    metavar=('START', 'END'),
+    help='only load/stores between these cycle counts (inclusive)')
+inspect.add_argument(
+    '--set',
+    type=int,
+    metavar='SET',
+    help='only load/stores to this L2 cache set')
+inspect.add_argument(
+    '--address',
+    type=lambda address: int(address, 0),
+    metavar='ADDRESS',
+    help='only load/stores of the instruction at this address')
+inspect.add_argument(
+    '--ldstr_addr',
+    type=lambda address: int(address, 0),
+    metavar='ADDRESS',
+    help='only load/stores to this address')
+inspect.add_argument(
+    '--limit',
+    type=int,
+    metavar='ROWS',
+    help='output at most this many rows')
+inspect.add_argument(
+    '--offset',
+    type=int,
+    metavar='ROWS',
+    default=0,
+    help='skip this many rows first, with --limit to page through a table '
+         '[default=0]')
+inspect.add_argument(
+    '--format',
+    choices=['table', 'csv', 'jsonl'],
+    default='table',
+    help='output format [default=table]')
+inspect.add_argument(
+    '-o', '--output',
+    metavar='FILE',
+    help='write to this file instead of standard output')
+inspect.set_defaults(func='inspect_trace')
+
 update = subparsers.add_parser(
     'update', aliases=['u'],
     help='update gold checkpoint dependency paths '
@@ -657,6 +1021,10 @@ clean.add_argument(
     '-p', '--power_log',
     action='store_true',
     help='delete power switch log')
+clean.add_argument(
+    '-g', '--gold_cache',
+    action='store_true',
+    help='delete cached gold run artifacts')
 clean.add_argument(
     '-a', '--all',
     action='store_true',
@@ -0,0 +1,111 @@
+from random import Random
+
+# Replacement policies, the PL310 L2 cache controller supports round robin and
+#   pseudo-random
+policies = ['lru', 'round_robin', 'random']
+# Loads slower than this many cycles came from backing memory, as in
+#   sqlite_database.NextLdrStr
+miss_latency = 30
+
+
+# Set associative cache fed with the loads / stores of the golden run in cycle
+#   order. Every access allocates. Produces the residency timeline of the
+#   cache: one (set, way, line, fill_cycle, evict_cycle) row per line filled,
+#   where line is the address without the byte offset and evict_cycle is None
+#   for lines still resident at the end of the trace.
+class cache_simulator(object):
+    def __init__(self, sets, ways, line_size, policy='lru', seed=0):
+        if policy not in policies:
+            raise Exception('invalid cache replacement policy: {}'.format(
+                policy))
+        self.sets = sets
+        self.ways = ways
+        self.line_size = line_size
+        self.policy = policy
+        self.random = Random(seed)
+        self.lines = [[None] * ways for cache_set in range(sets)]
+        self.fills = [[None] * ways for cache_set in range(sets)]
+        # Last use of each way for LRU, next victim of each set for round robin
+        self.used = [[0] * ways for cache_set in range(sets)]
+        self.victims = [0] * sets
+        self.accesses = 0
+        self.misses = 0
+
+    def victim(self, cache_set):
+        lines = self.lines[cache_set]
+        if None in lines:
+            return lines.index(None)
+        if self.policy == 'lru':
+            used = self.used[cache_set]
+            return used.index(min(used))
+        elif self.policy == 'round_robin':
+            way = self.victims[cache_set]
+            self.victims[cache_set] = (way + 1) % self.ways
+            return way
+        else:
+            return self.random.randrange(self.ways)
+
+    # Returns the residency row of the line evicted by this access, if any
+    def access(self, cycle, address):
+        self.accesses += 1
+        line = address // self.line_size
+        cache_set = line % self.sets
+        lines = self.lines[cache_set]
+        evicted = None
+        if line in lines:
+            way = lines.index(line)
+        else:
+            self.misses += 1
+            way = self.victim(cache_set)
+            if lines[way] is not None:
+                evicted = (cache_set, way, lines[way],
+                           self.fills[cache_set][way], cycle)
+            lines[way] = line
+            self.fills[cache_set][way] = cycle
+        self.used[cache_set][way] = self.accesses
+        return evicted
+
+    # accesses are (cycle, address) in cycle order, yields the residency
+    #   timeline
+    def run(self, accesses):
+        for cycle, address in accesses:
+            evicted = self.access(cycle, address)
+            if evicted is not None:
+                yield evicted
+        for cache_set in range(self.sets):
+            for way in range(self.ways):
+                if self.lines[cache_set][way] is not None:
+                    yield (cache_set, way, self.lines[cache_set][way],
+                           self.fills[cache_set][way], None)
+
+    # accesses are (cycle, address, load0_store1, latency) in cycle order.
+    #   Yields (set, way, word, start_cycle, end_cycle) for each interval in
+    #   which a bit flipped in a 4 byte word of the cache is read by a load
+    #   served from the cache before being overwritten or evicted (ACE), i.e.
+    #   the flip happens at or after start_cycle and before end_cycle. Only
+    #   loads of the word address are reads, as sqlite_database.NextLdrStr
+    #   follows the load / store address exactly (other loads of the word leave
+    #   the flip unread, any store overwrites it). Run on a new simulator.
+    def run_ace(self, accesses):
+        words = self.line_size // 4
+        # Cycle from which a flip in each word of each way is read by the next
+        #   access
+        flips = [[None] * self.ways for cache_set in range(self.sets)]
+        for cycle, address, load0_store1, latency in accesses:
+            line = address // self.line_size
+            cache_set = line % self.sets
+            word = (address % self.line_size) // 4
+            hit = line in self.lines[cache_set]
+            self.access(cycle, address)
+            way = self.lines[cache_set].index(line)
+            if not hit:
+                # The access filling the line reads memory, not the cache
+                flips[cache_set][way] = [cycle + 1] * words
+                continue
+            if not load0_store1 and address % 4:
+                continue
+            start = flips[cache_set][way][word]
+            if not load0_store1 and (latency or 0) <= miss_latency and \
+                    cycle > start:
+                yield (cache_set, way, word, start, cycle)
+            flips[cache_set][way][word] = max(start, cycle)
@@ -0,0 +1,446 @@
+from json import dump, load
+from os import listdir, makedirs, rename
+from os.path import dirname, exists, getsize, join
+from shutil import rmtree
+from termcolor import colored
+from time import perf_counter
+
+import numpy as np
+
+from .cache_simulator import miss_latency
+from .trace_index import get_trace_version
+
+# The load / store table of the golden run stored by column in a directory of
+#   .npy files, memory mapped when read, in place of (or next to) the SQLite
+#   table:
+#
+# cycles:       cycles_t in cycle order as varint (LEB128) deltas, restarting
+#               each chunk_size rows, with cycles_base the first cycle and
+#               cycles_offsets the first byte of each chunk
+# instructions: address, instruction and full_inst, dictionary encoded,
+#               inst_ids the entry of each row and the entries kept in
+#               info.json
+# others:       each in the narrowest integer type holding it, with NULLs
+#               marked in <column>_null (packed bits), columns that are always
+#               NULL (e.g. unused PMU counters) are left out
+# executions:   exec_flags (packed bits) marks the first row of each execution
+#               of an instruction, exec_ids / exec_counts the executions of
+#               each entry in each chunk, by exec_offsets
+chunk_size = 65536
+
+
+def get_columnar_trace_path(sqlite_database):
+    return join(dirname(sqlite_database.database), 'columnar_trace')
+
+
+def narrow(values):
+    for dtype in (np.uint8, np.int8, np.uint16, np.int16, np.uint32,
+                  np.int32):
+        if not len(values) or (values.min() >= np.iinfo(dtype).min and
+                               values.max() <= np.iinfo(dtype).max):
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+# Returns the bytes of the varints and the offset of each one (and of the end)
+def encode_varints(values):
+    values = values.astype(np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= np.uint64(1 << shift)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    data = np.zeros(offsets[-1], dtype=np.uint8)
+    for byte in range(int(lengths.max()) if len(values) else 0):
+        rows = np.flatnonzero(lengths > byte)
+        data[offsets[rows] + byte] = \
+            ((values[rows] >> np.uint64(7 * byte)) & np.uint64(0x7f)) | \
+            np.where(lengths[rows] > byte + 1, np.uint64(0x80), np.uint64(0))
+    return data, offsets
+
+
+def decode_varints(data):
+    data = np.asarray(data)
+    if not len(data):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    values = (data & 0x7f).astype(np.uint64) << \
+        (7 * shifts).astype(np.uint64)
+    return np.bitwise_or.reduceat(values, starts).astype(np.int64)
+
+
+# Which ids are one of the dictionary entries, usually just one
+def matches(ids, entries):
+    ids = np.asarray(ids)
+    return ids == entries[0] if len(entries) == 1 else np.isin(ids, entries)
+
+
+def write_columnar_trace(sqlite_database):
+    print(colored("Writing columnar trace...", 'yellow'))
+    start = perf_counter()
+    db = sqlite_database
+    version = get_trace_version(db)
+    columns = [name for name, type_ in db.get_ldstr_columns()]
+    text = [db.address_col, db.inst_name_col, db.finst_name_col]
+    integer = [name for name in columns
+               if name not in text and name != db.cycles_total_col]
+    counts = db.store.query_one(
+        "columnar_trace",
+        "SELECT COUNT(*), {} FROM {} WHERE {} IS NOT NULL".format(
+            ", ".join("COUNT({})".format(name) for name in integer),
+            db.ldstr_inst_tbl, db.cycles_total_col))
+    rows = counts[0]
+    stored = [name for name, count in zip(integer, counts[1:]) if count]
+    nullable = [name for name, count in zip(integer, counts[1:])
+                if count and count < rows]
+    select = [db.cycles_total_col] + \
+        ["IFNULL({}, 0)".format(name) for name in stored] + \
+        ["{} IS NULL".format(name) for name in nullable]
+    cursor = db.store.execute(
+        "columnar_trace",
+        "SELECT {}, {} FROM {} WHERE {} IS NOT NULL "
+        "ORDER BY {}, rowid".format(
+            ", ".join(select), ", ".join(text), db.ldstr_inst_tbl,
+            db.cycles_total_col, db.cycles_total_col))
+    chunks = []
+    ids = []
+    entries = {}
+    while True:
+        batch = cursor.fetchmany(chunk_size)
+        if not batch:
+            break
+        chunks.append(np.array([row[:len(select)] for row in batch],
+                               dtype=np.int64))
+        ids.append(np.array(
+            [entries.setdefault(row[len(select):], len(entries))
+             for row in batch], dtype=np.int64))
+    if chunks:
+        trace = np.concatenate(chunks)
+        inst_ids = np.concatenate(ids)
+    else:
+        trace = np.zeros((0, len(select)), dtype=np.int64)
+        inst_ids = np.zeros(0, dtype=np.int64)
+    entries = sorted(entries, key=entries.get)
+    arrays = {}
+
+    cycles = trace[:, 0]
+    deltas = np.diff(cycles, prepend=cycles[:1])
+    deltas[::chunk_size] = 0
+    arrays['cycles_data'], offsets = encode_varints(deltas)
+    arrays['cycles_base'] = cycles[::chunk_size]
+    arrays['cycles_offsets'] = np.append(offsets[:-1][::chunk_size],
+                                         offsets[-1])
+    for i, name in enumerate(stored, 1):
+        arrays[name] = narrow(trace[:, i])
+    for i, name in enumerate(nullable, len(stored) + 1):
+        arrays[name + '_null'] = np.packbits(trace[:, i].astype(bool))
+    arrays['inst_ids'] = narrow(inst_ids)
+
+    # A multi access instruction has a row for each access but is executed
+    #   once
+    pcs = np.array([-1 if entry[0] is None else entry[0]
+                    for entry in entries], dtype=np.int64)[inst_ids]
+    flags = np.ones(rows, dtype=bool)
+    flags[1:] = (cycles[1:] != cycles[:-1]) | (pcs[1:] != pcs[:-1])
+    arrays['exec_flags'] = np.packbits(flags)
+    exec_ids = [np.zeros(0, dtype=np.int64)]
+    exec_counts = [np.zeros(0, dtype=np.int64)]
+    exec_offsets = [0]
+    for first in range(0, rows, chunk_size):
+        last = first + chunk_size
+        executed, count = np.unique(inst_ids[first:last][flags[first:last]],
+                                    return_counts=True)
+        exec_ids.append(executed)
+        exec_counts.append(count)
+        exec_offsets.append(exec_offsets[-1] + len(executed))
+    arrays['exec_ids'] = narrow(np.concatenate(exec_ids))
+    arrays['exec_counts'] = narrow(np.concatenate(exec_counts))
+    arrays['exec_offsets'] = np.array(exec_offsets, dtype=np.int64)
+
+    info = {'version': version, 'rows': rows, 'chunk_size': chunk_size,
+            'columns': columns,
+            'start_cycle': int(cycles.min()) if rows else 0,
+            'end_cycle': int(cycles.max()) if rows else 0,
+            'names': {'cycles': db.cycles_total_col,
+                      'latency': db.cycles_diff_col, 'ldstr': db.ldstr_col,
+                      'ldstr_addr': db.ldstr_addr_col,
+                      'set': db.cache_set_col, 'text': text},
+            'entries': entries}
+
+    # Written next to the final location and then renamed, so a partial trace
+    #   is never loaded
+    path = get_columnar_trace_path(db)
+    if exists(path + '.tmp'):
+        rmtree(path + '.tmp')
+    makedirs(path + '.tmp')
+    for name, array in arrays.items():
+        np.save(join(path + '.tmp', name + '.npy'), array)
+    with open(join(path + '.tmp', 'info.json'), 'w') as info_file:
+        dump(info, info_file)
+    if exists(path):
+        rmtree(path)
+    rename(path + '.tmp', path)
+    size = sum(getsize(join(path, name)) for name in listdir(path))
+    print(colored("\t{} rows in {:.1f} MB ({:.1f} MB SQLite database) in "
+                  "{:.1f} seconds".format(
+                      rows, size / 1e6, getsize(db.database) / 1e6,
+                      perf_counter() - start), 'yellow'))
+
+
+# Return the columnar trace of the database, writing it first when it is
+#   missing or older than the load / store table unless the database is open
+#   read-only, in which case None is returned. A columnar trace is kept when
+#   the load / store table has been emptied
+def load_columnar_trace(sqlite_database):
+    path = get_columnar_trace_path(sqlite_database)
+    current = False
+    if exists(join(path, 'info.json')):
+        with open(join(path, 'info.json')) as info_file:
+            version = load(info_file)['version']
+        current = get_trace_version(sqlite_database)
+        current = current == version or current[1:] == [0, 0]
+    if not current:
+        if sqlite_database.store.read_only:
+            print(colored("Columnar trace is missing or out of date, using "
+                          "SQL queries", 'red'))
+            return None
+        write_columnar_trace(sqlite_database)
+    return columnar_trace(path)
+
+
+# Answers the lookups of trace_index.trace_index from the columnar trace,
+#   decoding only the chunks of cycles it needs
+class columnar_trace(object):
+    def __init__(self, path):
+        self.path = path
+        with open(join(path, 'info.json')) as info_file:
+            info = load(info_file)
+        self.rows = info['rows']
+        self.chunk_size = info['chunk_size']
+        self.columns = info['columns']
+        self.start_cycle = info['start_cycle']
+        self.end_cycle = info['end_cycle']
+        self.names = info['names']
+        self.entries = [tuple(entry) for entry in info['entries']]
+        self.entry_addresses = np.array(
+            [-1 if entry[0] is None else entry[0] for entry in self.entries],
+            dtype=np.int64)
+        self.arrays = {}
+        for name in listdir(path):
+            if name.endswith('.npy'):
+                # Empty arrays can not be memory mapped
+                self.arrays[name[:-4]] = np.load(
+                    join(path, name), mmap_mode='r' if self.rows else None)
+        self.decoded = {}
+
+    def chunk_cycles(self, chunk):
+        if chunk not in self.decoded:
+            if len(self.decoded) >= 16:
+                self.decoded.clear()
+            offsets = self.arrays['cycles_offsets']
+            self.decoded[chunk] = \
+                int(self.arrays['cycles_base'][chunk]) + np.cumsum(
+                    decode_varints(self.arrays['cycles_data'][
+                        offsets[chunk]:offsets[chunk + 1]]))
+        return self.decoded[chunk]
+
+    def cycles(self, first, last):
+        if last <= first:
+            return np.zeros(0, dtype=np.int64)
+        chunks = range(first // self.chunk_size,
+                       (last - 1) // self.chunk_size + 1)
+        cycles = np.concatenate([self.chunk_cycles(chunk)
+                                 for chunk in chunks])
+        offset = chunks[0] * self.chunk_size
+        return cycles[first - offset:last - offset]
+
+    def bits(self, name, first, last):
+        bits = np.unpackbits(self.arrays[name][first // 8:(last + 7) // 8])
+        return bits[first % 8:first % 8 + last - first].astype(bool)
+
+    def bits_at(self, name, rows):
+        return ((np.asarray(self.arrays[name][rows >> 3]) >>
+                 (7 - (rows & 7))) & 1).astype(bool)
+
+    # Values of an integer column for rows first to last (0 for NULL) and
+    #   which are not NULL
+    def column(self, name, first, last):
+        if name not in self.arrays:
+            return (np.zeros(last - first, dtype=np.int64),
+                    np.zeros(last - first, dtype=bool))
+        values = np.asarray(self.arrays[name][first:last]).astype(np.int64)
+        if name + '_null' not in self.arrays:
+            return values, np.ones(last - first, dtype=bool)
+        return values, ~self.bits(name + '_null', first, last)
+
+    # Values of an integer column at rows (0 for NULL)
+    def values(self, name, rows):
+        if name not in self.arrays:
+            return np.zeros(len(rows), dtype=np.int64)
+        return np.asarray(self.arrays[name][rows]).astype(np.int64)
+
+    # Rows from first to last where an integer column equals value, compared
+    #   in the stored type
+    def find(self, name, value, first, last):
+        if name not in self.arrays:
+            return np.zeros(0, dtype=np.int64)
+        rows = first + np.flatnonzero(
+            np.asarray(self.arrays[name][first:last]) == value)
+        if name + '_null' in self.arrays:
+            rows = rows[~self.bits_at(name + '_null', rows)]
+        return rows
+
+    # First row with cycles at or after (left) or after (right) cycle
+    def position(self, cycle, side):
+        chunk = int(np.searchsorted(self.arrays['cycles_base'], cycle,
+                                    side)) - 1
+        if chunk < 0:
+            return 0
+        return chunk * self.chunk_size + \
+            int(np.searchsorted(self.chunk_cycles(chunk), cycle, side))
+
+    # Line addresses of the last count distinct lines accessed in cache_set
+    #   before cycle, most recent first
+    def previous_lines(self, cycle, cache_set, count):
+        end = self.position(cycle, 'left')
+        lines = []
+        window = self.chunk_size
+        while end > 0 and len(lines) < count:
+            begin = max(0, end - window)
+            rows = self.find(self.names['set'], cache_set, begin, end)
+            if self.names['ldstr_addr'] + '_null' in self.arrays:
+                rows = rows[~self.bits_at(self.names['ldstr_addr'] + '_null',
+                                          rows)]
+            # Most recent first, and the lines of a multi access instruction
+            #   by descending address like sqlite_database.PreviousLdrStr, 32
+            #   bytes to a line
+            addresses = self.values(self.names['ldstr_addr'], rows)
+            order = np.lexsort(
+                (addresses, self.cycles(begin, end)[rows - begin]))[::-1]
+            recent = addresses[order] >> 5
+            for line in recent[np.sort(
+                    np.unique(recent, return_index=True)[1])]:
+                if int(line) not in lines:
+                    lines.append(int(line))
+                    if len(lines) == count:
+                        break
+            end = begin
+            window *= 2
+        return lines
+
+    # Accesses to address in cache_set after cycle, up to the first store or
+    #   load from backing memory, as [cycles, pc]
+    def next_accesses(self, cycle, cache_set, address):
+        first = self.position(cycle, 'right')
+        targets = []
+        window = self.chunk_size
+        while first < self.rows:
+            last = min(self.rows, first + window)
+            rows = self.find(self.names['ldstr_addr'], address, first, last)
+            rows = rows[self.values(self.names['set'], rows) == cache_set]
+            if self.names['set'] + '_null' in self.arrays:
+                rows = rows[~self.bits_at(self.names['set'] + '_null', rows)]
+            if len(rows):
+                stops = np.flatnonzero(
+                    (self.values(self.names['ldstr'], rows) == 1) |
+                    (self.values(self.names['latency'], rows) > miss_latency))
+                if len(stops):
+                    rows = rows[:stops[0]]
+                cycles = self.cycles(first, last)[rows - first]
+                pcs = self.entry_addresses[
+                    np.asarray(self.arrays['inst_ids'][rows])]
+                targets.extend([int(cycles), int(pc)]
+                               for cycles, pc in zip(cycles, pcs))
+                if len(stops):
+                    break
+            first = last
+            window *= 2
+        return targets
+
+    def count_rows(self, first, last, entries):
+        if last <= first:
+            return 0
+        rows = first + np.flatnonzero(
+            matches(self.arrays['inst_ids'][first:last], entries))
+        return int(np.count_nonzero(self.bits_at('exec_flags', rows)))
+
+    # Executions of the instruction at pc between the two cycles, exclusive,
+    #   counted from the executions of each chunk except in the chunks the
+    #   range starts and ends in
+    def count_executions(self, start_cycle, end_cycle, pc):
+        entries = np.flatnonzero(self.entry_addresses == pc)
+        first = self.position(start_cycle, 'right')
+        last = self.position(end_cycle, 'left')
+        if last <= first or not len(entries):
+            return 0
+        first_chunk = -(-first // self.chunk_size)
+        last_chunk = last // self.chunk_size
+        if first_chunk >= last_chunk:
+            return self.count_rows(first, last, entries)
+        offsets = self.arrays['exec_offsets']
+        executions = slice(offsets[first_chunk], offsets[last_chunk])
+        ids = np.asarray(self.arrays['exec_ids'][executions])
+        counts = np.asarray(self.arrays['exec_counts'][executions])
+        return int(counts[matches(ids, entries)].sum()) + \
+            self.count_rows(first, first_chunk * self.chunk_size, entries) + \
+            self.count_rows(last_chunk * self.chunk_size, last, entries)
+
+    # Address of the first load after cycle, or None
+    def next_load(self, cycle):
+        first = self.position(cycle, 'right')
+        window = self.chunk_size
+        while first < self.rows:
+            last = min(self.rows, first + window)
+            rows = self.find(self.names['ldstr'], 0, first, last)
+            if len(rows):
+                return self.entries[int(self.arrays['inst_ids'][rows[0]])][0]
+            first = last
+            window *= 2
+        return None
+
+    # Address and full_inst of every instruction that loads
+    def load_instructions(self):
+        loaded = set()
+        for first in range(0, self.rows, self.chunk_size):
+            last = min(self.rows, first + self.chunk_size)
+            loads, valid = self.column(self.names['ldstr'], first, last)
+            inst_ids = np.asarray(self.arrays['inst_ids'][first:last])
+            loaded.update(
+                np.unique(inst_ids[(loads == 0) & valid]).tolist())
+        return [(self.entries[entry][0], self.entries[entry][2])
+                for entry in sorted(loaded)]
+
+    # (cycles, load / store address, load0_store1, latency) of each access in
+    #   cycle order, as read by the cache simulator
+    def accesses(self):
+        for first in range(0, self.rows, self.chunk_size):
+            last = min(self.rows, first + self.chunk_size)
+            addresses, valid = self.column(self.names['ldstr_addr'], first,
+                                           last)
+            loads = self.column(self.names['ldstr'], first, last)[0]
+            latency = self.column(self.names['latency'], first, last)[0]
+            yield from zip(self.cycles(first, last)[valid].tolist(),
+                           addresses[valid].tolist(),
+                           loads[valid].tolist(), latency[valid].tolist())
+
+    # Rows of the load / store table, for the columns
+    def records(self):
+        text = self.names['text']
+        for first in range(0, self.rows, self.chunk_size):
+            last = min(self.rows, first + self.chunk_size)
+            entries = [self.entries[entry] for entry in
+                       np.asarray(self.arrays['inst_ids'][first:last]).tolist()]
+            values = []
+            for name in self.columns:
+                if name == self.names['cycles']:
+                    values.append(self.cycles(first, last).tolist())
+                elif name in text:
+                    values.append([entry[text.index(name)]
+                                   for entry in entries])
+                else:
+                    column, valid = self.column(name, first, last)
+                    values.append([value if not_null else None
+                                   for value, not_null in
+                                   zip(column.tolist(), valid.tolist())])
+            yield from zip(*values)
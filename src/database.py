@@ -1,18 +1,28 @@
+from atexit import register
 from datetime import datetime
 from django.core.management import execute_from_command_line as django_command
+from django.db import connection
+from django.db.models import Max
 from django.db.utils import OperationalError, ProgrammingError
 from getpass import getuser
 from io import StringIO
-from os import mkdir, remove
+from os import getpid, mkdir, remove
 from os.path import exists
 from paramiko import RSAKey
+from random import SystemRandom
 from subprocess import check_output, DEVNULL, PIPE, Popen
 from sys import argv
 from sys import stdout as sys_stdout
 from termcolor import colored
+from threading import Lock, Thread
+from time import sleep
 from traceback import format_exc, format_stack, print_exc
 
 from .log.models import campaign as campaign_model
+from .log.models import injection as injection_model
+from .log.models import iteration as iteration_model
+from .log.models import timing as timing_model
+from .timing import phase_timer
 
 
 def initialize_database(options):
@@ -29,9 +39,39 @@ def initialize_database(options):
                                                       options.db_user))
         __psql(options, superuser=True, commands=commands)
         django_command([argv[0], 'makemigrations', 'log'])
-    elif not exists('campaign-data'):
-        mkdir('campaign-data')
-    django_command([argv[0], 'migrate'])
+        django_command([argv[0], 'migrate'])
+    else:
+        if not exists('campaign-data'):
+            mkdir('campaign-data')
+        # the log app has no migrations, so its tables are created directly
+        django_command([argv[0], 'migrate', '--run-syncdb'])
+
+
+def upgrade_database():
+    # the log app has no migrations (they are only made when the database is
+    # created), so the tables and columns added since are created here for
+    # campaign databases made before them
+    try:
+        tables = connection.introspection.table_names()
+    except (OperationalError, ProgrammingError):
+        return
+    if campaign_model._meta.db_table not in tables:
+        return
+    with connection.cursor() as cursor:
+        columns = [column.name for column in
+                   connection.introspection.get_table_description(
+                       cursor, injection_model._meta.db_table)]
+    with connection.schema_editor() as editor:
+        for model in (iteration_model, timing_model):
+            if model._meta.db_table not in tables:
+                print(colored('adding {} table to campaign database'.format(
+                    model._meta.db_table), 'yellow'))
+                editor.create_model(model)
+        if 'weight' not in columns:
+            print(colored('adding weight column to {} table'.format(
+                injection_model._meta.db_table), 'yellow'))
+            editor.add_field(injection_model,
+                             injection_model._meta.get_field('weight'))
 
 
 def get_campaign(options):
@@ -87,6 +127,42 @@ def new_campaign(options):
     return campaign
 
 
+def plan_iterations(campaign, iterations):
+    first = (campaign.iteration_set.aggregate(
+        Max('number'))['number__max'] or 0) + 1
+    random = SystemRandom()
+    iteration_model.objects.bulk_create([
+        iteration_model(campaign=campaign, number=number,
+                        seed=random.getrandbits(63))
+        for number in range(first, first+iterations)])
+    return first
+
+
+def recover_iterations(campaign):
+    # iterations left assigned by a host that died are returned to the queue
+    # with their original seeds, their partial results are marked as abandoned
+    recovered = 0
+    for iteration in campaign.iteration_set.filter(
+            status='assigned').select_related('result'):
+        if iteration.result is not None and \
+                iteration.result.outcome == 'In progress':
+            iteration.result.outcome_category = 'Incomplete'
+            iteration.result.outcome = 'Abandoned'
+            iteration.result.save()
+        iteration.status = 'planned'
+        iteration.assigned = None
+        iteration.dut_serial_port = None
+        iteration.result = None
+        iteration.save()
+        recovered += 1
+    return recovered
+
+
+def get_iteration_progress(campaign):
+    return {status: campaign.iteration_set.filter(status=status).count()
+            for status in ('planned', 'assigned', 'completed')}
+
+
 def __psql(options, executable='psql', superuser=False, database=False,
            args=[], commands=[], stdin=None, stdout=None):
         if commands and stdin is not None:
@@ -179,6 +255,16 @@ class database(object):
     def __init__(self, options):
         self.options = options
         self.campaign = get_campaign(options)
+        self.iteration = None
+        self.phases = phase_timer()
+        self.output_lock = Lock()
+        self.output_write_lock = Lock()
+        self.output_dirty = {}
+        self.output_writer = None
+        if hasattr(options, 'metrics'):
+            self.metrics = options.metrics
+        else:
+            self.metrics = None
         if options.command == 'new':
             self.result = None
         else:
@@ -211,10 +297,95 @@ class database(object):
                                               99.990))
             print(colored(out, 'blue'))
         self.result.timestamp = datetime.now()
-        self.result.save()
+        with self.phases.span('database'):
+            self.flush_debugger_output()
+            self.result.save()
+        if self.metrics is not None:
+            self.metrics.add('database_writes')
+            if self.iteration is not None:
+                self.metrics.log_result(self.result.outcome_category,
+                                        self.phases.times)
+        timing_model.objects.update_or_create(result=self.result,
+                                              defaults=self.phases.times)
+        self.phases.clear()
+        if self.iteration is not None:
+            if self.result.outcome_category == 'Incomplete':
+                self.iteration.status = 'planned'
+                self.iteration.assigned = None
+                self.iteration.result = None
+            else:
+                self.iteration.status = 'completed'
+                self.iteration.completed = self.result.timestamp
+            self.iteration.save()
+            self.iteration = None
         if not exit:
             self.__create_result(supervisor)
 
+    def claim_iteration(self, first=1):
+        while True:
+            iteration = self.campaign.iteration_set.filter(
+                status='planned', number__gte=first).order_by('number').first()
+            if iteration is None:
+                return None
+            # only one process can move an iteration out of the planned state
+            if iteration_model.objects.filter(
+                    id=iteration.id, status='planned').update(
+                        status='assigned', assigned=datetime.now(),
+                        dut_serial_port=self.options.dut_serial_port,
+                        result=self.result):
+                iteration.refresh_from_db()
+                self.iteration = iteration
+                return iteration
+
+    def create_iteration(self):
+        first = plan_iterations(self.campaign, 1)
+        return self.claim_iteration(first)
+
+    def log_debugger_output(self, buff):
+        # debugger output is kept in memory and written behind by a background
+        # thread instead of saving the whole row after every debugger command
+        model = self.campaign if self.result is None else self.result
+        with self.output_lock:
+            model.debugger_output += buff
+            self.output_dirty[(type(model), model.id)] = model
+        if self.output_writer != getpid():
+            self.output_writer = getpid()
+            Thread(target=self.__write_debugger_output, daemon=True).start()
+            register(self.flush_debugger_output)
+
+    def __write_debugger_output(self):
+        warned = False
+        while True:
+            sleep(1)
+            try:
+                self.flush_debugger_output()
+            except Exception as error:
+                # the output stays queued and is written by a later flush
+                if not warned:
+                    print(colored('error writing debugger output (will retry): '
+                                  '{}'.format(error), 'red'))
+                    warned = True
+
+    def flush_debugger_output(self):
+        # writes are serialized so a later write always has newer output
+        with self.output_write_lock:
+            with self.output_lock:
+                dirty = self.output_dirty
+                self.output_dirty = {}
+                outputs = [(model_type, id_, model.debugger_output)
+                           for (model_type, id_), model in dirty.items()]
+            for model_type, id_, output in outputs:
+                try:
+                    model_type.objects.filter(id=id_).update(
+                        debugger_output=output)
+                except Exception:
+                    with self.output_lock:
+                        for key, model in dirty.items():
+                            self.output_dirty.setdefault(key, model)
+                    raise
+            if outputs and self.metrics is not None:
+                self.metrics.add('database_writes', len(outputs))
+
     def log_event(self, level, source, type_, description=None,
                   success=None, campaign=False):
         if description == self.log_trace:
@@ -222,10 +393,14 @@ class database(object):
         elif description == self.log_exception:
             description = ''.join(format_exc())
         campaign = campaign or self.result is None
-        event = (self.campaign if campaign else self.result).event_set.create(
-            description=description,
-            type=type_,
-            level=level,
-            source=source,
-            success=success)
+        with self.phases.span('database'):
+            event = (self.campaign if campaign
+                     else self.result).event_set.create(
+                description=description,
+                type=type_,
+                level=level,
+                source=source,
+                success=success)
+        if self.metrics is not None:
+            self.metrics.add('database_writes')
         return event
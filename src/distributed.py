@@ -0,0 +1,481 @@
+from base64 import b64decode, b64encode
+from copy import copy
+from datetime import datetime, timedelta
+from django.db import connection as django_connection
+from django.db.utils import OperationalError
+from json import dumps, loads
+from multiprocessing import Process
+from os import _exit, makedirs, walk
+from os.path import dirname, exists, isabs, join, normpath, relpath, sep
+from random import Random, randrange, random, seed, uniform
+from socket import create_connection, gethostname
+from shutil import copyfileobj
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from tarfile import open as open_tar
+from tempfile import TemporaryFile
+from termcolor import colored
+from threading import Lock, Thread
+from time import sleep
+
+from .database import (database, get_campaign, get_iteration_progress,
+                       initialize_database, plan_iterations)
+from .fault_injector import fault_injector
+from .jtag import find_zedboard_uart_serials
+from .log.models import campaign as campaign_model
+from .log.models import timing as timing_model
+
+# inject options chosen on the coordinator and used by every agent
+inject_options = ('injections', 'selected_targets', 'selected_target_indices',
+                  'selected_registers', 'latent_iterations', 'log_delay',
+                  'warm', 'force_reset', 'probe_memory', 'probe_registers',
+                  'probe_command', 'compare_all', 'extract_blocks')
+# files of a campaign an agent needs to inject (gold outputs, files sent to
+# the DUTs and the golden run trace), relative to its campaign-data folder
+campaign_files = ('gold', 'dut-files', 'aux-files', 'sqlite/database.sqlite')
+result_sets = ('event_set', 'injection_set', 'simics_register_diff_set',
+               'simics_memory_diff_set')
+simulated_outcomes = ((('No error', 'Masked faults'), 0.70),
+                      (('No error', 'Latent faults'), 0.10),
+                      (('Execution error', 'Segmentation fault'), 0.10),
+                      (('Execution error', 'Hanging'), 0.05),
+                      (('Data error', 'Silent data error'), 0.05))
+
+
+def send_message(stream, message):
+    stream.write('{}\n'.format(dumps(message)).encode('utf-8'))
+    stream.flush()
+
+
+def receive_message(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError('connection closed')
+    return loads(line.decode('utf-8'))
+
+
+def campaign_archive_members(tar, folder):
+    # only files and folders inside the campaign folder are extracted
+    for member in tar.getmembers():
+        name = normpath(member.name)
+        if not (member.isfile() or member.isdir()) or isabs(name) or \
+                not (name == folder or name.startswith(folder+sep)):
+            raise Exception('invalid campaign archive member: {}'.format(
+                member.name))
+        yield member
+
+
+def serialize_model(instance):
+    fields = {}
+    for field in instance._meta.concrete_fields:
+        if field.name in ('id', 'campaign', 'result'):
+            continue
+        value = getattr(instance, field.attname)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        fields[field.attname] = value
+    return fields
+
+
+def serialize_result(result):
+    data = {'result': serialize_model(result), 'files': {}}
+    for result_set in result_sets:
+        data[result_set] = [serialize_model(item) for item in
+                            getattr(result, result_set).all()]
+    try:
+        data['timing'] = serialize_model(result.timing)
+    except timing_model.DoesNotExist:
+        data['timing'] = None
+    result_folder = 'campaign-data/{}/results/{}'.format(result.campaign_id,
+                                                         result.id)
+    for root, dirs, files in walk(result_folder):
+        for file_ in files:
+            with open(join(root, file_), 'rb') as result_file:
+                data['files'][relpath(join(root, file_), result_folder)] = \
+                    b64encode(result_file.read()).decode('ascii')
+    return data
+
+
+def store_result(campaign, data):
+    fields = dict(data['result'])
+    timestamp = fields.pop('timestamp')
+    result = campaign.result_set.create(**fields)
+    # timestamp is set on creation, keep the time the agent logged the result
+    result.timestamp = timestamp
+    result.save()
+    for result_set in result_sets:
+        for item in data[result_set]:
+            getattr(result, result_set).create(**item)
+    if data['timing'] is not None:
+        timing_model.objects.create(result=result, **data['timing'])
+    result_folder = 'campaign-data/{}/results/{}'.format(campaign.id,
+                                                         result.id)
+    for file_, contents in data['files'].items():
+        file_ = join(result_folder, file_)
+        if not exists(dirname(file_)):
+            makedirs(dirname(file_))
+        with open(file_, 'wb') as result_file:
+            result_file.write(b64decode(contents))
+    return result
+
+
+class coordinator(object):
+    def __init__(self, options):
+        self.options = options
+        self.campaign = get_campaign(options)
+        self.lease_time = timedelta(seconds=options.lease_time)
+        self.lock = Lock()
+
+    def __str__(self):
+        return 'Coordinator for campaign {} on port {}'.format(
+            self.campaign.id, self.options.coordinator)
+
+    def serve(self):
+        coordinator = self
+
+        class handler(StreamRequestHandler):
+            def handle(self):
+                agent = None
+                try:
+                    while True:
+                        message = receive_message(self.rfile)
+                        if message['type'] == 'hello':
+                            agent = '{}:{}'.format(message['host'],
+                                                   message['board'])
+                        if message['type'] == 'files':
+                            coordinator.send_files(self.wfile)
+                        else:
+                            send_message(self.wfile,
+                                         coordinator.handle(agent, message))
+                except (ConnectionError, OSError, ValueError):
+                    pass
+                finally:
+                    # a lost agent returns its leased iterations to the queue
+                    if agent is not None:
+                        coordinator.release(agent, 'Agent disconnected')
+                    django_connection.close()
+
+        class server(ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = server(('', self.options.coordinator), handler)
+        print(colored('{}, {} seconds lease time'.format(
+            self, self.options.lease_time), 'blue'))
+        Thread(target=self.expire_leases, daemon=True).start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+
+    def handle(self, agent, message):
+        if message['type'] == 'hello':
+            self.campaign.event_set.create(
+                level='Information', source='Coordinator',
+                type='Agent connected', description=agent)
+            campaign = serialize_model(self.campaign)
+            campaign['id'] = self.campaign.id
+            return {'campaign': campaign,
+                    'lease_time': self.options.lease_time,
+                    'options': {option: getattr(self.options, option, None)
+                                for option in inject_options}}
+        elif message['type'] == 'lease':
+            return {'iteration': self.lease(agent)}
+        elif message['type'] == 'renew':
+            return {'leased': bool(self.campaign.iteration_set.filter(
+                number=message['number'], status='assigned',
+                dut_serial_port=agent).update(assigned=datetime.now()))}
+        elif message['type'] == 'result':
+            return self.log_result(agent, message['number'], message['data'])
+        elif message['type'] == 'release':
+            self.release(agent, 'Agent released iterations')
+            return {}
+        else:
+            return {'error': 'unknown message type {}'.format(
+                message['type'])}
+
+    def send_files(self, stream):
+        # the archive is sent as raw bytes after its size, from a temporary
+        # file so that the trace is never held in memory
+        folder = 'campaign-data/{}'.format(self.campaign.id)
+        with TemporaryFile() as archive:
+            with open_tar(fileobj=archive, mode='w:gz') as tar:
+                for file_ in campaign_files:
+                    if exists(join(folder, file_)):
+                        tar.add(join(folder, file_))
+            send_message(stream, {'size': archive.tell()})
+            archive.seek(0)
+            copyfileobj(archive, stream)
+            stream.flush()
+
+    def lease(self, agent):
+        with self.lock:
+            iteration = self.campaign.iteration_set.filter(
+                status='planned').order_by('number').first()
+            if iteration is None and self.options.iterations is None and \
+                    not self.options.resume:
+                plan_iterations(self.campaign, 1)
+                iteration = self.campaign.iteration_set.filter(
+                    status='planned').order_by('number').first()
+            if iteration is None:
+                return None
+            iteration.status = 'assigned'
+            iteration.assigned = datetime.now()
+            iteration.dut_serial_port = agent
+            iteration.save()
+        print('{}: iteration {}'.format(agent, iteration.number))
+        return {'number': iteration.number, 'seed': iteration.seed}
+
+    def log_result(self, agent, number, data):
+        with self.lock:
+            iteration = self.campaign.iteration_set.filter(
+                number=number, status='assigned',
+                dut_serial_port=agent).first()
+            if iteration is None:
+                print(colored('{}: discarded result of iteration {}, lease '
+                              'expired'.format(agent, number), 'red'))
+                return {'stored': False}
+            data['result']['dut_serial_port'] = agent
+            result = store_result(self.campaign, data)
+            if result.outcome_category == 'Incomplete':
+                iteration.status = 'planned'
+                iteration.assigned = None
+                iteration.dut_serial_port = None
+            else:
+                iteration.status = 'completed'
+                iteration.completed = result.timestamp
+                iteration.result = result
+            iteration.save()
+        print(colored('{}, {}: {} - {}'.format(
+            agent, result.id, result.outcome_category, result.outcome),
+            'blue'))
+        return {'stored': True, 'result': result.id}
+
+    def release(self, agent, reason):
+        with self.lock:
+            released = self.campaign.iteration_set.filter(
+                status='assigned', dut_serial_port=agent).update(
+                    status='planned', assigned=None, dut_serial_port=None,
+                    result=None)
+        if released:
+            self.campaign.event_set.create(
+                level='Warning', source='Coordinator', type=reason,
+                description='{}, {} iteration(s) returned to queue'.format(
+                    agent, released))
+            print(colored('{}: {}, {} iteration(s) returned to queue'.format(
+                agent, reason.lower(), released), 'red'))
+
+    def expire_leases(self):
+        while True:
+            sleep(max(self.lease_time.total_seconds()/4, 1))
+            with self.lock:
+                expired = self.campaign.iteration_set.filter(
+                    status='assigned',
+                    assigned__lt=datetime.now()-self.lease_time)
+                for agent in set(expired.values_list('dut_serial_port',
+                                                     flat=True)):
+                    expired.filter(dut_serial_port=agent).update(
+                        status='planned', assigned=None, dut_serial_port=None,
+                        result=None)
+                    self.campaign.event_set.create(
+                        level='Warning', source='Coordinator',
+                        type='Lease expired', description=agent)
+                progress = get_iteration_progress(self.campaign)
+            if (self.options.iterations is not None or self.options.resume) \
+                    and not progress['planned'] and not progress['assigned']:
+                print(colored('campaign {}: all {} iteration(s) completed'
+                              ''.format(self.campaign.id,
+                                        progress['completed']), 'blue'))
+                self.server.shutdown()
+                return
+
+
+class agent_connection(object):
+    def __init__(self, address, port):
+        self.address = address
+        self.port = port
+        self.lock = Lock()
+        self.socket = create_connection((address, port))
+        self.stream = self.socket.makefile('rwb')
+
+    def __str__(self):
+        return 'Coordinator at {}:{}'.format(self.address, self.port)
+
+    def request(self, message):
+        with self.lock:
+            send_message(self.stream, message)
+            return receive_message(self.stream)
+
+    def receive_files(self, folder):
+        with self.lock:
+            send_message(self.stream, {'type': 'files'})
+            size = receive_message(self.stream)['size']
+            with TemporaryFile() as archive:
+                while size:
+                    data = self.stream.read(min(size, 1 << 20))
+                    if not data:
+                        raise ConnectionError('connection closed')
+                    archive.write(data)
+                    size -= len(data)
+                archive.seek(0)
+                with open_tar(fileobj=archive, mode='r:gz') as tar:
+                    tar.extractall(
+                        members=campaign_archive_members(tar, folder))
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+
+class agent_database(database):
+    def __init__(self, options, connection, lease_time):
+        self.connection = connection
+        self.lease_time = lease_time
+        super().__init__(options)
+
+    def claim_iteration(self, first=1):
+        lease = self.connection.request({'type': 'lease'})['iteration']
+        if lease is None:
+            return None
+        self.iteration = self.campaign.iteration_set.create(
+            assigned=datetime.now(), dut_serial_port=self.options.dut_serial_port,
+            number=lease['number'], result=self.result, seed=lease['seed'],
+            status='assigned')
+        Thread(target=self.__renew_lease, args=[self.iteration],
+               daemon=True).start()
+        return self.iteration
+
+    def create_iteration(self):
+        return self.claim_iteration()
+
+    def __renew_lease(self, iteration):
+        while True:
+            sleep(self.lease_time/3)
+            if self.iteration is not iteration:
+                return
+            if not self.connection.request(
+                    {'type': 'renew', 'number': iteration.number})['leased']:
+                return
+
+    def log_result(self, supervisor=False, exit=False):
+        result = self.result
+        iteration = self.iteration
+        super().log_result(supervisor, exit)
+        if iteration is not None:
+            response = self.connection.request({
+                'type': 'result', 'number': iteration.number,
+                'data': serialize_result(result)})
+            if not response['stored']:
+                print(colored('{}: lease of iteration {} expired, result '
+                              'discarded by coordinator'.format(
+                                  self.options.dut_serial_port,
+                                  iteration.number), 'red'))
+
+
+def simulate_injections(db, options):
+    # stands in for a DUT so the coordinator and agents can be exercised
+    # without hardware, outcomes follow the iteration seed (but board loss
+    # does not, so a lost iteration can complete when it is claimed again)
+    loss = Random()
+    while True:
+        iteration = db.claim_iteration()
+        if iteration is None:
+            break
+        seed(iteration.seed)
+        db.result.num_injections = options.injections
+        db.log_event('Information', 'DUT', 'Command', db.campaign.command)
+        for i in range(options.injections):
+            db.result.injection_set.create(
+                bit=randrange(32), success=True, target='GPR',
+                time=uniform(0, db.campaign.execution_time or 1))
+        with db.phases.span('execution'):
+            sleep(uniform(*options.simulate_delay))
+        if loss.random() < options.simulate_loss:
+            print(colored('{}: simulating agent loss during iteration {}'
+                          ''.format(options.dut_serial_port,
+                                    iteration.number), 'red'))
+            _exit(1)
+        outcome = random()
+        for (outcome_category, outcome_), probability in simulated_outcomes:
+            outcome -= probability
+            if outcome < 0:
+                break
+        db.result.outcome_category = outcome_category
+        db.result.outcome = outcome_
+        db.result.returned = outcome_ != 'Hanging'
+        db.result.dut_output = 'simulated iteration {} on {}\n'.format(
+            iteration.number, options.dut_serial_port)
+        db.log_result()
+    db.result.delete()
+
+
+def agent_process(options, board):
+    options = copy(options)
+    options.dut_serial_port = board
+    connection = agent_connection(options.coordinator_address,
+                                  options.coordinator_port)
+    hello = connection.request(
+        {'type': 'hello', 'host': gethostname(), 'board': board})
+    db = agent_database(options, connection, hello['lease_time'])
+    try:
+        if options.simulate:
+            simulate_injections(db, options)
+        else:
+            drseus = fault_injector(options, None, db)
+            try:
+                drseus.inject_campaign()
+            finally:
+                db.flush_debugger_output()
+    except KeyboardInterrupt:
+        connection.request({'type': 'release'})
+    finally:
+        connection.close()
+
+
+def run_agent(options):
+    connection = agent_connection(options.coordinator_address,
+                                  options.coordinator_port)
+    print(colored('Connected to {}'.format(connection), 'blue'))
+    hello = connection.request(
+        {'type': 'hello', 'host': gethostname(), 'board': 'agent'})
+    for option, value in hello['options'].items():
+        setattr(options, option, value)
+    options.command = 'inject'
+    options.iterations = None
+    options.resume = False
+    options.metrics = None
+    # the local database only mirrors the campaign and holds results until
+    # they are sent to the coordinator
+    campaign_fields = dict(hello['campaign'])
+    campaign = campaign_model(**campaign_fields)
+    try:
+        campaign.save()
+    except OperationalError:
+        initialize_database(options)
+        campaign.save()
+    options.campaign_id = campaign.id
+    options.architecture = campaign.architecture
+    if not exists('campaign-data/{}'.format(campaign.id)):
+        print('retrieving campaign files...')
+        connection.receive_files('campaign-data/{}'.format(campaign.id))
+    connection.close()
+    if options.simulate:
+        boards = ['simulated{}'.format(i) for i in range(options.processes)]
+    elif options.dut_serial_port:
+        boards = [options.dut_serial_port]
+    else:
+        boards = sorted(find_zedboard_uart_serials().keys())[
+            :options.processes]
+    if not boards:
+        raise Exception('no boards available for agent')
+    django_connection.close()
+    processes = []
+    for board in boards:
+        process = Process(target=agent_process, args=[options, board])
+        processes.append(process)
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
@@ -736,6 +736,8 @@ class dut(object):
                 else:
                     self.db.result.save()
         self.stop_timer()
+        if self.db.metrics is not None:
+            self.db.metrics.add('serial_bytes', len(buff))
         if self.serial.timeout != self.options.timeout:
             try:
                 self.serial.timeout = self.options.timeout
@@ -868,7 +870,8 @@ class dut(object):
             elif 'socket_file_server.py' not in process_list:
                 self.command('./socket_file_server.py &')
                 sleep(1)
-        self.send_files()
+        with self.db.phases.span('send_files'):
+            self.send_files()
         for persistent_executable in self.options.aux_persistent_executables \
                 if self.aux else self.options.dut_persistent_executables:
             if persistent_executable not in process_list:
@@ -1,12 +1,14 @@
 from datetime import datetime
 from os import listdir, makedirs
+from random import seed
 from shutil import rmtree
 from threading import Thread
 from time import perf_counter, sleep
 from traceback import print_exc
 
-from .database import database
+from .database import database, get_iteration_progress
 from .error import DrSEUsError
+from .gold_cache import get_gold_cache_key, restore_gold_run, store_gold_run
 from .jtag.bdi import bdi
 from .jtag.dummy import dummy
 from .jtag.openocd import openocd
@@ -16,10 +18,10 @@ from .sqlite_database import sqlite_database, print_sqlite_database, assembly_go
 from .sqlite_test import run_sqlite_tests
 
 class fault_injector(object):
-    def __init__(self, options, power_switch=None):
+    def __init__(self, options, power_switch=None, db=None):
         self.options = options
         self.bbzybo  = 1
-        self.db = database(options)
+        self.db = database(options) if db is None else db
         if self.db.campaign.simics and self.db.campaign.architecture in \
                 ['a9', 'p2020']:
             self.debugger = simics(self.db, options)
@@ -168,6 +170,22 @@ class fault_injector(object):
                     self.debugger.create_checkpoints()
 
     # def setup_campaign(self):
+        gold_cache_key = get_gold_cache_key(self.options, self.db.campaign)
+        if not self.options.no_cache:
+            cached_campaign = restore_gold_run(
+                gold_cache_key, self.db.campaign, self.options)
+            if cached_campaign is not None:
+                print('\tUsing cached gold run of campaign {}'.format(
+                    cached_campaign))
+                self.db.log_event(
+                    'Information', 'Fault Injector', 'Restored gold run',
+                    'campaign {}, key {}'.format(cached_campaign,
+                                                 gold_cache_key),
+                    campaign=True)
+                self.db.campaign.timestamp = datetime.now()
+                self.db.campaign.save()
+                self.close()
+                return
         if self.db.campaign.command or self.db.campaign.simics:
             if self.db.campaign.simics:
                 self.debugger.launch_simics()
@@ -213,6 +231,7 @@ class fault_injector(object):
             self.debugger.reset_dut()
             assembly_golden_run(self.options.cache_sqlite, self.debugger)
             print_sqlite_database(self.options.cache_sqlite)
+        store_gold_run(gold_cache_key, self.db.campaign, self.options)
         self.close()
 
     def inject_campaign(self, iteration_counter=None, timer=None):
@@ -221,7 +240,8 @@ class fault_injector(object):
                               latent_iteration=0):
             if self.db.campaign.aux:
                 try:
-                    self.debugger.aux.read_until()
+                    with self.db.phases.span('execution'):
+                        self.debugger.aux.read_until()
                 except DrSEUsError as error:
                     self.debugger.dut.write('\x03')
                     self.db.result.outcome_category = 'AUX execution error'
@@ -231,7 +251,9 @@ class fault_injector(object):
                         self.debugger.dut.write('\x03')
             if self.db.campaign.command:
                 try:
-                    self.db.result.returned = self.debugger.dut.read_until()[1]
+                    with self.db.phases.span('execution'):
+                        self.db.result.returned = \
+                            self.debugger.dut.read_until()[1]
                 except DrSEUsError as error:
                     self.db.result.outcome_category = 'Execution error'
                     self.db.result.outcome = error.type
@@ -265,15 +287,17 @@ class fault_injector(object):
                                 self.debugger.dut.get_timer_value()
             if self.db.campaign.output_file and \
                     self.db.result.outcome == 'In progress':
-                if hasattr(self.debugger, 'aux') and \
-                        self.db.campaign.aux_output_file:
-                    self.debugger.aux.check_output()
-                else:
-                    self.debugger.dut.check_output()
-            if self.db.campaign.log_files:
-                self.debugger.dut.get_logs(latent_iteration)
-            if self.db.campaign.aux_log_files:
-                self.debugger.aux.get_logs(latent_iteration)
+                with self.db.phases.span('check_output'):
+                    if hasattr(self.debugger, 'aux') and \
+                            self.db.campaign.aux_output_file:
+                        self.debugger.aux.check_output()
+                    else:
+                        self.debugger.dut.check_output()
+            with self.db.phases.span('get_logs'):
+                if self.db.campaign.log_files:
+                    self.debugger.dut.get_logs(latent_iteration)
+                if self.db.campaign.aux_log_files:
+                    self.debugger.aux.get_logs(latent_iteration)
             if self.db.result.outcome == 'In progress':
                 self.db.result.outcome_category = 'No error'
                 if persistent_faults:
@@ -314,6 +338,55 @@ class fault_injector(object):
                         self.db.result.outcome_category = outcome_category
                         self.db.result.outcome = outcome
 
+        def probe_dut():
+            probe = {}
+            if self.options.probe_memory or self.options.probe_registers:
+                self.debugger.halt_dut()
+                if self.options.probe_memory:
+                    address, words = self.options.probe_memory
+                    probe['memory'] = self.debugger.get_memory_checksum(
+                        address, int(words))
+                if self.options.probe_registers:
+                    probe['registers'] = self.debugger.get_register_values(
+                        self.options.probe_registers)
+                self.debugger.continue_dut()
+            if self.options.probe_command:
+                probe['command'] = self.debugger.dut.command(
+                    self.options.probe_command)[0]
+            return probe
+
+        def warm_restart():
+            # reuse the booted DUT only after a clean iteration, any doubt
+            # about the state of the DUT falls back to a full reset
+            if self.warm_iterations >= self.options.force_reset:
+                return False
+            if self.db.result.outcome != 'Masked faults' or \
+                    not self.db.result.returned or \
+                    self.db.result.event_set.filter(
+                        level__in=('Warning', 'Error')).exists():
+                return False
+            try:
+                probe = probe_dut()
+            except DrSEUsError as error:
+                self.db.log_event(
+                    'Warning', 'DrSEUs', 'Warm restart probe failed',
+                    error.type)
+                return False
+            # probes of the first clean iteration after a full reset are the
+            # reference for the following warm iterations
+            if self.warm_probe is None:
+                self.warm_probe = probe
+            elif probe != self.warm_probe:
+                self.db.log_event(
+                    'Warning', 'DrSEUs', 'Warm restart probe mismatch',
+                    str(probe))
+                return False
+            self.warm_iterations += 1
+            self.db.log_event(
+                'Information', 'DrSEUs', 'Warm restart',
+                '{}/{}'.format(self.warm_iterations, self.options.force_reset))
+            return True
+
         def background_log():
             global incomplete
             while incomplete:
@@ -325,7 +398,10 @@ class fault_injector(object):
 
         def perform_injections(reset_next_run):
             print("Using database: %s" % (get_database_path(self.options)))
-            sql_db = sqlite_database(self.options, get_database_path(self.options))
+            sql_db = getattr(self.options, 'cache_sqlite', None)
+            if sql_db is None:
+                sql_db = sqlite_database(self.options, get_database_path(self.options),
+                                         read_only=self.options.command == 'inject')
             # TODO: Start cycle isn't used here?
             print("Start cycle: %d" % (sql_db.get_start_cycle()))
             if timer is not None:
@@ -333,21 +409,40 @@ class fault_injector(object):
             while True:
                 if timer is not None and (perf_counter()-start >= timer):
                     break
-                if iteration_counter is not None:
+                if self.options.command == 'inject':
+                    if self.options.iterations is None and \
+                            not self.options.resume:
+                        iteration = self.db.create_iteration()
+                    else:
+                        iteration = self.db.claim_iteration(
+                            self.options.first_iteration)
+                    if iteration is None:
+                        break
+                    # seed injection selection so the iteration can be redone
+                    seed(iteration.seed)
+                    print('Iteration {}, remaining iterations: {}'.format(
+                        iteration.number,
+                        get_iteration_progress(self.db.campaign)['planned']))
+                elif iteration_counter is not None:
                     with iteration_counter.get_lock():
                         iteration = iteration_counter.value
                         if iteration:
                             iteration_counter.value -= 1
                         else:
                             break
-                print("Remaining iterations: " + str(iteration_counter.value))
+                    print("Remaining iterations: " + str(iteration_counter.value))
                 self.db.result.num_injections = self.options.injections
                 if not self.db.campaign.simics:
                     if self.options.command == 'inject':
                         if reset_next_run:
                             try:
                                 # Reset the DUT. reset_dut calls reboot.sh
-                                self.debugger.reset_dut()
+                                with self.db.phases.span('reset'):
+                                    self.debugger.reset_dut()
+                                if self.db.metrics is not None:
+                                    self.db.metrics.add('resets')
+                                self.warm_iterations = 0
+                                self.warm_probe = None
                             except DrSEUsError as error:
                                 self.db.result.outcome_category = 'Debugger error'
                                 self.db.result.outcome = str(error)
@@ -369,7 +464,8 @@ class fault_injector(object):
                 log_thread = Thread(target=background_log)
                 try:
                     # Run the program while injected some number of faults
-                    (self.db.result.num_register_diffs, self.db.result.num_memory_diffs, persistent_faults, reset_next_run) = self.debugger.inject_faults(sql_db)
+                    with self.db.phases.span('inject'):
+                        (self.db.result.num_register_diffs, self.db.result.num_memory_diffs, persistent_faults, reset_next_run) = self.debugger.inject_faults(sql_db)
                     if self.options.log_delay is not None:
                         log_thread.start()
                 except DrSEUsError as error:
@@ -400,7 +496,8 @@ class fault_injector(object):
                     incomplete = False
                     if self.options.log_delay is not None:
                         log_thread.join()
-                    check_latent_faults()
+                    with self.db.phases.span('latent', inclusive=True):
+                        check_latent_faults()
                 if self.db.campaign.simics:
                     try:
                         self.debugger.close()
@@ -420,7 +517,11 @@ class fault_injector(object):
                         self.db.result.outcome = error.type
                     if self.db.campaign.aux:
                         self.debugger.aux.flush()
+                    if self.options.command == 'inject' and \
+                            self.options.warm and reset_next_run:
+                        reset_next_run = not warm_restart()
                 self.db.log_result()
+            sql_db.close()
             if self.options.command == 'inject':
                 self.close()
             elif self.options.command == 'supervise':
@@ -429,6 +530,8 @@ class fault_injector(object):
                 self.db.result.save()
 
         # Body of inject_campaign(self, iteration_counter):
+        self.warm_iterations = 0
+        self.warm_probe = None
         try:
             # Executes multple iterations of the program, injecting one or more fault into each
             # perform_injections() sets up all of the iterations of the program;
@@ -0,0 +1,119 @@
+from hashlib import sha256
+from json import dump, dumps, load
+from os import getpid, link, makedirs, rename
+from os.path import basename, exists, isfile, join
+from shutil import copy, copy2, copytree, rmtree
+
+from .simics.config import update_checkpoint_dependencies
+
+cache_folder = 'gold-cache'
+# files used by the assembly golden run of the Zybo trace
+golden_run_files = ('../etc/tags.txt', '../jtag_eval/xsdb/Attempt2.elf')
+campaign_fields = ('checkpoints', 'cycles', 'cycles_between', 'execution_time',
+                   'start_cycle', 'start_time', 'dut_output', 'aux_output',
+                   'debugger_output')
+
+
+def link_file(source, destination):
+    # gold outputs and checkpoint images are only read, so they are shared
+    # with the cache by hard links, but checkpoint configs are rewritten for
+    # each campaign by update_checkpoint_dependencies and must be copied
+    if basename(source) != 'config':
+        try:
+            link(source, destination)
+            return destination
+        except OSError:
+            # e.g. on another file system
+            pass
+    return copy2(source, destination)
+
+
+def get_gold_cache_key(options, campaign):
+    key = sha256()
+    key.update(dumps({
+        'architecture': campaign.architecture,
+        'aux': campaign.aux,
+        'aux_command': campaign.aux_command,
+        'aux_log_files': campaign.aux_log_files,
+        'aux_output_file': campaign.aux_output_file,
+        'checkpoints': options.checkpoints if campaign.simics else None,
+        'command': campaign.command,
+        'delay': options.delay,
+        'kill_aux': campaign.kill_aux,
+        'kill_dut': campaign.kill_dut,
+        'log_files': campaign.log_files,
+        'output_file': campaign.output_file,
+        'simics': campaign.simics,
+        'timing_iterations': options.iterations
+    }, sort_keys=True).encode('utf-8'))
+    files = [join(options.directory, file_) for file_ in options.files]
+    files += [join(options.directory, file_) for file_ in options.aux_files]
+    files += [file_ for file_ in golden_run_files if isfile(file_)]
+    for file_ in files:
+        key.update(file_.encode('utf-8'))
+        with open(file_, 'rb') as data:
+            for chunk in iter(lambda: data.read(1 << 20), b''):
+                key.update(chunk)
+    return key.hexdigest()
+
+
+def restore_gold_run(key, campaign, options):
+    location = join(cache_folder, key)
+    if not exists(join(location, 'campaign.json')):
+        return None
+    with open(join(location, 'campaign.json'), 'r') as info_file:
+        info = load(info_file)
+    for field in campaign_fields:
+        setattr(campaign, field, info[field])
+    campaign_folder = 'campaign-data/{}'.format(campaign.id)
+    if exists(join(location, 'gold')):
+        copytree(join(location, 'gold'), join(campaign_folder, 'gold'),
+                 copy_function=link_file)
+    if exists(join(location, 'database.sqlite')):
+        # the trace database is written by the campaign (indexes, cache
+        # model, plans), so it is copied, with its connection closed first
+        # since the file is replaced
+        options.cache_sqlite.store.close()
+        copy(join(location, 'database.sqlite'), options.cache_sqlite.database)
+        options.cache_sqlite.metadata = None
+        options.cache_sqlite.update_schema()
+    if exists(join(location, 'gold-checkpoints')):
+        copytree(join(location, 'gold-checkpoints'),
+                 'simics-workspace/gold-checkpoints/{}'.format(campaign.id),
+                 copy_function=link_file)
+        update_checkpoint_dependencies(campaign.id)
+    # the DUT is never logged into, so collect the campaign files here
+    for files, folder in ((options.files, 'dut-files'),
+                          (options.aux_files, 'aux-files')):
+        if files:
+            makedirs(join(campaign_folder, folder))
+            for file_ in files:
+                copy(join(options.directory, file_),
+                     join(campaign_folder, folder))
+    return info['campaign']
+
+
+def store_gold_run(key, campaign, options):
+    location = join(cache_folder, key)
+    temp_location = '{}.{}'.format(location, getpid())
+    makedirs(temp_location)
+    info = {field: getattr(campaign, field) for field in campaign_fields}
+    info['campaign'] = campaign.id
+    campaign_folder = 'campaign-data/{}'.format(campaign.id)
+    if exists(join(campaign_folder, 'gold')):
+        copytree(join(campaign_folder, 'gold'), join(temp_location, 'gold'),
+                 copy_function=link_file)
+    if hasattr(options, 'cache_sqlite') and \
+            options.cache_sqlite.database is not None and \
+            exists(options.cache_sqlite.database):
+        copy(options.cache_sqlite.database,
+             join(temp_location, 'database.sqlite'))
+    checkpoints = 'simics-workspace/gold-checkpoints/{}'.format(campaign.id)
+    if campaign.simics and exists(checkpoints):
+        copytree(checkpoints, join(temp_location, 'gold-checkpoints'),
+                 copy_function=link_file)
+    with open(join(temp_location, 'campaign.json'), 'w') as info_file:
+        dump(info, info_file, indent=4)
+    if exists(location):
+        rmtree(location)
+    rename(temp_location, location)
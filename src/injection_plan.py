@@ -0,0 +1,183 @@
+from json import dumps
+from multiprocessing import Pool
+from os import devnull
+from random import randrange, seed, uniform
+import sys
+from termcolor import colored
+from time import perf_counter
+
+from .targets import choose_injection, get_cache_injection
+
+# Everything an iteration of a JTAG campaign looks up in the golden run trace,
+#   worked out before the board is halted: the injections (as created by
+#   inject_faults) and, for the first injection into the L2 cache, its set,
+#   way, word, breakpoint address, skip counts and the loads reading the
+#   flipped word with their destination registers. Plans are made by
+#   "drseus.py plan" in worker processes, seeded like the iterations they are
+#   for, and stored in the trace database.
+
+ways = 8  # TODO: Hardcoding for L2 cache
+
+
+# Lines by way from the simulated residency timeline, otherwise the most
+#   recently accessed distinct lines of the set
+def previous_access(sql_db, cycle, cache_set, assoc):
+    if sql_db.residency is not None:
+        return sql_db.get_resident_lines(cycle, cache_set)
+    if sql_db.trace_index is not None:
+        return sql_db.trace_index.previous_lines(cycle, cache_set, assoc)
+    candidates = []
+    current_cycle = cycle
+    while len(candidates) < assoc:
+        current_cycle, address = sql_db.PreviousLdrStr(current_cycle,
+                                                       cache_set)
+        if address is None:
+            return candidates
+        if not (address in candidates):
+            candidates.append(address)
+    return candidates
+
+
+# Select injection times and targets, in time order
+def choose_injections(sql_db, targets, options):
+    if sql_db.ace is not None and list(targets) == ['CACHE_L2']:
+        # Only flips that the golden run reads are injected, each standing for
+        #   the AVF of the whole cache data
+        if not sql_db.ace[2]:
+            raise Exception('no vulnerable intervals found for --ace, the '
+                            'golden run never reads the L2 cache data')
+        choices = []
+        for i in range(options.injections):
+            cache_set, way, word, cycle = sql_db.sample_ace()
+            injection = get_cache_injection(targets, cache_set, way, word,
+                                            randrange(32))
+            choices.append(dict(injection, time=cycle, weight=sql_db.ace[3]))
+        return sorted(choices, key=lambda injection: injection['time'])
+    # Pulls first and last cycle counts from the load / store database
+    injection_times = [int(uniform(sql_db.get_start_cycle(),
+                                   sql_db.get_end_cycle()))
+                       for i in range(options.injections)]
+    return [dict(choose_injection(targets, options.selected_target_indices),
+                 time=injection_time)
+            for injection_time in sorted(injection_times)]
+
+
+# Find the line in the injected way and the loads that read the flipped word
+#   before it is overwritten, with the breakpoints needed to reach them.
+#   Returns the plan, or the reason nothing can be injected as error
+def resolve_cache_injection(sql_db, targets, register, field, bit, time):
+    # Select the desired cache line (injection.bit / injection.field)
+    # From the stopping time, find all future reads and writes
+    cycle = int(time)
+    cache_set = int(register[-4:])
+    way_impacted = int(field.split('_')[-1])
+    fields = dict((field_, bits) for field_, bits in
+                  targets['CACHE_L2']['registers'][register]['fields'])
+    data_low = byte_offset = 0
+    if field.startswith('data'):
+        data_low = fields[field][1]
+        byte_offset = (bit - data_low) // 32 * 4
+    plan = {'cycle': cycle, 'cache_set': cache_set, 'way': way_impacted,
+            'byte_offset': byte_offset, 'data_low': data_low}
+    # Only reads of the flipped word are followed. Samples from the vulnerable
+    #   intervals (--ace) are always resident and read, other injections may
+    #   not be
+    if not field.startswith('data'):
+        return dict(plan, error='only flips in the line data are followed')
+
+    # Candidates are the addresses of the data in the cache shifted to remove
+    #   the byte offset. Since there are 32 bytes in each cache line, that
+    #   means >> 5
+    candidates = previous_access(sql_db, cycle, cache_set, ways)
+    print("Candidate addresses for the injection!: ", candidates)
+    if way_impacted >= len(candidates) or candidates[way_impacted] is None:
+        return dict(plan, error='cache line was not valid')
+    plan['line'] = candidates[way_impacted]
+
+    # target picked, so now need all following accesses (until a store or
+    #   slow load)
+    injection_targets = sql_db.NextLdrStr(
+        cycle, cache_set, (candidates[way_impacted] << 5) + byte_offset)
+    print("Injection targets: ", injection_targets)
+    if len(injection_targets) == 0:
+        return dict(plan, error='value in cache never read')
+
+    # Breakpoint hits to skip before the first target, then for each target
+    #   the hits to skip and the destination register decoded from the golden
+    #   run (None to disassemble it)
+    prev_cycle = injection_targets[0][0]
+    plan['skip_count'] = sql_db.SkipCount(0, prev_cycle,
+                                          injection_targets[0][1])
+    print("Skip Count! ", plan['skip_count'])
+    plan['start_addr'] = sql_db.get_start_addr()
+    plan['targets'] = []
+    for target_cycle, address in injection_targets:
+        plan['targets'].append([
+            target_cycle, address,
+            sql_db.SkipCount(prev_cycle, target_cycle, address),
+            sql_db.get_load_register(address)])
+        prev_cycle = target_cycle
+    return plan
+
+
+# The injections of an iteration, the first into the L2 cache resolved
+#   (inject_faults returns after it)
+def plan_injections(sql_db, targets, options):
+    injections = choose_injections(sql_db, targets, options)
+    for injection in injections:
+        if injection['target'] == 'CACHE_L2':
+            injection['cache'] = resolve_cache_injection(
+                sql_db, targets, injection['register'], injection['field'],
+                injection['bit'], injection['time'])
+            break
+    return injections
+
+
+# Trace database, targets and options of the planning process, inherited by
+#   the forked workers
+planner = None
+
+
+def initialize_worker():
+    # The lookups print as they go, which would only slow planning down
+    sys.stdout = open(devnull, 'w')
+
+
+def plan_iteration(iteration):
+    number, iteration_seed = iteration
+    sql_db, targets, options = planner
+    seed(iteration_seed)
+    return number, dumps(plan_injections(sql_db, targets, options))
+
+
+# Plan the iterations, given as (number, seed), in processes workers and store
+#   the plans
+def make_plans(sql_db, targets, options, iterations, processes):
+    global planner
+    planner = (sql_db, targets, options)
+    print(colored("Planning {} iterations with {} processes...".format(
+        len(iterations), processes), 'yellow'))
+    start = perf_counter()
+    plans = []
+    planned = 0
+    # Plans are only replayed with the same trace and options
+    key = sql_db.get_plan_key(options)
+    # Each worker opens its own connection
+    sql_db.store.close()
+    chunksize = max(1, min(64, len(iterations) // (processes * 4)))
+    with Pool(processes, initialize_worker) as pool:
+        for plan in pool.imap_unordered(plan_iteration, iterations,
+                                        chunksize=chunksize):
+            plans.append(plan)
+            if len(plans) == 1000:
+                sql_db.log_plans(plans, key)
+                planned += len(plans)
+                plans = []
+                print(colored("\t{} plans ({:.0f} plans/sec)".format(
+                    planned, planned / (perf_counter() - start)), 'yellow'))
+    sql_db.log_plans(plans, key)
+    planned += len(plans)
+    elapsed = perf_counter() - start
+    print(colored(
+        "\tplanned {} iterations in {:.1f} seconds ({:.0f} plans/sec)".format(
+            planned, elapsed, planned / max(elapsed, 1e-9)), 'yellow'))
@@ -1,5 +1,4 @@
 from pyudev import Context
-from random import uniform
 from socket import AF_INET, SOCK_STREAM, socket
 from telnetlib import Telnet
 from termcolor import colored
@@ -7,7 +6,8 @@ from time import sleep
 
 from ..dut import dut
 from ..error import DrSEUsError
-from ..targets import choose_injection, get_targets
+from ..injection_plan import choose_injections, resolve_cache_injection
+from ..targets import get_targets
 
 
 def find_all_uarts():
@@ -135,7 +135,8 @@ class jtag(object):
                                   'Error resetting DUT')
             else:
                 try:
-                    self.dut.do_login()
+                    with self.db.phases.span('boot'):
+                        self.dut.do_login()
                 except DrSEUsError as error:
                     attempt_exception(attempt, attempts, error,
                                       'Error booting DUT')
@@ -159,36 +160,27 @@ class jtag(object):
         event.success = True
         event.save()
 
-    # TODO: Doesn't need to be a class function
-    def PrevAccess(self, sql_db, cycle, cache_set, assoc):
-        candidates = []
-        current_cycle = cycle;
-        while len(candidates) < assoc:
-            current_cycle, address = sql_db.PreviousLdrStr(current_cycle, cache_set)
-            if address == None:
-                return candidates
-            if not (address in candidates):
-                candidates.append(address)
-        return candidates
-
     # Returns: num_register_diffs, num_memory_diffs, persistent_faults, reset_next?
     def inject_faults(self, sql_db):
-        # Select injection times
-        injection_times = []
-        for i in range(self.options.injections):
-            # Pulls first and last cycle counts from the load / store database
-            new_inject_time = int(uniform(sql_db.get_start_cycle(), sql_db.get_end_cycle()))
-            # print("Injection time,", new_inject_time, " : between ", sql_db.get_start_cycle(), sql_db.get_end_cycle())
-            injection_times.append(new_inject_time)
-
-        # Select targets and injection object
+        # Select targets and injection object, replaying the plan of the iteration if it has one
         injections = []
+        cache_plans = {}
         if hasattr(self, 'targets') and self.targets:
-            for injection_time in sorted(injection_times):
-                injection = choose_injection(self.targets, self.options.selected_target_indices)
+            choices = None
+            if getattr(self.db, 'iteration', None) is not None:
+                choices = sql_db.get_plan(self.db.iteration.number, sql_db.get_plan_key(self.options))
+            if choices is not None:
+                print("Replaying plan of iteration", self.db.iteration.number)
+            else:
+                choices = choose_injections(sql_db, self.targets, self.options)
+            for injection in choices:
                 print(injection)
-                injection = self.db.result.injection_set.create(success=False, time=injection_time, **injection)
+                cache_plan = injection.pop('cache', None)
+                injection = self.db.result.injection_set.create(success=False, **injection)
                 injections.append(injection)
+                if cache_plan is not None:
+                    cache_plans[injection.id] = cache_plan
+        injection_times = [injection.time for injection in injections]
 
         print("********************************************************************************")
         print("Injection times:")
@@ -216,104 +208,48 @@ class jtag(object):
                 self.select_core(injection.target_index)
 
             if (injection.target == 'CACHE_L2'):
-                # For cache injection:
-                # Select the desired cache line (injection.bit / injection.field)
-                # From the stopping time, find all future reads and writes
-                cache_set = int(injection.register[-4:])
-                print("Is cache_set being set for the cache? ", cache_set)
-                ways = 8 # TODO: Hardcoding for L2 cache
-
-                # While still finding them, do this...
-                # TEST CODE
-                # FIB_SHORT: candidates = self.PrevAccess(sql_db, 1000, 1536, ways)
-                # LZO:
-                candidates = self.PrevAccess(sql_db, 51000, 1056, ways) # No effect
-
-                # candidates = self.PrevAccess(sql_db, injection.time, cache_set, ways)
-                # Candidates are the addresses of the data in the cache shifted to remove the byte offset
-                #   Since there are 32 bytes in each cache line, that means >> 5
-                #   TODO: Make sure byte addressable and not word addressable.
-
-                print("Candidate addresses for the injection!: ", candidates)
-
-                # Parse from injection.field: 84   data_2   cacheline_1455
-                # TODO: limits to a 1 digit number of ways
-                way_impacted = 0 # TEST CODE
-                # way_impacted = int(injection.field[-1:])
-
-                if way_impacted >= len(candidates):
-                    print("No fault injected: cache line was not valid.")
-                    # TODO: How to return from this?
-                    return None, None, False, False
-
-                # target picked, so now need all following accesses (until a store or slow load)
-                # For out example (way 0 of cache line 1531 at cycle 30500, address 1097584 for fib_short):
-                #   SELECT * FROM ls_inst WHERE L2_set = 1531 AND l_s_addr = 1097584 AND cycles_total > 30500;
-                #   30586|14|1055908|0|1097584|LDM|1531
-                #   31133|13|1055900|1|1097584|STM|1531 <- don't return... signals end.
-
-                # LZO example:
-                # sqlite> SELECT * FROM ls_inst WHERE L2_set = 1056 AND l_s_addr = 1147908;
-                # 58607|14|1061604|1|1147908|STR|1056
-                # 357818|14|1050984|0|1147908|LDR|1056
-                # 388511|14|1053628|0|1147908|LDR|1056
-
-                #injection_targets = sql_db.NextLdrStr(cycle, cache_set, (candidates[way_impacted] << 5) + injection.bit)
-                # FIB_SHORT: injection_targets = sql_db.NextLdrStr(1000, 1536, (candidates[way_impacted] << 5) + 16) # TEST CODE
-                # LZO:
-                injection_targets = sql_db.NextLdrStr(51000, 1056, (candidates[way_impacted] << 5) + 16) # TEST CODE
-                print("Injection targets: ", injection_targets)
-
-                if (len(injection_targets) == 0):
-                    print("No Fault injected: value in cache never read.")
+                # For cache injection, the plan holds the line in the injected way and the loads that
+                #   read the flipped word (until a store or slow load)
+                plan = cache_plans.get(injection.id)
+                if plan is None:
+                    plan = resolve_cache_injection(sql_db, self.targets, injection.register, injection.field,
+                                                   injection.bit, injection.time)
+                if 'error' in plan:
+                    print("No fault injected: {}.".format(plan['error']))
                     # TODO: How to return from this?
                     return None, None, False, False
+                injection_targets = plan['targets']
+                data_low = plan['data_low']
 
                 # Need advance the DUT to the first injection
                 # On first injection, figure out the corrupted bit
                 # On all injections, figure out the target and load the wrong value and continue.
-                #skip_count = sql_db.SkipCount(injection_cycle...?, address)
-                prev_cycle = injection_targets[0][0]
-                skip_count = sql_db.SkipCount(0, prev_cycle, injection_targets[0][1]) #, (candidates[way_impacted] << 5) + 16)
+                skip_count = plan['skip_count']
                 print("Skip Count! ", skip_count)
 
                 # Get the DUT to the correct location
-                start_addr = hex(sql_db.get_start_addr())
+                start_addr = hex(plan['start_addr'])
                 print("Run until start address: ", start_addr)
-                self.break_dut(start_addr) # Restart, run until start tag
-                self.break_dut_after(str(injection_targets[0][1]), skip_count) # runs current, Removes breakpoint.
+                with self.db.phases.span('breakpoints'):
+                    self.break_dut(start_addr) # Restart, run until start tag
+                    self.break_dut_after(str(injection_targets[0][1]), skip_count) # runs current, Removes breakpoint.
 
                 inject_value = None
                 for target in injection_targets:
                     # Set breakpoint
                     print("Target: ", target)
-                    skip_count = sql_db.SkipCount(prev_cycle, target[0], target[1])
+                    skip_count = target[2]
                     if (skip_count >= 1):
                         print("********************************")
                         print("* Need to implement this case! *")
                         print("********************************")
-                    self.single_dut_break(str(target[1]))
-
-                    # TODO: The target register should really be part of the database
-                    # Check program counter
-                    program_counter = self.command(command = 'reg pc', error_message = 'Oh boffins!')
-                    print("PC: ", program_counter)
-                    program_counter = (program_counter.split())[2]
-                    print("PC: ", program_counter)
-                    # read instruction
-                    target_reg = self.command(command = 'arm disassemble %s' % (program_counter), error_message = 'You have done it now.')
-                    print("Target Reg: ", target_reg)
-                    instruction = (target_reg.split())[2]
-                    if not "LD" in instruction:
-                        print("YOU SHOULD ONLY BE LOOKING AT LOADS!")
-                    # find target
-                    target_reg = (target_reg.split())[3][:3]
-                    if target_reg == 'r13':
-                        target_reg = 'sp'
-                    if target_reg == 'r14':
-                        target_reg = 'lr'
-                    if target_reg == 'r15':
-                        target_reg = 'pc'
+                    with self.db.phases.span('breakpoints'):
+                        self.single_dut_break(str(target[1]))
+
+                    # Destination register decoded from the golden run, so no disassembly is needed
+                    target_reg = target[3]
+                    if target_reg is None:
+                        target_reg = self.disassemble_load_register()
                     print("Target Reg: ", target_reg)
 
                     # let data load (step):
@@ -328,12 +264,12 @@ class jtag(object):
                         print("inject_value: ", hex(inject_value))
                         # flip bit and save new value in inject_value
                         injection.gold_value = inject_value
-                        print("Injection bit: ", injection.bit, " / ", injection.bit % 32)
-                        inject_value = inject_value ^ (1 << (injection.bit % 32)) # mod 32 for size of registers (injection.bit is for the whole cache line)
+                        print("Injection bit: ", injection.bit, " / ", (injection.bit - data_low) % 32)
+                        inject_value = inject_value ^ (1 << ((injection.bit - data_low) % 32)) # mod 32 for size of registers (injection.bit is for the whole way)
                         injection.injected_value = inject_value # TODO: Could clean up
                         print("inject_value: ", hex(inject_value))
                     # inject "inject value" in target register
-                    self.command(command = 'reg %s 0x%s' % (target_reg, hex(inject_value)), #error_message = 'Failed to inject fault in register')
+                    self.command(command = 'reg %s %s' % (target_reg, hex(inject_value)), #error_message = 'Failed to inject fault in register')
                                  # expected_output = '%s (/32): 0x%s' % (target_reg, hex(inject_value)),
                                  error_message = 'Failed to inject fault in register%s' % (target_reg))
                     print("Did that bloody work?")
@@ -342,8 +278,6 @@ class jtag(object):
 
                     # injection.save()? injection.success, set_register_value... makes sense to write new functions or modify?
 
-                    prev_cycle = target[0]
-
                 # All faults should have now been injected
                 return None, None, False, True
 
@@ -393,6 +327,28 @@ class jtag(object):
             self.continue_dut()
         return None, None, False, True
 
+    # Find the destination register of the load at the current program counter
+    def disassemble_load_register(self):
+        program_counter = self.command(command = 'reg pc', error_message = 'Oh boffins!')
+        print("PC: ", program_counter)
+        program_counter = (program_counter.split())[2]
+        print("PC: ", program_counter)
+        # read instruction
+        target_reg = self.command(command = 'arm disassemble %s' % (program_counter), error_message = 'You have done it now.')
+        print("Target Reg: ", target_reg)
+        instruction = (target_reg.split())[2]
+        if not "LD" in instruction:
+            print("YOU SHOULD ONLY BE LOOKING AT LOADS!")
+        # find target
+        target_reg = (target_reg.split())[3].rstrip(',')
+        if target_reg == 'r13':
+            target_reg = 'sp'
+        if target_reg == 'r14':
+            target_reg = 'lr'
+        if target_reg == 'r15':
+            target_reg = 'pc'
+        return target_reg
+
     def command(self, command, expected_output, error_message,
                 log_event, line_ending, echo):
         if log_event:
@@ -404,10 +360,7 @@ class jtag(object):
         if error_message is None:
             error_message = command
         buff = self.telnet.read_very_eager().decode('utf-8', 'replace')
-        if self.db.result is None:
-            self.db.campaign.debugger_output += buff
-        else:
-            self.db.result.debugger_output += buff
+        self.db.log_debugger_output(buff)
         if self.options.debug:
             print(colored(buff, 'yellow'))
         if command:
@@ -419,10 +372,7 @@ class jtag(object):
                 buff = buff.decode('utf-8', 'replace')
             else:
                 buff = '{}\n'.format(command)
-            if self.db.result is None:
-                self.db.campaign.debugger_output += buff
-            else:
-                self.db.result.debugger_output += buff
+            self.db.log_debugger_output(buff)
             if self.options.debug:
                 print(colored(buff, 'yellow'))
             if echo and index < 0:
@@ -431,10 +381,7 @@ class jtag(object):
             index, match, buff = self.telnet.expect(expected_output,
                                                     timeout=self.timeout)
             buff = buff.decode('utf-8', 'replace')
-            if self.db.result is None:
-                self.db.campaign.debugger_output += buff
-            else:
-                self.db.result.debugger_output += buff
+            self.db.log_debugger_output(buff)
             return_buffer += buff
             if self.options.debug:
                 print(colored(buff, 'yellow'), end='')
@@ -446,17 +393,10 @@ class jtag(object):
         index, match, buff = self.telnet.expect(self.prompts,
                                                 timeout=self.timeout)
         buff = buff.decode('utf-8', 'replace')
-        if self.db.result is None:
-            self.db.campaign.debugger_output += buff
-        else:
-            self.db.result.debugger_output += buff
+        self.db.log_debugger_output(buff)
         return_buffer += buff
         if self.options.debug:
             print(colored(buff, 'yellow'))
-        if self.db.result is None:
-            self.db.campaign.save()
-        else:
-            self.db.result.save()
         if index < 0:
             raise DrSEUsError(error_message)
         for message in self.error_messages:
@@ -481,3 +421,13 @@ class jtag(object):
 
     def set_register_value(self, register_info, value):
         pass
+
+    # Warm restart probes (see fault_injector.probe_dut), a debugger without
+    #   them falls back to a full reset
+    def get_memory_checksum(self, address, words):
+        raise DrSEUsError('Memory probe not supported by {}'.format(
+            self.__class__.__name__))
+
+    def get_register_values(self, registers):
+        raise DrSEUsError('Register probe not supported by {}'.format(
+            self.__class__.__name__))
@@ -33,10 +33,7 @@ class bdi(jtag):
             'Warning', 'Debugger', 'Reset BDI',  success=False)
         self.telnet.write(bytes('boot\r\n', encoding='utf-8'))
         self.telnet.close()
-        if self.db.result is None:
-            self.db.campaign.debugger_output += 'boot\n'
-        else:
-            self.db.result.debugger_output += 'boot\n'
+        self.db.log_debugger_output('boot\n')
         sleep(1)
         self.connect_telnet()
         sleep(1)
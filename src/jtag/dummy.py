@@ -32,9 +32,8 @@ class dummy(jtag):
         event = self.db.log_event(
             'Information', 'Debugger', 'Power cycled DUT', success=False)
         self.close()
-        with self.power_switch as ps:
-            ps.set_outlet(self.options.power_switch_outlet, 'off')
-            ps.set_outlet(self.options.power_switch_outlet, 'on')
+        self.power_switch.power_cycle_batched(
+            self.options.power_switch_outlet)
         self.open()
         print(colored('Power cycled device: {}'.format(self.dut.serial.port),
                       'red'))
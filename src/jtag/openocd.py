@@ -1,17 +1,41 @@
 import subprocess
 from json import load
 from os.path import abspath, dirname, exists
+from re import compile as regex
 from subprocess import DEVNULL, Popen, TimeoutExpired
 from termcolor import colored
-from time import sleep
+from time import perf_counter, sleep
+from zlib import crc32
 
 from ..error import DrSEUsError
 from . import (find_open_port, find_zedboard_jtag_serials,
                find_zedboard_uart_serials, jtag)
+from .response import (cycles_pattern, halt, parse_halts, pc_pattern,
+                       response_parser)
+from .tcl_rpc import tcl_rpc, tcl_rpc_error
+
+register_pattern = regex(r'^(?:\(\d+\) )?(\S+) \(/\d+\): (0x[0-9a-fA-F]+)')
+# commands that can change register values behind the register cache
+resume_commands = ('halt', 'reset', 'resume', 'step', 'targets', 'wait_halt',
+                   'drseus_break_after')
+# runs to the given hit of a breakpoint inside OpenOCD, so each hit does not
+# cost a round trip to the debugger host
+break_after_proc = (
+    'proc drseus_break_after {address times timeout} {'
+    'bp $address 1 hw; set hit 0; '
+    'set status [catch {resume; wait_halt $timeout; incr hit; '
+    'while {$hit < $times} {step; resume; wait_halt $timeout; incr hit}} '
+    'error]; '
+    'rbp $address; '
+    'if {$status} {halt; '
+    'return -code error "drseus hits: $hit failed: $error"}; '
+    'return "drseus hits: $hit"}')
+hits_pattern = regex(r'drseus hits: (\d+)(?!\d| failed)')
 
 
 class openocd(jtag):
     error_messages = ['Timeout', 'Target not examined yet']
+    breakpoint_timeout = 60
     modes = {'10000': 'usr',
              '10001': 'fiq',
              '10010': 'irq',
@@ -55,6 +79,9 @@ class openocd(jtag):
         self.prompts = ['>']
         #RG self.port = find_open_port()
         self.port = 4444
+        self.rpc = None
+        self.register_cache = None
+        self.procs_loaded = False
         super().__init__(database, options)
         self.set_targets()
         if self.options.command == 'openocd' and self.options.gdb:
@@ -75,8 +102,8 @@ class openocd(jtag):
     def open(self):
         self.openocd = Popen([
             'openocd', '-c',
-            'gdb_port {}; tcl_port 0; telnet_port {}; interface ftdi;'.format(
-                self.gdb_port, self.port) +
+            'gdb_port {}; tcl_port {}; telnet_port {}; interface ftdi;'.format(
+                self.gdb_port, self.options.tcl_rpc or 0, self.port) +
             (' ftdi_serial {};'.format(self.device_info['ftdi'])
              if self.device_info is not None else ''),
             '-f', '{}/openocd_zedboard_{}.cfg'.format(
@@ -89,8 +116,34 @@ class openocd(jtag):
             sleep(1)
         if self.options.command != 'openocd':
             super().open()
+            self.channel = response_parser(self.telnet, self.timeout)
+            self.procs_loaded = False
+            if self.options.tcl_rpc:
+                self.connect_rpc()
+
+    def connect_rpc(self):
+        if self.rpc is not None:
+            self.rpc.close()
+        self.rpc = tcl_rpc(self.options.debugger_ip_address,
+                           self.options.tcl_rpc, self.timeout)
+        attempts = 3
+        for attempt in range(attempts):
+            try:
+                self.rpc.connect()
+            except (ConnectionRefusedError, EOFError, TimeoutError):
+                if attempt < attempts-1:
+                    sleep(1)
+                else:
+                    raise DrSEUsError('Error connecting to TCL RPC')
+            else:
+                break
+        self.db.log_event(
+            'Information', 'Debugger', 'Connected to TCL RPC', str(self.rpc))
 
     def close(self):
+        if self.rpc is not None:
+            self.rpc.close()
+            self.rpc = None
         self.telnet.write(bytes('shutdown\n', encoding='utf-8'))
         try:
             self.openocd.wait(timeout=30)
@@ -105,72 +158,219 @@ class openocd(jtag):
 
     def command(self, command, expected_output=[], error_message=None,
                 log_event=True):
-        return super().command(command, expected_output, error_message,
-                               log_event, '\n', True)
+        if command.split()[:1] and command.split()[0] in resume_commands:
+            self.register_cache = None
+        if self.rpc is None:
+            return super().command(command, expected_output, error_message,
+                                   log_event, '\n', True)
+        output = self.rpc_batch([command], error_message, log_event)[0]
+        for output_ in expected_output:
+            if output_ not in output:
+                raise DrSEUsError(error_message or command)
+        # same layout as the telnet replies, which start after the echo
+        return '\n{}\n'.format(output)
+
+    def rpc_batch(self, commands, error_message=None, log_event=True,
+                  timeout=None):
+        if log_event:
+            event = self.db.log_event(
+                'Information', 'Debugger', 'Command', '\n'.join(commands),
+                success=False)
+        if error_message is None:
+            error_message = commands[-1]
+        if any(command.split()[0] in resume_commands for command in commands):
+            self.register_cache = None
+        try:
+            outputs = self.rpc.batch(commands, timeout)
+        except tcl_rpc_error as error:
+            outputs = None
+            buff = '{}\n'.format(error)
+        except (EOFError, OSError, TimeoutError) as error:
+            # replies may still arrive for the abandoned commands
+            self.connect_rpc()
+            outputs = None
+            buff = '{}\n'.format(error)
+        else:
+            buff = ''.join('{}\n{}\n'.format(command, output.rstrip('\n'))
+                           for command, output in zip(commands, outputs))
+        self.db.log_debugger_output(buff)
+        if self.options.debug:
+            print(colored(buff, 'yellow'))
+        if outputs is None:
+            raise DrSEUsError(error_message)
+        for message in self.error_messages:
+            if message in buff:
+                raise DrSEUsError(error_message)
+        if log_event:
+            event.success = True
+            event.save()
+        return outputs
+
+    def log_channel(self):
+        if self.channel.transcript:
+            self.db.log_debugger_output(self.channel.transcript)
+            if self.options.debug:
+                print(colored(self.channel.transcript, 'yellow'))
+            self.channel.transcript = ''
 
-    # TODO: Consider changing these to use the command function in super (__init__.py)
     def start_dut(self):
-        self.telnet.write(bytes('halt\n', encoding='utf-8'))
-        self.telnet.write(bytes('resume 0x00100000\n', encoding='utf-8'))
+        self.register_cache = None
+        if self.rpc is not None:
+            self.rpc_batch(['halt', 'resume 0x00100000'], 'Error starting DUT')
+            return
+        try:
+            self.channel.replies(['halt', 'resume 0x00100000'])
+        except TimeoutError:
+            self.log_channel()
+            raise DrSEUsError('Error starting DUT')
+        self.log_channel()
+
+    # commands resume the target, which must then halt at a breakpoint, and
+    # address is the breakpoint to remove afterwards
+    def run_to_breakpoint(self, commands, address=None, log_event=True):
+        self.register_cache = None
+        remove = ['rbp {}'.format(address)] if address is not None else []
+        if self.rpc is not None:
+            try:
+                outputs = self.rpc_batch(
+                    commands + ['wait_halt {}'.format(
+                        int(self.breakpoint_timeout*1000)), 'reg pc'] +
+                    remove, 'Error breaking DUT', log_event,
+                    self.breakpoint_timeout+self.timeout)
+            except DrSEUsError:
+                self.rpc_batch(['halt'] + remove, 'Error breaking DUT')
+                raise
+            halts = parse_halts('\n'.join(outputs))
+            if halts:
+                return halts[-1]
+            pc = pc_pattern.search(outputs[len(commands)+1])
+            return halt(None, None, None, None, pc.group(1) if pc else None)
+        try:
+            self.channel.clear_halts()
+            self.channel.replies(commands)
+            halt_ = self.channel.wait_halt(self.breakpoint_timeout)
+            self.channel.replies(remove)
+        except (TimeoutError, ValueError) as error:
+            self.log_channel()
+            self.db.log_event(
+                'Warning', 'Debugger', 'Breakpoint not reached', str(error))
+            # leave the target halted with the channel back in step
+            try:
+                self.channel.resync()
+                self.channel.replies(['halt'] + remove)
+            except TimeoutError:
+                pass
+            self.log_channel()
+            raise DrSEUsError('Error breaking DUT')
+        self.log_channel()
+        return halt_
 
     # Restarts the program from the beginning, halts as specified address
     def break_dut(self, address):
-        self.telnet.write(bytes('halt\n', encoding='utf-8'))
-        self.telnet.write(bytes('bp ' + address + ' 1 hw\n', encoding='utf-8'))
-        self.telnet.write(bytes('resume 0x00100000\n', encoding='utf-8'))
-        self.telnet.read_until(b'target halted in ARM state due to breakpoint, current mode: System')
-        self.telnet.write(bytes('rbp ' + address + '\n', encoding='utf-8'))
+        return self.run_to_breakpoint(
+            ['halt', 'bp {} 1 hw'.format(address), 'resume 0x00100000'],
+            address)
+
+    def load_procs(self):
+        if self.procs_loaded:
+            return
+        try:
+            if self.rpc is not None:
+                self.rpc.evaluate(break_after_proc)
+            else:
+                self.channel.replies([break_after_proc])
+        except (EOFError, OSError, TimeoutError):
+            raise DrSEUsError('Error loading OpenOCD procedures')
+        finally:
+            if self.rpc is None:
+                self.log_channel()
+        self.procs_loaded = True
 
     # Program must be stopped already, runs until breakpoint is hit number of times
     def break_dut_after(self, address, times):
-        breaks = times
-        self.telnet.write(bytes('bp ' + address + ' 1 hw\n', encoding='utf-8'))
-        self.telnet.write(bytes('resume\n', encoding='utf-8'))
-        self.telnet.read_until(b'target halted in ARM state due to breakpoint, current mode: System')
-        breaks = breaks - 1
-        while (breaks > 0):
-            self.telnet.write(bytes('step\n', encoding='utf-8'))
-            self.telnet.write(bytes('resume\n', encoding='utf-8'))
-            self.telnet.read_until(b'target halted in ARM state due to breakpoint, current mode: System')
-            breaks = breaks -1
-        self.telnet.write(bytes('rbp ' + address + '\n', encoding='utf-8'))
+        start = perf_counter()
+        if self.options.hit_count_proc:
+            halt_ = self.break_dut_after_proc(address, times)
+        else:
+            halt_ = self.run_to_breakpoint(
+                ['bp {} 1 hw'.format(address), 'resume'],
+                address if times <= 1 else None)
+            for hit in range(1, times):
+                halt_ = self.run_to_breakpoint(
+                    ['step', 'resume'], address if hit == times-1 else None,
+                    False)
+        self.db.log_event(
+            'Information', 'Debugger', 'Reached breakpoint hit',
+            '{} hits of {} in {:.3f} seconds ({})'.format(
+                times, address, perf_counter() - start,
+                'OpenOCD procedure' if self.options.hit_count_proc
+                else 'one round trip per hit'))
+        return halt_
+
+    def break_dut_after_proc(self, address, times):
+        self.load_procs()
+        self.register_cache = None
+        command = 'drseus_break_after {} {} {}'.format(
+            address, max(times, 1), int(self.breakpoint_timeout*1000))
+        # each hit is bounded by wait_halt inside the procedure
+        timeout = self.breakpoint_timeout*max(times, 1) + self.timeout
+        if self.rpc is not None:
+            outputs = self.rpc_batch([command, 'reg pc'],
+                                     'Error breaking DUT', timeout=timeout)
+            halts = parse_halts(outputs[0])
+            if halts:
+                return halts[-1]
+            pc = pc_pattern.search(outputs[1])
+            return halt(None, None, None, None, pc.group(1) if pc else None)
+        try:
+            self.channel.clear_halts()
+            output, pc = self.channel.replies([command, 'reg pc'], timeout)
+            if not hits_pattern.search(output):
+                raise ValueError(output.strip())
+        except (TimeoutError, ValueError) as error:
+            self.log_channel()
+            self.db.log_event(
+                'Warning', 'Debugger', 'Breakpoint not reached', str(error))
+            try:
+                self.channel.resync()
+                self.channel.replies(['halt', 'rbp {}'.format(address)])
+            except TimeoutError:
+                pass
+            self.log_channel()
+            raise DrSEUsError('Error breaking DUT')
+        self.log_channel()
+        if self.channel.halts:
+            return self.channel.halts[-1]
+        pc = pc_pattern.search(pc)
+        return halt(None, None, None, None, pc.group(1) if pc else None)
 
     def single_dut_break(self, address):
         # Dut should already be halted from previous break
-        self.telnet.write(bytes('bp ' + address + ' 1 hw\n', encoding='utf-8'))
-        self.telnet.write(bytes('step\n', encoding='utf-8'))
-        self.telnet.write(bytes('resume\n', encoding='utf-8'))
-        self.telnet.read_until(b'target halted in ARM state due to breakpoint, current mode: System')
-        self.telnet.write(bytes('rbp ' + address + '\n', encoding='utf-8'))
+        return self.run_to_breakpoint(
+            ['bp {} 1 hw'.format(address), 'step', 'resume'], address)
 
     def check_cycles(self):
-        self.telnet.write(bytes('arm mrc 15 0 9 13 0\n', encoding='utf-8'))
-        # If you comment out this print, you must keep the call to read_until()
-        print("Returned 0?\n", self.telnet.read_until(b"arm mrc 15 0 9 13 0\r\n"))
-        while True:
-            retval = self.telnet.read_some()
-            print("Returned 1?: ", retval)
-            retval = retval.decode('ascii')
-
-
-            if retval is '':
-                print("Trying check_cycles again (null)")
-                retval = self.telnet.read_some()
-            elif 'Timeout' in retval:
-                print("Taking too long. Try again")
-                retval = self.telnet.read_some()
-            else:
-                try:
-                    retval = int(retval.strip().strip('>').strip('\r').strip('\n').strip('\r'))
-                    break
-                except ValueError:
-                    print("Parsing cycles failed\n")
-
-        #print("Parse problems?", retval)
-        return retval
-        # print("Returned?\n", self.telnet.read_some())
+        if self.rpc is not None:
+            match = cycles_pattern.search(self.rpc_batch(
+                ['arm mrc 15 0 9 13 0'], 'Error reading cycle counter',
+                False)[0])
+            if match is None:
+                raise DrSEUsError('Error reading cycle counter')
+            return int(match.group(1))
+        try:
+            match = self.channel.command('arm mrc 15 0 9 13 0', cycles_pattern,
+                                         retry=True)
+        except (TimeoutError, ValueError) as error:
+            self.log_channel()
+            self.db.log_event(
+                'Warning', 'Debugger', 'Error reading cycle counter',
+                str(error))
+            raise DrSEUsError('Error reading cycle counter')
+        self.log_channel()
+        return int(match.group(1))
 
     def reset_dut(self, attempts=10):
+        self.register_cache = None
         if self.power_switch:
             try:
                 super().reset_dut(
@@ -191,10 +391,11 @@ class openocd(jtag):
     def power_cycle_dut(self):
         event = self.db.log_event(
             'Information', 'Debugger', 'Power cycled DUT', success=False)
+        if self.db.metrics is not None:
+            self.db.metrics.add('power_cycles')
         self.close()
-        with self.power_switch as ps:
-            ps.set_outlet(self.device_info['outlet'], 'off')
-            ps.set_outlet(self.device_info['outlet'], 'on')
+        self.power_switch.power_cycle_batched(
+            self.device_info['outlet'])
         attempts = 5
         for attempt in range(attempts):
             try:
@@ -239,21 +440,48 @@ class openocd(jtag):
         self.command('targets zynq.cpu.{}'.format(core),
                      error_message='Error selecting core')
 
+    def get_registers(self):
+        # snapshot every register of the selected core with a single command,
+        # reused until the core runs again
+        if self.register_cache is None:
+            buff = self.command('reg', [':'], 'Error getting register values')
+            self.register_cache = {}
+            for line in buff.split('\n'):
+                match = register_pattern.match(line.strip())
+                if match:
+                    self.register_cache[match.group(1)] = match.group(2)
+        return self.register_cache
+
+    def read_register(self, register):
+        registers = self.get_registers()
+        if register not in registers:
+            buff = self.command('reg {}'.format(register), [':'],
+                                'Error getting register value')
+            registers[register] = buff.split('\n')[1].split(':')[1].split()[0]
+        return registers[register]
+
+    def write_register(self, register, value):
+        # OpenOCD replies with the value it now holds for the register, which
+        # is what reading it back would return
+        buff = self.command('reg {} {}'.format(register, value),
+                            error_message='Error setting register value')
+        if self.register_cache is not None:
+            match = register_pattern.match(buff.strip())
+            if match and match.group(1) == register:
+                self.register_cache[register] = match.group(2)
+            else:
+                self.register_cache.pop(register, None)
+
     def get_mode(self):
-        cpsr = int(self.command(
-            'reg cpsr', [':'], 'Error getting register value'
-        ).split('\n')[1].split(':')[1].split()[0], base=16)
+        cpsr = int(self.read_register('cpsr'), base=16)
         return self.modes[str(bin(cpsr))[-5:]]
 
     def set_mode(self, mode='svc'):
         modes = {value: key for key, value in self.modes.items()}
         mask = modes[mode]
-        cpsr = self.command(
-            'reg cpsr', [':'], 'Error getting register value'
-        ).split('\n')[1].split(':')[1].split()[0]
+        cpsr = self.read_register('cpsr')
         cpsr = hex(int(str(bin(int(cpsr, base=16)))[:-5]+mask, base=2))
-        self.command('reg cpsr {}'.format(cpsr),
-                     error_message='Error setting register value')
+        self.write_register('cpsr', cpsr)
         self.db.log_event(
             'Information', 'Debugger', 'Set processor mode', mode)
 
@@ -271,10 +499,7 @@ class openocd(jtag):
                 error_message='Error getting register value')
             return hex(int(buff.split('\n')[1].strip()))
         else:
-            buff = self.command('reg {}'.format(register_name), [':'],
-                                'Error getting register value')
-            return \
-                buff.split('\n')[1].split(':')[1].split()[0]
+            return self.read_register(register_name)
 
     def set_register_value(self, register_info):
         target = self.targets[register_info.target]
@@ -290,10 +515,29 @@ class openocd(jtag):
                 register['CRm'], register['Op2'], value),
                 error_message='Error setting register value')
         else:
-            self.command('reg {} {}'.format(register_name, value),
-                         error_message='Error setting register value')
+            self.write_register(register_name, value)
+
+    def get_memory_checksum(self, address, words):
+        buff = self.command('mdw {} {}'.format(address, words), [':'],
+                            'Error reading memory')
+        checksum = 0
+        for line in buff.split('\n'):
+            if ':' in line:
+                for word in line.split(':', 1)[1].split():
+                    checksum = crc32(word.encode('utf-8'), checksum)
+        return checksum
+
+    def get_register_values(self, registers):
+        return [self.read_register(register) for register in registers]
 
     def set_cycle_granularity(self):
-        self.telnet.write(bytes('arm mcr 15 0 9 12 0 1091121153\n', encoding='utf-8'))
-        response = self.telnet.read_until(b"arm mcr 15 0 9 12 0 1091121153\r\n")
-        print('Set single cycle counter granularity: %s' % (response)) # TODO: Not sure if this print makes sense...
+        if self.rpc is not None:
+            self.rpc_batch(['arm mcr 15 0 9 12 0 1091121153'],
+                           'Error setting cycle counter granularity')
+            return
+        try:
+            self.channel.command('arm mcr 15 0 9 12 0 1091121153')
+        except TimeoutError:
+            self.log_channel()
+            raise DrSEUsError('Error setting cycle counter granularity')
+        self.log_channel()
@@ -0,0 +1,112 @@
+from collections import namedtuple
+from re import MULTILINE, compile as regex, escape
+from time import perf_counter
+
+halt = namedtuple('halt', ['state', 'reason', 'mode', 'cpsr', 'pc'])
+
+halt_pattern = regex(
+    r'target halted in (\w+) state due to ([\w-]+), current mode: '
+    r'([\w ]+?)\s*\r?\n\s*cpsr: (0x[0-9a-fA-F]+) pc: (0x[0-9a-fA-F]+)\r?\n')
+cycles_pattern = regex(r'^\s*(\d+)\s*$', MULTILINE)
+pc_pattern = regex(r'pc \(/32\): (0x[0-9a-fA-F]+)')
+
+
+def parse_halts(text):
+    return [halt(*match.groups()) for match in halt_pattern.finditer(text)]
+
+
+class response_parser(object):
+    def __init__(self, telnet, timeout=30, attempts=3, prompt='> '):
+        self.telnet = telnet
+        self.timeout = timeout
+        self.attempts = attempts
+        self.prompt = prompt
+        self.halts = []
+        self.transcript = ''
+
+    def record(self, buff):
+        text = buff.decode('utf-8', 'replace')
+        self.transcript += text
+        # halt messages are asynchronous and can arrive inside any reply
+        self.halts.extend(parse_halts(text))
+        return text
+
+    def remaining(self, deadline):
+        remaining = deadline - perf_counter()
+        if remaining <= 0:
+            raise TimeoutError('Timeout waiting for debugger')
+        return remaining
+
+    def drain(self):
+        self.record(self.telnet.read_very_eager())
+
+    def resync(self):
+        # a blank line gets a fresh prompt, after which the channel is back in
+        # step without restarting OpenOCD
+        deadline = perf_counter() + self.timeout
+        self.drain()
+        self.telnet.write(b'\n')
+        index, match, buff = self.telnet.expect(
+            [bytes(self.prompt, encoding='utf-8')], self.remaining(deadline))
+        self.record(buff)
+        self.drain()
+
+    def replies(self, commands, timeout=None):
+        # commands are written together and their replies are framed by the
+        # echo and the following prompt
+        deadline = perf_counter() + (timeout or self.timeout)
+        self.drain()
+        self.telnet.write(bytes(''.join('{}\n'.format(command)
+                                        for command in commands),
+                                encoding='utf-8'))
+        replies = []
+        for command in commands:
+            pattern = regex(bytes(
+                escape(command) + r'[ \t]*\r?\n((?:[^\n]*\n)*?)' +
+                escape(self.prompt), encoding='utf-8'))
+            index, match, buff = self.telnet.expect(
+                [pattern], self.remaining(deadline))
+            self.record(buff)
+            if index < 0:
+                raise TimeoutError('Timeout waiting for "{}"'.format(command))
+            replies.append(match.group(1).decode(
+                'utf-8', 'replace').replace('\r', ''))
+        return replies
+
+    def command(self, command, pattern=None, timeout=None, retry=False):
+        # only commands without side effects are retried
+        attempts = self.attempts if retry else 1
+        for attempt in range(attempts):
+            try:
+                reply = self.replies([command], timeout)[0]
+            except TimeoutError:
+                if attempt == attempts-1:
+                    raise
+                self.resync()
+                continue
+            if pattern is None:
+                return reply
+            match = pattern.search(reply)
+            if match:
+                return match
+            if attempt == attempts-1:
+                raise ValueError('Could not parse reply to "{}": {}'.format(
+                    command, reply.strip()))
+
+    def clear_halts(self):
+        self.drain()
+        self.halts = []
+
+    def wait_halt(self, timeout=None, reason='breakpoint'):
+        deadline = perf_counter() + (timeout or self.timeout)
+        while True:
+            while self.halts:
+                halt_ = self.halts.pop(0)
+                if reason is None or halt_.reason == reason:
+                    return halt_
+            index, match, buff = self.telnet.expect(
+                [halt_pattern.pattern.encode('utf-8')],
+                self.remaining(deadline))
+            self.record(buff)
+            if index < 0:
+                raise TimeoutError('Timeout waiting for target to halt')
@@ -0,0 +1,83 @@
+from select import select
+from socket import IPPROTO_TCP, TCP_NODELAY, create_connection
+from time import perf_counter
+
+separator = b'\x1a'
+# wraps each command so its printed output is returned and errors are marked
+# instead of being indistinguishable from output
+wrapper = ('proc drseus_rpc {command} {'
+           'set status [catch {capture $command} result]; '
+           'return "$status\\n$result"}')
+
+
+class tcl_rpc_error(Exception):
+    pass
+
+
+class tcl_rpc(object):
+    def __init__(self, address, port, timeout=30):
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self.socket = None
+        self.buffer = b''
+        self.stats = {'commands': 0, 'round_trips': 0, 'latency': 0}
+
+    def __str__(self):
+        return 'OpenOCD TCL RPC at {}:{}'.format(self.address, self.port)
+
+    def connect(self):
+        self.socket = create_connection((self.address, self.port),
+                                        self.timeout)
+        self.socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        self.buffer = b''
+        self.evaluate(wrapper)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def send(self, command):
+        self.socket.sendall(command.encode('utf-8') + separator)
+
+    def receive(self, timeout=None):
+        deadline = perf_counter() + (self.timeout if timeout is None
+                                     else timeout)
+        while separator not in self.buffer:
+            remaining = deadline - perf_counter()
+            if remaining <= 0 or not select([self.socket], [], [],
+                                             remaining)[0]:
+                raise TimeoutError('Timeout reading from {}'.format(self))
+            data = self.socket.recv(65536)
+            if not data:
+                raise EOFError('{} closed the connection'.format(self))
+            self.buffer += data
+        reply, self.buffer = self.buffer.split(separator, 1)
+        return reply.decode('utf-8', 'replace')
+
+    def evaluate(self, script):
+        self.send(script)
+        return self.receive()
+
+    def parse(self, command, reply):
+        status, output = (reply.split('\n', 1) + [''])[:2]
+        if status != '0':
+            raise tcl_rpc_error('{}: {}'.format(command, output.strip()))
+        return output
+
+    def batch(self, commands, timeout=None):
+        # all commands are written before reading any replies, so a batch
+        # costs a single round trip
+        start = perf_counter()
+        for command in commands:
+            self.send('drseus_rpc {{{}}}'.format(command))
+        replies = [self.receive(timeout) for command in commands]
+        self.stats['commands'] += len(commands)
+        self.stats['round_trips'] += 1
+        self.stats['latency'] += perf_counter() - start
+        return [self.parse(command, reply)
+                for command, reply in zip(commands, replies)]
+
+    def command(self, command, timeout=None):
+        return self.batch([command], timeout)[0]
@@ -7,6 +7,7 @@ from numpy import convolve, ones
 from time import perf_counter
 from traceback import extract_stack
 
+from ...timing import phases
 from .. import fix_sort
 
 colors = {
@@ -57,6 +58,17 @@ colors = {
     'Error finding port or pseudoterminal': '#610b0b',
     'Error getting register value': '#8a0808',
     'Error injecting fault': '#b40404',
+
+    'reset': '#7cb5ec',
+    'boot': '#434348',
+    'send_files': '#90ed7d',
+    'inject': '#f7a35c',
+    'breakpoints': '#8085e9',
+    'execution': '#33cc70',
+    'check_output': '#e4d354',
+    'get_logs': '#2b908f',
+    'latent': '#a18069',
+    'database': '#f45b5b',
 }
 
 
@@ -442,3 +454,72 @@ def create_chart(chart_list, chart_data, chart_title, order=0, injections=None,
                        'percent': percent, 'smooth': smooth,
                        'title': chart_title})
     print(chart_id, round(perf_counter()-start, 2), 'seconds')
+
+
+def create_phase_chart(chart_list, chart_data, chart_title, order=0,
+                       results=None, success=False, **kwargs):
+    start = perf_counter()
+    chart_id = str(extract_stack()[-2][-2])
+    if success:
+        return
+    results = results.filter(timing__isnull=False)
+    averages = {'{}_avg'.format(phase): Avg('timing__{}'.format(phase))
+                for phase in phases}
+    boards = [('All', results.aggregate(**averages))]
+    for board in results.values('dut_serial_port').distinct().annotate(
+            **averages).order_by('dut_serial_port'):
+        boards.append((board['dut_serial_port'], board))
+    if boards[0][1]['reset_avg'] is None:
+        return
+    chart = {
+        'chart': {
+            'renderTo': chart_id,
+            'type': 'column',
+            'zoomType': 'xy'
+        },
+        'credits': {
+            'enabled': False
+        },
+        'exporting': {
+            'filename': chart_id,
+            'sourceWidth': 640,
+            'sourceHeight': 480,
+            'scale': 4
+        },
+        'plotOptions': {
+            'column': {
+                'stacking': 'normal'
+            }
+        },
+        'series': [],
+        'title': {
+            'text': None
+        },
+        'xAxis': {
+            'categories': [str(board) for board, averages in boards],
+            'title': {
+                'text': 'DUT Serial Port'
+            }
+        },
+        'yAxis': {
+            'title': {
+                'text': 'Average Seconds per Iteration'
+            }
+        }
+    }
+    for phase in phases:
+        chart['series'].append({
+            'color': colors[phase],
+            'data': [round(averages['{}_avg'.format(phase)] or 0, 3)
+                     for board, averages in boards],
+            'name': phase})
+    chart_percent = deepcopy(chart)
+    chart_percent['chart']['renderTo'] = '{}_percent'.format(chart_id)
+    chart_percent['plotOptions']['column']['stacking'] = 'percent'
+    chart_percent['yAxis']['labels'] = {'format': '{value}%'}
+    chart_data.extend([dumps(chart, indent=4),
+                       dumps(chart_percent, indent=4)])
+    chart_list.append({'id': chart_id, 'log': False, 'order': order,
+                       'percent': True, 'smooth': False,
+                       'title': chart_title})
+    print(chart_id, round(perf_counter()-start, 2), 'seconds')
@@ -2,7 +2,7 @@ from django.db.models import Avg, StdDev
 from django.db.models import Max
 from numpy import linspace
 
-from . import create_chart
+from . import create_chart, create_phase_chart
 
 
 def overview(**kwargs):
@@ -289,3 +289,9 @@ def memory_propagation_combined(**kwargs):
                  average='result__num_memory_diffs',
                  log=True,
                  **kwargs)
+
+
+def phase_times_by_board(**kwargs):
+    create_phase_chart(order=22,
+                       chart_title='Iteration Time By Phase',
+                       **kwargs)
@@ -1,7 +1,35 @@
+from json import dumps, loads
+
 from django.contrib.postgres.fields import ArrayField
 from django.db.models import (BooleanField, BigIntegerField, DateTimeField,
                               FloatField, ForeignKey, IntegerField, Model,
-                              NullBooleanField, TextField)
+                              NullBooleanField, OneToOneField, SET_NULL,
+                              TextField)
+
+
+class array_field(ArrayField):
+    # stored as JSON text in other databases (e.g. the SQLite scratch database
+    # of a distributed agent)
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return super().db_type(connection)
+        return 'text'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if connection.vendor == 'postgresql' or value is None:
+            return value
+        return dumps(value)
+
+    def from_db_value(self, value, expression, connection, context):
+        if isinstance(value, str):
+            return loads(value)
+        return value
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        return name, 'django.contrib.postgres.fields.ArrayField', args, kwargs
 
 
 class campaign(Model):
@@ -10,7 +38,7 @@ class campaign(Model):
     aux_command = TextField(null=True)
     aux_output = TextField(default=str)
     aux_output_file = BooleanField(default=False)
-    aux_log_files = ArrayField(TextField(), default=list)
+    aux_log_files = array_field(TextField(), default=list)
     checkpoints = IntegerField(null=True)
     command = TextField(default=str)
     cycles = BigIntegerField(null=True)
@@ -21,7 +49,7 @@ class campaign(Model):
     execution_time = FloatField(null=True)
     kill_dut = BooleanField(default=False)
     kill_aux = BooleanField(default=False)
-    log_files = ArrayField(TextField(), default=list)
+    log_files = array_field(TextField(), default=list)
     output_file = TextField(null=True)
     rsakey = TextField()
     simics = BooleanField()
@@ -72,7 +100,7 @@ class injection(Model):
     register = TextField(null=True)
     register_access = TextField(null=True)
     register_alias = TextField(null=True)
-    register_index = ArrayField(IntegerField(), null=True)
+    register_index = array_field(IntegerField(), null=True)
     result = ForeignKey(result)
     success = BooleanField()
     target = TextField(null=True)
@@ -81,6 +109,37 @@ class injection(Model):
     time = FloatField(null=True)
     timestamp = DateTimeField(auto_now_add=True)
     tlb_entry = TextField(null=True)
+    # fraction of the fault space an injection sampled from a subset of it
+    # stands for
+    weight = FloatField(null=True)
+
+
+class iteration(Model):
+    assigned = DateTimeField(null=True)
+    campaign = ForeignKey(campaign)
+    completed = DateTimeField(null=True)
+    dut_serial_port = TextField(null=True)
+    number = IntegerField()
+    result = ForeignKey(result, null=True, on_delete=SET_NULL)
+    seed = BigIntegerField()
+    status = TextField(default='planned')
+
+    class Meta:
+        index_together = [('campaign', 'status', 'number')]
+
+
+class timing(Model):
+    boot = FloatField(default=0)
+    breakpoints = FloatField(default=0)
+    check_output = FloatField(default=0)
+    database = FloatField(default=0)
+    execution = FloatField(default=0)
+    get_logs = FloatField(default=0)
+    inject = FloatField(default=0)
+    latent = FloatField(default=0)
+    reset = FloatField(default=0)
+    result = OneToOneField(result)
+    send_files = FloatField(default=0)
 
 
 class simics_register_diff(Model):
@@ -234,7 +234,7 @@ class injection(Table):
     class Meta:
         fields = ('timestamp', 'time', 'checkpoint', 'target_name', 'register',
                   'register_index', 'bit', 'field', 'register_access',
-                  'gold_value', 'injected_value', 'success_')
+                  'gold_value', 'injected_value', 'weight', 'success_')
         model = models.injection
         order_by = 'id'
         template = 'django_tables2/bootstrap.html'
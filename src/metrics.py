@@ -0,0 +1,148 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing import Array
+from threading import Thread
+from time import time
+
+from .database import get_iteration_progress
+from .timing import phases
+
+outcome_categories = ('No error', 'Execution error', 'Post execution error',
+                      'AUX execution error', 'Data error', 'Debugger error',
+                      'Simics error', 'Incomplete', 'Other')
+
+# each injector process owns one slot of counters in shared memory, so
+# updates are plain stores without any locking or interprocess messages
+fields = (('started', 'iterations', 'serial_bytes', 'resets', 'power_cycles',
+           'database_writes') +
+          tuple('outcome {}'.format(category)
+                for category in outcome_categories) +
+          tuple('phase {}'.format(phase) for phase in phases))
+field_index = {field: index for index, field in enumerate(fields)}
+board_length = 64
+
+
+class metrics(object):
+    def __init__(self, slots=1):
+        self.slots = slots
+        self.slot = 0
+        self.values = Array('d', slots*len(fields), lock=False)
+        self.boards = Array('c', slots*board_length, lock=False)
+
+    def assign(self, slot, board):
+        self.slot = slot
+        board = str(board).encode('utf-8')[:board_length]
+        start = slot*board_length
+        self.boards[start:start+board_length] = \
+            board.ljust(board_length, b'\x00')
+        self.values[slot*len(fields)+field_index['started']] = time()
+
+    def add(self, field, value=1):
+        self.values[self.slot*len(fields)+field_index[field]] += value
+
+    def log_result(self, outcome_category, phase_times):
+        self.add('iterations')
+        if outcome_category not in outcome_categories:
+            outcome_category = 'Other'
+        self.add('outcome {}'.format(outcome_category))
+        for phase, seconds in phase_times.items():
+            self.add('phase {}'.format(phase), seconds)
+
+    def __get_slots(self):
+        slots = []
+        for slot in range(self.slots):
+            values = dict(zip(fields, self.values[
+                slot*len(fields):(slot+1)*len(fields)]))
+            if not values['started']:
+                continue
+            board = self.boards[
+                slot*board_length:(slot+1)*board_length].rstrip(b'\x00')
+            slots.append((board.decode('utf-8', 'replace'), values))
+        return slots
+
+    def exposition(self, campaign):
+
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+        def metric(name, type_, help_, samples):
+            lines.append('# HELP drseus_{} {}'.format(name, help_))
+            lines.append('# TYPE drseus_{} {}'.format(name, type_))
+            for labels, value in samples:
+                lines.append('drseus_{}{{{}}} {}'.format(name, ','.join(
+                    '{}="{}"'.format(key, label(value_))
+                    for key, value_ in labels), repr(float(value))))
+
+        lines = []
+        now = time()
+        slots = self.__get_slots()
+        progress = get_iteration_progress(campaign)
+        campaign_label = [('campaign', campaign.id)]
+        metric('iterations_completed', 'gauge',
+               'Iterations completed for the campaign',
+               [(campaign_label, progress['completed'])])
+        metric('iterations_remaining', 'gauge',
+               'Iterations planned but not yet performed',
+               [(campaign_label, progress['planned'])])
+        metric('iterations_assigned', 'gauge',
+               'Iterations currently being performed',
+               [(campaign_label, progress['assigned'])])
+        metric('iterations_total', 'counter',
+               'Iterations logged by this injector',
+               [([('board', board)], values['iterations'])
+                for board, values in slots])
+        metric('iterations_per_hour', 'gauge',
+               'Iterations logged per hour since the injector started',
+               [([('board', board)],
+                 values['iterations']*3600/max(now-values['started'], 1))
+                for board, values in slots])
+        metric('outcomes_total', 'counter',
+               'Iterations logged by outcome category',
+               [([('board', board), ('category', category)],
+                 values['outcome {}'.format(category)])
+                for board, values in slots
+                for category in outcome_categories])
+        metric('phase_seconds_mean', 'gauge',
+               'Mean seconds per iteration spent in each phase',
+               [([('board', board), ('phase', phase)],
+                 values['phase {}'.format(phase)] /
+                 max(values['iterations'], 1))
+                for board, values in slots for phase in phases])
+        metric('database_write_seconds_mean', 'gauge',
+               'Mean seconds per database write',
+               [([('board', board)],
+                 values['phase database']/max(values['database_writes'], 1))
+                for board, values in slots])
+        metric('serial_bytes_total', 'counter',
+               'Bytes read from the DUT serial port',
+               [([('board', board)], values['serial_bytes'])
+                for board, values in slots])
+        metric('resets_total', 'counter', 'DUT resets',
+               [([('board', board)], values['resets'])
+                for board, values in slots])
+        metric('power_cycles_total', 'counter', 'DUT power cycles',
+               [([('board', board)], values['power_cycles'])
+                for board, values in slots])
+        return '\n'.join(lines)+'\n'
+
+    def serve(self, port, campaign):
+        metrics = self
+
+        class handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.exposition(campaign).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('', port), handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
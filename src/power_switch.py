@@ -1,31 +1,80 @@
+from atexit import register
 from base64 import b64encode
+from contextlib import contextmanager
 from datetime import datetime
+from fcntl import LOCK_EX, LOCK_UN, flock
 from html.parser import HTMLParser
-from multiprocessing import Lock
-from os.path import exists
+from os import getpid
+from os.path import exists, join
+from tempfile import gettempdir
 from terminaltables import AsciiTable
-from time import sleep
+from threading import local
+from time import perf_counter, sleep
+from uuid import uuid4
 from urllib.request import Request, urlopen
 
 
 class power_switch(object):
+    # seconds a power cycle request waits for other boards failing at the same
+    # time before taking the switch
+    batch_window = 1
+
     def __init__(self, options):
         self.ip_address = options.power_switch_ip_address
         self.username = options.power_switch_username
         self.password = options.power_switch_password
+        self.cache_time = getattr(options, 'power_switch_cache', 2)
         self.outlets = range(1, 9)
-        self.lock = Lock()
+        # the lock file is shared by every process using this switch, including
+        # forked injection processes and separate drseus instances
+        self.lock_file = join(gettempdir(), 'drseus-power-switch-{}.lock'.format(
+            self.ip_address.replace(':', '-').replace('/', '-')))
+        self.held = local()
+        self.status = None
+        self.status_time = 0
+        self.log = None
+        # outlets waiting for a power cycle, queued by every process using
+        # this switch
+        self.pending_file = self.lock_file[:-len('.lock')]+'.pending'
+        register(self.close)
 
     def __enter__(self):
-        self.lock.acquire()
+        # reentrant within a thread, exclusive between threads and processes
+        if getattr(self.held, 'depth', 0):
+            self.held.depth += 1
+            return self
+        self.held.file = open(self.lock_file, 'a')
+        flock(self.held.file, LOCK_EX)
+        self.held.depth = 1
+        # another process may have changed the outlets while waiting
+        self.status = None
         return self
 
     def __exit__(self, type_, value, traceback):
-        self.lock.release()
+        self.held.depth -= 1
+        if not self.held.depth:
+            flock(self.held.file, LOCK_UN)
+            self.held.file.close()
         if type_ is not None or value is not None or traceback is not None:
             return False  # reraise exception
 
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def request(self, path):
+        return urlopen(Request(
+            'http://{}/{}'.format(self.ip_address, path),
+            headers={'Authorization': b'Basic '+b64encode(bytes('{}:{}'.format(
+                self.username, self.password), encoding='utf-8'))}),
+            timeout=30)
+
     def get_status(self):
+        if self.status is not None and \
+                perf_counter() - self.status_time < self.cache_time:
+            return [dict(outlet) for outlet in self.status]
+
         class table_parser(HTMLParser):
             def __init__(self):
                 HTMLParser.__init__(self)
@@ -56,11 +105,7 @@ class power_switch(object):
                     self.tables.append(self.__current_table)
                     self.__current_table = []
 
-    # def get_status(self):
-        response = urlopen(Request(
-            'http://{}/index.htm'.format(self.ip_address),
-            headers={'Authorization': b'Basic '+b64encode(bytes('{}:{}'.format(
-                self.username, self.password), encoding='utf-8'))}))
+        response = self.request('index.htm')
         parser = table_parser()
         parser.feed(response.read().decode())
         for table in parser.tables:
@@ -71,7 +116,9 @@ class power_switch(object):
                         'outlet': int(row[0]),
                         'device': row[1],
                         'status': row[2]})
-                return status
+                self.status = status
+                self.status_time = perf_counter()
+                return [dict(outlet) for outlet in status]
         else:
             raise Exception('Could not parse outlet status table from response')
 
@@ -84,36 +131,48 @@ class power_switch(object):
                                      outlet['status']])
         print(table.table)
 
-    def set_outlet(self, outlet, state, delay=5):
-        if outlet == 'all':
-            outlet = 'a'
-        elif outlet not in self.outlets:
-            raise Exception('invalid outlet: {}'.format(outlet))
+    def write_log(self, outlet, state):
+        if self.log is None:
+            new = not exists('power_switch_log.txt')
+            self.log = open('power_switch_log.txt', 'a', buffering=1)
+            if new:
+                self.log.write('Outlet\tState\tTimestamp\n')
+        self.log.write('{}\t\t{}\t\t{}\n'.format(
+            outlet, state, datetime.now().strftime('%b %d, %Y %I:%M:%S %p')))
+
+    def set_outlets(self, outlets, state, delay=5):
+        outlets = list(outlets)
+        if not outlets:
+            return
+        for outlet in outlets:
+            if outlet != 'all' and outlet not in self.outlets:
+                raise Exception('invalid outlet: {}'.format(outlet))
         state = state.upper()
         if state not in ('OFF', 'ON'):
             raise Exception('invalid state: {}'.format(state))
         if delay < 1:
             delay = 1
-        urlopen(Request(
-            'http://{}/outlet?{}={}'.format(self.ip_address, outlet, state),
-            headers={'Authorization': b'Basic '+b64encode(bytes('{}:{}'.format(
-                self.username, self.password), encoding='utf-8'))}))
-        if exists('power_switch_log.txt'):
-            log = open('power_switch_log.txt', 'a')
-        else:
-            log = open('power_switch_log.txt', 'w')
-            log.write('Outlet\tState\tTimestamp\n')
-        log.write('{}\t\t{}\t\t{}\n'.format(
-            outlet, state, datetime.now().strftime('%b %d, %Y %I:%M:%S %p')))
-        log.close()
+        if 'all' in outlets or set(outlets) == set(self.outlets):
+            outlets = ['a']
+        for outlet in outlets:
+            self.request('outlet?{}={}'.format(outlet, state))
+            self.write_log(outlet, state)
+            if self.status is not None:
+                for status in self.status:
+                    if outlet in ('a', status['outlet']):
+                        status['status'] = state
+        # every outlet in the batch settles during the same delay
         sleep(delay)
 
+    def set_outlet(self, outlet, state, delay=5):
+        self.set_outlets([outlet], state, delay)
+
     def set_device(self, device, state, delay=5):
         if '*' in device:
             device = device.replace('*', '').lower()
-            for outlet in self.get_status():
-                if device in outlet['device'].lower():
-                    self.set_outlet(outlet['outlet'], state, delay)
+            self.set_outlets([outlet['outlet'] for outlet in self.get_status()
+                              if device in outlet['device'].lower()],
+                             state, delay)
         elif device == 'all':
             self.set_outlet('all', state, delay)
         else:
@@ -121,3 +180,46 @@ class power_switch(object):
                 if outlet['device'].lower() == device.lower():
                     self.set_outlet(outlet['outlet'], state, delay)
                     break
+
+    def power_cycle(self, outlets, delay=5):
+        with self:
+            self.set_outlets(outlets, 'off', delay)
+            self.set_outlets(outlets, 'on', delay)
+
+    @contextmanager
+    def pending_requests(self):
+        with open(self.pending_file, 'a+') as pending:
+            flock(pending, LOCK_EX)
+            try:
+                pending.seek(0)
+                yield pending
+            finally:
+                flock(pending, LOCK_UN)
+
+    def power_cycle_batched(self, outlet, delay=5):
+        # the request is queued for every process using the switch, and the
+        # first process to get the switch after the batch window cycles all
+        # queued outlets together, so boards failing at the same time restart
+        # together and the others find their request already served
+        request = '{} {} {}\n'.format(getpid(), uuid4().hex, outlet)
+        with self.pending_requests() as pending:
+            pending.write(request)
+        sleep(self.batch_window)
+        with self:
+            with self.pending_requests() as pending:
+                requests = pending.readlines()
+                if request not in requests:
+                    return
+                pending.truncate(0)
+            outlets = set()
+            for line in requests:
+                outlet = line.split()[2]
+                outlets.add(int(outlet) if outlet.isdigit() else outlet)
+            try:
+                self.power_cycle(sorted(outlets, key=str), delay)
+            except Exception:
+                # the other processes retry their own requests
+                with self.pending_requests() as pending:
+                    pending.writelines(line for line in requests
+                                       if line != request)
+                raise
@@ -1,6 +1,6 @@
 from datetime import datetime
 from os import getcwd, listdir, makedirs, mkdir
-from os.path import exists, join
+from os.path import abspath, exists, join
 from random import choice
 from re import findall
 from shutil import copyfile
@@ -9,13 +9,14 @@ from subprocess import call, check_call, check_output, DEVNULL, PIPE, Popen
 from sys import stdout
 from termcolor import colored
 from threading import Thread
-from time import sleep
+from time import perf_counter, sleep
 
 from ..dut import dut
 from ..error import DrSEUsError
 from ..targets import choose_injection, get_num_bits, get_targets
 from ..timeout import timeout, TimeoutException
 from .config import simics_config
+from .pool import simics_pool
 
 
 class simics(object):
@@ -27,6 +28,7 @@ class simics(object):
 
     def __init__(self, database, options):
         self.simics = None
+        self.worker = None
         self.dut = None
         self.aux = None
         self.running = False
@@ -37,6 +39,13 @@ class simics(object):
         elif database.campaign.architecture == 'a9':
             self.board = 'a9x2'
         self.set_targets()
+        if hasattr(options, 'simics_pool') and options.simics_pool:
+            self.pool = simics_pool(
+                self.__simics_command(), self.__simics_cwd(),
+                options.simics_pool, options.simics_reuse,
+                options.simics_clear, error_messages=self.error_messages)
+        else:
+            self.pool = None
 
     def __str__(self):
         return 'Simics simulation of {}'.format(self.board)
@@ -57,14 +66,23 @@ class simics(object):
             self.targets = get_targets('a9', 'simics', selected_targets,
                                        selected_registers)
 
-    def launch_simics(self, checkpoint=None):
-        cwd = '{}/simics-workspace'.format(getcwd())
+    def __simics_cwd(self):
+        return '{}/simics-workspace'.format(getcwd())
+
+    def __simics_command(self):
+        if hasattr(self.options, 'simics_binary') and \
+                self.options.simics_binary:
+            simics = abspath(self.options.simics_binary)
+        else:
+            simics = '{}/simics'.format(self.__simics_cwd())
+        return [simics, '-no-win', '-no-gui', '-q']
+
+    def __spawn_simics(self):
         attempts = 10
         for attempt in range(attempts):
             self.simics = Popen(
-                ['{}/simics'.format(cwd), '-no-win', '-no-gui', '-q'],
-                bufsize=0, cwd=cwd, universal_newlines=True,
-                stdin=PIPE, stdout=PIPE)
+                self.__simics_command(), bufsize=0, cwd=self.__simics_cwd(),
+                universal_newlines=True, stdin=PIPE, stdout=PIPE)
             try:
                 self.__command()
             except KeyboardInterrupt:
@@ -78,6 +96,20 @@ class simics(object):
                 self.db.log_event(
                     'Information', 'Simics', 'Launched Simics')
                 break
+
+    def launch_simics(self, checkpoint=None):
+        if self.pool is not None and checkpoint is not None:
+            start = perf_counter()
+            self.worker = self.pool.acquire()
+            if self.worker is None:
+                raise DrSEUsError('Error launching Simics')
+            self.simics = self.worker.process
+            self.db.log_event(
+                'Information', 'Simics', 'Launched Simics from pool',
+                '{} in {:.3f} seconds, {}'.format(
+                    self.worker, perf_counter()-start, self.pool))
+        else:
+            self.__spawn_simics()
         # TODO: Simics fails down there if no license \/
         if checkpoint is None:
             self.__command('$drseus=TRUE')
@@ -230,6 +262,19 @@ class simics(object):
             if self.aux:
                 self.aux.close()
                 self.aux = None
+            if self.worker is not None:
+                # pooled workers are cleared for reuse instead of quitting
+                try:
+                    self.halt_dut()
+                except DrSEUsError:
+                    self.worker.uses = self.options.simics_reuse
+                self.pool.release(self.worker)
+                self.db.log_event(
+                    'Information', 'Simics', 'Returned Simics to pool',
+                    str(self.pool))
+                self.worker = None
+                self.simics = None
+                return
             try:
                 self.halt_dut()
                 self.__command('quit')
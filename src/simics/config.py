@@ -1,3 +1,4 @@
+from os import getcwd, listdir
 from ply import lex, yacc
 
 
@@ -263,3 +264,20 @@ class simics_config(object):
     def __exit__(self, type_, value, traceback):
         if type_ is not None or value is not None or traceback is not None:
             return False  # reraise exception
+
+
+def update_checkpoint_dependencies(campaign_id):
+    for checkpoint in listdir('simics-workspace/gold-checkpoints/{}'.format(
+            campaign_id)):
+        with simics_config('simics-workspace/gold-checkpoints/{}/{}'.format(
+                campaign_id, checkpoint)) as config:
+            paths = config.get(config, 'sim', 'checkpoint_path')
+            new_paths = []
+            for path in paths:
+                path_list = path.split('/')
+                path_list = path_list[path_list.index('simics-workspace'):]
+                path_list[-2] = str(campaign_id)
+                new_paths.append('"{}/{}'.format(getcwd(),
+                                                 '/'.join(path_list)))
+            config.set(config, 'sim', 'checkpoint_path', new_paths)
+            config.save()
@@ -0,0 +1,176 @@
+from atexit import register
+from os import read
+from queue import Empty, Queue
+from select import select
+from subprocess import PIPE, Popen
+from threading import Lock, Thread
+from time import perf_counter, sleep
+
+prompt = 'simics> '
+
+
+class simics_worker(object):
+    def __init__(self, command, cwd):
+        self.uses = 0
+        self.process = Popen(command, bufsize=0, cwd=cwd,
+                             universal_newlines=True, stdin=PIPE, stdout=PIPE)
+
+    def __str__(self):
+        return 'Simics worker {} ({} uses)'.format(self.process.pid,
+                                                   self.uses)
+
+    # reads without the SIGALRM based timeout so workers can be launched and
+    # checked from the replenishing thread
+    def read_prompt(self, time):
+        buff = ''
+        deadline = perf_counter() + time
+        while not buff.endswith(prompt):
+            remaining = deadline - perf_counter()
+            if remaining <= 0 or not select(
+                    [self.process.stdout], [], [], remaining)[0]:
+                raise TimeoutError('Timeout reading from Simics')
+            data = read(self.process.stdout.fileno(), 4096)
+            if not data:
+                raise EOFError('Simics exited')
+            buff += data.decode('utf-8', 'replace')
+        return buff
+
+    def command(self, command, time=10):
+        self.process.stdin.write('{}\n'.format(command))
+        return self.read_prompt(time)
+
+    def healthy(self, time=10):
+        if self.process.poll() is not None:
+            return False
+        try:
+            self.command('', time)
+        except (EOFError, OSError, TimeoutError):
+            return False
+        return True
+
+    def quit(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.write('quit\n')
+                self.process.wait(10)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+
+
+class simics_pool(object):
+    def __init__(self, command, cwd, size=1, max_uses=10, clear_command=None,
+                 launch_time=300, error_messages=()):
+        self.command = command
+        self.cwd = cwd
+        self.size = size
+        self.max_uses = max_uses
+        self.clear_command = clear_command
+        self.launch_time = launch_time
+        self.error_messages = error_messages
+        self.idle = Queue()
+        self.launching = 0
+        self.lock = Lock()
+        self.closed = False
+        self.stats = {'launched': 0, 'reused': 0, 'recycled': 0,
+                      'unhealthy': 0}
+        register(self.close)
+        self.replenish()
+
+    def __str__(self):
+        return ('Simics pool: {} idle, {launched} launched, {reused} reused, '
+                '{recycled} recycled, {unhealthy} unhealthy').format(
+                    self.idle.qsize(), **self.stats)
+
+    def launch(self):
+        # launching includes waiting for the license check, which is the
+        # slow part of starting Simics
+        attempts = 10
+        for attempt in range(attempts):
+            worker = simics_worker(self.command, self.cwd)
+            try:
+                worker.read_prompt(self.launch_time)
+            except (EOFError, OSError, TimeoutError):
+                worker.process.kill()
+                worker.process.wait()
+                if attempt < attempts-1 and not self.closed:
+                    sleep(30)
+                    continue
+                return None
+            with self.lock:
+                self.stats['launched'] += 1
+            return worker
+
+    def replenish(self):
+
+        def launch_worker():
+            worker = self.launch()
+            with self.lock:
+                self.launching -= 1
+            if worker is None:
+                return
+            if self.closed:
+                worker.quit()
+            else:
+                self.idle.put(worker)
+
+        with self.lock:
+            missing = self.size - self.idle.qsize() - self.launching
+            self.launching += max(missing, 0)
+        for i in range(missing):
+            Thread(target=launch_worker, daemon=True).start()
+
+    def acquire(self):
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except Empty:
+                with self.lock:
+                    launching = self.launching
+                worker = None
+                if launching:
+                    try:
+                        worker = self.idle.get(timeout=self.launch_time)
+                    except Empty:
+                        pass
+                if worker is None:
+                    worker = self.launch()
+                    if worker is None:
+                        return None
+            if worker.healthy():
+                break
+            with self.lock:
+                self.stats['unhealthy'] += 1
+            worker.quit()
+        worker.uses += 1
+        if worker.uses > 1:
+            with self.lock:
+                self.stats['reused'] += 1
+        self.replenish()
+        return worker
+
+    def release(self, worker):
+        if not self.closed and worker.uses < self.max_uses and \
+                self.clear_command and worker.process.poll() is None:
+            try:
+                buff = worker.command(self.clear_command)
+            except (EOFError, OSError, TimeoutError):
+                pass
+            else:
+                if not any(message in buff
+                           for message in self.error_messages) and \
+                        worker.healthy():
+                    self.idle.put(worker)
+                    return
+        with self.lock:
+            self.stats['recycled'] += 1
+        worker.quit()
+        self.replenish()
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().quit()
+            except Empty:
+                break
@@ -1,14 +1,87 @@
 import subprocess
 import re
-from os import makedirs, remove
-from os.path import isfile
+from csv import writer as csv_writer
+from itertools import islice
+from json import dumps, loads
+from random import randrange
+from os import getpid, makedirs, remove
+from os.path import abspath, isfile
+from socket import AF_INET, SOCK_STREAM, SO_REUSEADDR, SOL_SOCKET, socket
+from sys import stdin
 from termcolor import colored, cprint
-from sqlite3 import connect
+from sqlite3 import OperationalError, connect
+from time import perf_counter
+from urllib.request import pathname2url
 # from .jtag.openocd import openocd
 from time import sleep
 
+from .cache_simulator import cache_simulator
 from .database import get_campaign
 
+# Destination register of a load in the disassembly stored in full_inst,
+#   e.g. "ldr r3, [r11, #-8]" or "0x00100a4c:\tldrb\tr2, [r1]"
+load_pattern = re.compile(r'\b(ld(?!m)[a-z.]*)\s+(r\d+|sp|lr|pc|fp|ip|sl|sb)\b', re.IGNORECASE)
+# OpenOCD register names
+register_names = {'r9': 'r9', 'sb': 'r9', 'r10': 'r10', 'sl': 'r10', 'r11': 'r11', 'fp': 'r11',
+                  'r12': 'r12', 'ip': 'r12', 'r13': 'sp', 'r14': 'lr', 'r15': 'pc'}
+
+def decode_load_register(instruction):
+    if instruction is None:
+        return None
+    match = load_pattern.search(instruction)
+    if match is None:
+        # Multiple loads (LDM / POP) are left to the debugger
+        return None
+    if match.group(1).lower().startswith(('ldrd', 'ldrexd')):
+        # As are doubleword loads, which write a pair of registers
+        return None
+    register = match.group(2).lower()
+    return register_names.get(register, register)
+
+# Lines of a golden run trace from a file, standard input ("-") or the first connection to a TCP port
+def read_trace_source(source, port=None):
+    if port is not None:
+        server = socket(AF_INET, SOCK_STREAM)
+        server.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        server.bind(('', port))
+        server.listen(1)
+        print(colored("Waiting for trace on port {}...".format(port), 'yellow'))
+        connection, address = server.accept()
+        server.close()
+        print(colored("\treading trace from {}:{}".format(*address), 'yellow'))
+        with connection, connection.makefile('r', errors='replace') as lines:
+            yield from lines
+    elif source == '-':
+        yield from stdin
+    else:
+        with open(source, errors='replace') as lines:
+            yield from lines
+
+# Records for the load / store table from lines of separated fields, one for each of the columns
+#   types (like "sqlite3 -separator '|'" output). Integers may be hex, empty fields are NULL and
+#   blank lines and lines starting with # are skipped
+def parse_trace_records(lines, types, separator='|'):
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.startswith('#'):
+            continue
+        fields = line.split(separator)
+        if len(fields) != len(types):
+            raise Exception('line {} of trace has {} fields, expected {}'.format(number, len(fields), len(types)))
+        record = []
+        for field, type_ in zip(fields, types):
+            field = field.strip()
+            if not field:
+                record.append(None)
+            elif type_ == 'INTEGER':
+                try:
+                    record.append(int(field, 16) if field.lower().startswith('0x') else int(field))
+                except ValueError:
+                    raise Exception('line {} of trace has invalid integer: {}'.format(number, field))
+            else:
+                record.append(field)
+        yield record
+
 def get_database_path(options):
     database = "campaign-data/" + str(options.campaign_id) + "/sqlite/database.sqlite"
     return database
@@ -81,94 +154,227 @@ def assembly_golden_run(sqlite_database, debugger):
     p.communicate()
     p.kill()
 
-    # Transfer back updated database
+    # Transfer back updated database, reopening it afterwards since the file is replaced
     print("Transfering back database")
+    sqlite_database.store.close()
     p = subprocess.Popen("mv ../tmp/database.sqlite " + localpath, shell=True)
     p.communicate()
     p.kill()
+    sqlite_database.metadata = None
+
+# Columns printed in hex, by table
+hex_columns = {"injection_info": ["start_tag_addr", "end_tag_addr"],
+               "ls_inst": ["address", "l_s_addr", "L2_set"]}
+
+# Rows of a query fetched a batch at a time, so a whole table is never held in memory
+def fetch_rows(cursor, batch_size=10000):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+# A row as a line of the printed table, each value padded to row_spacing
+def format_row(row, names, hex_names, row_spacing):
+    line = ''
+    for name, value in zip(names, row):
+        value = hex(value) if name in hex_names and isinstance(value, int) else str(value)
+        line += '| ' + value + (row_spacing - len(value) - 1) * ' '
+    return line + '|'
+
+# Write rows with their column names to output as a printed table, CSV or JSON lines, streaming
+#   them as they come. Returns the number of rows written
+def write_rows(output, table, names, rows, format_='table'):
+    count = 0
+    if format_ == 'csv':
+        writer = csv_writer(output)
+        writer.writerow(names)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif format_ == 'jsonl':
+        for row in rows:
+            output.write(dumps(dict(zip(names, row))) + '\n')
+            count += 1
+    else:
+        row_spacing = max([5] + [len(name) for name in names]) + 1
+        print(format_row(names, names, [], row_spacing), file=output)
+        for row in rows:
+            print(format_row(row, names, hex_columns.get(table, []), row_spacing), file=output)
+            count += 1
+    return count
 
 def print_sqlite_database(sqlite_database):
-    conn = connect(sqlite_database.database)
-    c = conn.cursor()
+    c = sqlite_database.store.connect().cursor()
     print(colored("\n+++++++++++++++++++++++++++++++++++++++++++++++++++++++++\n", 'yellow'))
 
     for tn in sqlite_database.table_list:
         c.execute("PRAGMA TABLE_INFO({})".format(tn))
-        info = c.fetchall()
-
-        # Loop through once before printing to determine row spacing
-        row_spacing = 5
-        for col in info:
-            if len(str(col[1])) > row_spacing:
-                row_spacing = len(str(col[1]))
-        row_spacing = row_spacing + 1
+        names = [str(col[1]) for col in c.fetchall()]
+
+        # Column names determine the row spacing, so rows can be printed as they are read
+        row_spacing = max([5] + [len(name) for name in names]) + 1
         print('Row spacing = ' + str(row_spacing))
 
         print('----__' + str(tn) + '__----')
 
-        # Print the column names
-        for col in info:
-            print('|', end="")
-            print(" " + str(col[1]) + (row_spacing - len(str(col[1])) - 1) * " ", end="")
-        print('|')
-
-        # Print rows
+        # Print the column names, then the rows
+        print(format_row(names, names, [], row_spacing))
         c.execute("SELECT * FROM {}".format(tn))
-        all_rows = c.fetchall()
-        for row in all_rows:
-            i = 0
-            while(i < len(row)):
-                print('|', end="")
-                # Special cases for injection_info
-                if str(tn) == "injection_info":
-                    if i == 1 or i == 3: # start_tag_addr, end_tag_addr
-                        print(" " + hex(row[i]) + (row_spacing - len(hex(row[i])) - 1) * " ", end="")
-                    else:
-                        print(" " + str(row[i]) + (row_spacing - len(str(row[i])) - 1) * " ", end="")
-                # Special cases for ldstr_inst_tbl
-                elif str(tn) == "ls_inst":
-                    if i == 2 or i == 4 or i == 7 : # address, l_s_addr, or L2_set
-                        print(" " + hex(row[i]) + (row_spacing - len(hex(row[i])) - 1) * " ", end="")
-                    else:
-                        print(" " + str(row[i]) + (row_spacing - len(str(row[i])) - 1) * " ", end="")
-                # Everything else
-                else:
-                    print(" " + str(row[i]) + (row_spacing - len(str(row[i])) - 1) * " ", end="")
-                i += 1
-            print('|')
+        for row in fetch_rows(c):
+            print(format_row(row, names, hex_columns.get(tn, []), row_spacing))
 
         print('----------------------------------------------------')
 
     print(colored("\n+++++++++++++++++++++++++++++++++++++++++++++++++++++++++\n", 'yellow'))
-    conn.close()
+
+# One long-lived connection per process to a golden run trace database.
+#   Statements are parameterized so sqlite3 keeps them prepared in its statement cache, and the
+#   count and total time of each named query are kept in stats
+class trace_store(object):
+    mmap_size = 268435456
+    cache_size = -65536 # KiB
+    cached_statements = 256
+
+    def __init__(self, database, read_only=False):
+        self.database = database
+        self.read_only = read_only
+        self.connection = None
+        self.pid = None
+        self.stats = {}
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def connect(self):
+        # A connection can not be shared with a forked injection process, which opens its own
+        if self.connection is not None and self.pid == getpid():
+            return self.connection
+        if self.read_only:
+            self.connection = connect('file:{}?mode=ro'.format(pathname2url(abspath(self.database))),
+                                      uri=True, cached_statements=self.cached_statements,
+                                      check_same_thread=False)
+        else:
+            self.connection = connect(self.database, cached_statements=self.cached_statements,
+                                      check_same_thread=False)
+        self.pid = getpid()
+        self.connection.execute("PRAGMA mmap_size = {}".format(self.mmap_size))
+        self.connection.execute("PRAGMA cache_size = {}".format(self.cache_size))
+        if self.read_only:
+            self.connection.execute("PRAGMA query_only = 1")
+        return self.connection
+
+    def close(self):
+        if self.connection is not None and self.pid == getpid():
+            self.connection.close()
+        self.connection = None
+        self.pid = None
+
+    def execute(self, name, statement, parameters=()):
+        start = perf_counter()
+        cursor = self.connect().execute(statement, parameters)
+        self.record(name, start)
+        return cursor
+
+    def query(self, name, statement, parameters=()):
+        start = perf_counter()
+        rows = self.connect().execute(statement, parameters).fetchall()
+        self.record(name, start)
+        return rows
+
+    def query_one(self, name, statement, parameters=()):
+        start = perf_counter()
+        row = self.connect().execute(statement, parameters).fetchone()
+        self.record(name, start)
+        return row
+
+    def commit(self):
+        self.connect().commit()
+
+    def record(self, name, start):
+        count, latency = self.stats.get(name, (0, 0))
+        self.stats[name] = (count + 1, latency + perf_counter() - start)
+
+    def print_stats(self):
+        if not self.stats:
+            return
+        print(colored("Trace queries ({}):".format(self.database), 'yellow'))
+        for name, (count, latency) in sorted(self.stats.items()):
+            print("\t{:<20}{:>8}{:>12.3f} ms".format(name, count, latency / count * 1000))
 
 class sqlite_database(object):
-    def __init__(self, options, database_path=None):
+    def __init__(self, options, database_path=None, read_only=False):
         # Needed to search previous entries...
         self.stored_address = []
         self.stored_cycles = 0
         self.stored_cache_set = None
+        # Destination register of each load, keyed by instruction address
+        self.load_registers = None
+        # Trace metadata, loaded on first use
+        self.metadata = None
 
         self.options = options
-        self.campaign = get_campaign(options)
         #TODO check to make sure the database still exists
         self.__initialize_params()
+        self.__initialize_statements()
         if database_path is not None:
             self.database = database_path
         else:
             self.database = self.__create_database()
+        new_database = not isfile(self.database)
+        self.store = trace_store(self.database, read_only)
+        if new_database:
             self.__initialize_database()
+        elif read_only:
+            if self.store.query_one("schema", "PRAGMA user_version")[0] < self.schema_version:
+                print(colored("Trace database is missing indexes, open it once for writing to add them", 'red'))
+        else:
+            self.update_schema()
+        self.trace_index = None
+        self.columnar_trace = None
+        # Only imported when used, since they need NumPy
+        if getattr(options, 'columnar', False):
+            from .columnar_trace import load_columnar_trace
+            # Answers the same lookups as the trace index
+            self.columnar_trace = self.trace_index = load_columnar_trace(self)
+        elif getattr(options, 'trace_index', False):
+            from .trace_index import load_trace_index
+            self.trace_index = load_trace_index(self)
+        self.residency = None
+        if getattr(options, 'cache_model', None) is not None:
+            self.residency = self.get_residency(options.cache_model)
+            if self.residency is None and read_only:
+                print(colored("No {} residency timeline in the trace database, walking the trace instead".format(options.cache_model), 'red'))
+        self.ace = None
+        if getattr(options, 'ace', False) and self.residency is not None:
+            self.ace = self.get_ace()
+            if self.ace is None and read_only:
+                print(colored("No vulnerable intervals in the trace database, sampling injections uniformly", 'red'))
+
+    def __enter__(self):
+        self.store.connect()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def close(self):
+        self.store.print_stats()
+        self.store.close()
 
     def __create_database(self):
         print(colored("Creating sqlite database", 'yellow'))
-        sqlite_folder = 'campaign-data/{}/sqlite'.format(self.campaign.id)
+        campaign = get_campaign(self.options)
+        sqlite_folder = 'campaign-data/{}/sqlite'.format(campaign.id)
         database = sqlite_folder + '/' + 'database.sqlite'
         if isfile(database):
              print(colored("Sqlite database already exists for this campaign", 'red'))
              return
         makedirs(sqlite_folder)
-        conn = connect(database)
-        conn.close()
         print(colored("database: " + database, 'yellow'))
         return database
 
@@ -244,14 +450,91 @@ class sqlite_database(object):
         self.end_cycle_col     = "end_cycle"
         self.end_cycle_type    = "INTEGER"
 
+        # Residency timeline of the L2 cache, simulated from the load / store table
+        self.residency_tbl     = "l2_residency"
+        self.res_set_col       = "cache_set"
+        self.res_way_col       = "way"
+        self.res_line_col      = "line"
+        self.res_fill_col      = "fill_cycle"
+        self.res_evict_col     = "evict_cycle"
+        # Cache geometry, replacement policy and trace end cycle the timeline was simulated with
+        self.residency_info_tbl = "l2_residency_info"
+        # Intervals in which a flip in a word of the L2 cache is read (ACE), each weighted by its
+        #   length in cycles and stored with the running total of the weights for sampling
+        self.ace_tbl           = "l2_ace"
+        self.ace_word_col      = "word"
+        self.ace_start_col     = "start_cycle"
+        self.ace_end_col       = "end_cycle"
+        self.ace_weight_col    = "weight_end"
+        # Policy and trace end cycle of the timeline the intervals came from, with their total
+        #   length in word cycles and the resulting AVF of the cache data
+        self.ace_info_tbl      = "l2_ace_info"
+        # Injection plan of each iteration (see injection_plan), by iteration number, with the key
+        #   of the trace and options it was made from (see get_plan_key)
+        self.plan_tbl          = "injection_plan"
+        self.plan_iteration_col = "iteration"
+        self.plan_key_col      = "plan_key"
+        self.plan_injections_col = "injections"
+        # Counts the traces loaded by ingest, so that a trace loaded again with the same length and
+        #   end cycle is still a new version of the trace
+        self.generation_tbl    = "trace_generation"
+        # Size, cycle bounds and tags of the golden run trace and its accesses to each L2 set,
+        #   computed once and cached in memory. generation, last_row and end_cycle are the trace
+        #   version it was computed from
+        self.metadata_tbl      = "trace_metadata"
+        self.metadata_cols     = ["rows", "generation", "last_row", "start_cycle", "end_cycle", "start_tag_addr",
+                                  "start_tag_cycle", "end_tag_addr", "end_tag_cycle", "set_accesses"]
+
+        # Page cache while loading and indexing a trace
+        self.ingest_cache_size = -1048576 # KiB
+
         #Save the tables in a list to make printing and changing the database easier
         self.table_list = [self.ldstr_inst_tbl, self.inject_tbl]
 
+        # Indexes on the load / store table, one covering each lookup made while injecting so that
+        #   none of them scan the trace. Stored in PRAGMA user_version when added.
+        self.schema_version = 7
+        self.indexes = {
+            "ls_inst_cycles": [self.cycles_total_col],
+            "ls_inst_set": [self.cache_set_col, self.cycles_total_col, self.ldstr_addr_col],
+            "ls_inst_ldstr_addr": [self.ldstr_addr_col, self.cache_set_col, self.cycles_total_col,
+                                   self.cycles_diff_col, self.address_col, self.ldstr_col],
+            "ls_inst_address": [self.address_col, self.cycles_total_col],
+            "ls_inst_ldstr": [self.ldstr_col, self.cycles_total_col, self.address_col]}
+
+    def __initialize_statements(self):
+        columns = {"ace": self.ace_tbl, "word": self.ace_word_col, "start": self.ace_start_col,
+                   "end": self.ace_end_col, "weight": self.ace_weight_col,
+                   "res": self.residency_tbl, "res_set": self.res_set_col, "way": self.res_way_col,
+                   "line": self.res_line_col, "fill": self.res_fill_col, "evict": self.res_evict_col,
+                   "plan": self.plan_tbl, "generation": self.generation_tbl, "iteration": self.plan_iteration_col, "plan_key": self.plan_key_col,
+                   "injections": self.plan_injections_col,
+                   "tbl": self.ldstr_inst_tbl, "cycles": self.cycles_total_col, "diff": self.cycles_diff_col,
+                   "address": self.address_col, "ldstr": self.ldstr_col, "ldstr_addr": self.ldstr_addr_col,
+                   "finst": self.finst_name_col, "set": self.cache_set_col}
+        # Queries on the load / store table made while injecting, by name
+        self.statements = {
+            "SkipCount": "SELECT COUNT(DISTINCT {cycles}) FROM {tbl} WHERE {address} = ? AND {cycles} > ? AND {cycles} < ?",
+            "get_next_load": "SELECT {address} FROM {tbl} WHERE {ldstr} = 0 AND {cycles} > ? ORDER BY {cycles} ASC LIMIT 1",
+            "NextLdrStr": "SELECT {cycles}, {diff}, {address}, {ldstr} FROM {tbl} WHERE {ldstr_addr} = ? AND {set} = ? AND {cycles} > ? ORDER BY {cycles} ASC",
+            "PreviousLdrStr": "SELECT {cycles} FROM {tbl} WHERE {set} = ? AND {cycles} < ? ORDER BY {cycles} DESC LIMIT 1",
+            "PreviousLdrStr multi": "SELECT {ldstr_addr} FROM {tbl} WHERE {set} = ? AND {cycles} = ?",
+            "get_load_register": "SELECT DISTINCT {address}, {finst} FROM {tbl} WHERE {ldstr} = 0",
+            "get_start_cycle": "SELECT MIN({cycles}) FROM {tbl}",
+            "get_end_cycle": "SELECT MAX({cycles}) FROM {tbl}",
+            "get_trace_version": "SELECT (SELECT IFNULL(MAX(generation), 0) FROM {generation}), (SELECT MAX(rowid) FROM {tbl}), "
+                                 "(SELECT MAX({cycles}) FROM {tbl})",
+            "get_set_accesses": "SELECT {set}, COUNT(*) FROM {tbl} WHERE {set} IS NOT NULL GROUP BY {set}",
+            "get_resident_line": "SELECT {line}, {evict} FROM {res} WHERE {res_set} = ? AND {way} = ? AND {fill} < ? ORDER BY {fill} DESC LIMIT 1",
+            "sample_ace": "SELECT {res_set}, {way}, {word}, {start}, {end}, {weight} FROM {ace} WHERE {weight} > ? ORDER BY {weight} ASC LIMIT 1",
+            "get_plan": "SELECT {plan_key}, {injections} FROM {plan} WHERE {iteration} = ?"}
+        for name, statement in self.statements.items():
+            self.statements[name] = statement.format(**columns)
+
     def __initialize_database(self):
         print(colored("\tInitializing database...", 'yellow'))
 
-        conn = connect(self.database)
-        c = conn.cursor()
+        c = self.store.connect().cursor()
 
         # Add to database
         c.execute('CREATE TABLE {tn} ({c1} {t1}, {c2} {t2}, {c3} {t3}, {c4} {t4}, {c5} {t5}, {c6} {t6}, {fi_c} {fi_t}, {c7} {t7}, {c8} {t8}, {c9} {t9}, {c10} {t10}, {c11} {t11}, {c12} {t12}, {c13} {t13}, {c14} {t14}, {c15} {t15}, {c16} {t16}, {c17} {t17}, {c18} {t18}, {c19} {t19}, {c20} {t20}, {c21} {t21}, {c22} {t22}, {c23} {t23})'\
@@ -289,39 +572,60 @@ class sqlite_database(object):
                     c4=self.end_addr_col, t4=self.end_addr_type,\
                     c5=self.end_cycle_col, t5=self.end_cycle_type))
 
-
-        conn.commit()
-        conn.close()
+        self.store.commit()
+        self.update_schema()
+
+    # Add the tables and indexes missing from a database created by an older version
+    def update_schema(self):
+        version = self.store.query_one("schema", "PRAGMA user_version")[0]
+        if version >= self.schema_version:
+            return
+        if 0 < version < 6:
+            # Cached from the trace, with columns added since
+            self.store.execute("schema", "DROP TABLE IF EXISTS {}".format(self.metadata_tbl))
+        if 0 < version < 7:
+            # Plans without a key cannot be checked against the trace
+            self.store.execute("schema", "DROP TABLE IF EXISTS {}".format(self.plan_tbl))
+        print(colored("\tIndexing load / store table...", 'yellow'))
+        for name, columns in sorted(self.indexes.items()):
+            self.store.execute("schema", "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(name, self.ldstr_inst_tbl, ", ".join(columns)))
+        self.store.execute("schema", "CREATE TABLE IF NOT EXISTS {} ({} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER)".format(
+            self.residency_tbl, self.res_set_col, self.res_way_col, self.res_line_col, self.res_fill_col, self.res_evict_col))
+        self.store.execute("schema", "CREATE INDEX IF NOT EXISTS {0}_way ON {0} ({1}, {2}, {3}, {4}, {5})".format(
+            self.residency_tbl, self.res_set_col, self.res_way_col, self.res_fill_col, self.res_line_col, self.res_evict_col))
+        self.store.execute("schema", "CREATE TABLE IF NOT EXISTS {} (sets INTEGER, ways INTEGER, line_size INTEGER, policy TEXT, end_cycle INTEGER)".format(
+            self.residency_info_tbl))
+        self.store.execute("schema", "CREATE TABLE IF NOT EXISTS {} ({} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER)".format(
+            self.ace_tbl, self.res_set_col, self.res_way_col, self.ace_word_col, self.ace_start_col, self.ace_end_col, self.ace_weight_col))
+        self.store.execute("schema", "CREATE INDEX IF NOT EXISTS {0}_weight ON {0} ({1}, {2}, {3}, {4}, {5}, {6})".format(
+            self.ace_tbl, self.ace_weight_col, self.res_set_col, self.res_way_col, self.ace_word_col, self.ace_start_col, self.ace_end_col))
+        self.store.execute("schema", "CREATE TABLE IF NOT EXISTS {} (policy TEXT, end_cycle INTEGER, word_cycles INTEGER, avf REAL)".format(
+            self.ace_info_tbl))
+        self.store.execute("schema", "CREATE TABLE IF NOT EXISTS {} ({} INTEGER PRIMARY KEY, {} TEXT, {} TEXT)".format(
+            self.plan_tbl, self.plan_iteration_col, self.plan_key_col, self.plan_injections_col))
+        self.store.execute("schema", "CREATE TABLE IF NOT EXISTS {} (generation INTEGER)".format(self.generation_tbl))
+        self.store.execute("schema", "CREATE TABLE IF NOT EXISTS {} ({} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER, {} INTEGER, {} TEXT)".format(
+            self.metadata_tbl, *self.metadata_cols))
+        self.store.execute("schema", "PRAGMA user_version = {}".format(self.schema_version))
+        self.store.commit()
 
     # Return the number of breakpoints that must be skipped to reach the first execution of the
     #   instruction (address) after a given cycle. Check total cycles to spot multies
     def SkipCount(self, start_cycle, end_cycle, address):
         print("Get the Skip Count for ", address, " up to cycle ", end_cycle)
-        conn = connect(self.database)
-        c = conn.cursor()
-
-        c.execute("SELECT * FROM ls_inst WHERE cycles_total > {} AND cycles_total < {} AND address = {}".format(start_cycle, end_cycle, address))
-        retval = c.fetchall()
-
-        cycles_list = []
-        for line in retval:
-            if line[0] in cycles_list:
-                pass
-            else:
-                cycles_list.append(line[0])
-
-        return len(cycles_list)
+        if self.trace_index is not None:
+            return self.trace_index.count_executions(start_cycle, end_cycle, address)
+        # Distinct total cycles, since a multi access instruction has a line for each access
+        return self.store.query_one("SkipCount", self.statements["SkipCount"], (address, start_cycle, end_cycle))[0]
 
     # Given a cycle count, find the following load instructions.
     # addr, break_number = sql_db.get_next_load(injection.time)
     def get_next_load(self, cycle):
         print("Get next load...")
-        conn = connect(self.database)
-        c = conn.cursor()
-
-        # SELECT * FROM ls_inst WHERE cycles_total > 18000 AND load0_store1 = 0 LIMIT 1;
-        c.execute("SELECT address FROM {} WHERE {} > {} AND {} = 0 LIMIT 1".format(self.ldstr_inst_tbl, self.cycles_total_col, cycle, self.ldstr_col))
-        address = c.fetchone()[0]
+        if self.columnar_trace is not None:
+            return (self.columnar_trace.next_load(cycle), 1)
+        # SELECT * FROM ls_inst WHERE cycles_t > 18000 AND load0_store1 = 0 LIMIT 1;
+        address = self.store.query_one("get_next_load", self.statements["get_next_load"], (cycle,))[0]
 
         # TODO: Use the address to figure out the number of times you need to break first.
         return (address, 1)
@@ -330,12 +634,11 @@ class sqlite_database(object):
     # return the list of accesses up until the first store or slow load
     def NextLdrStr(self, cycle, cache_set, address):
         print("Get the next stores / loads for %d / %d after cycle %d" % (cache_set, address, cycle))
+        if self.trace_index is not None:
+            return self.trace_index.next_accesses(cycle, cache_set, address)
 
-        conn = connect(self.database)
-        c = conn.cursor()
-
-        c.execute("SELECT * FROM ls_inst WHERE cycles_total > {} AND L2_set = {} AND l_s_addr = {} ORDER BY cycles_total ASC". format(cycle, cache_set, address))
-        retval = c.fetchall()
+        # cycles_t, cycles_d, address, load0_store1
+        retval = self.store.query("NextLdrStr", self.statements["NextLdrStr"], (address, cache_set, cycle))
         if retval == None:
             return None
 
@@ -361,6 +664,23 @@ class sqlite_database(object):
 
         return targets
 
+    # Return the destination register of the load instruction at address, decoded once for every
+    #   load in the golden run from the full_inst column, or None if it could not be decoded
+    def get_load_register(self, address):
+        if self.load_registers is None:
+            if self.columnar_trace is not None:
+                loads = self.columnar_trace.load_instructions()
+            else:
+                loads = self.store.query("get_load_register", self.statements["get_load_register"])
+            self.load_registers = {}
+            for load_address, instruction in loads:
+                register = decode_load_register(instruction)
+                if register is not None:
+                    self.load_registers[load_address] = register
+
+            print("Decoded destination registers for", len(self.load_registers), "load instructions")
+        return self.load_registers.get(int(address))
+
     # Given a cycle count and cache set find the addresses that loaded / stored in that set
     # return the cycle and address or None
     def PreviousLdrStr(self, cycle, cache_set):
@@ -375,29 +695,24 @@ class sqlite_database(object):
             return self.stored_cycles, retval
 
         # address, cycle
-        conn = connect(self.database)
-        c = conn.cursor()
-
         # Should just find the prvious load or store. Calling function worries about uniqueness.
         # Just want to know what is resident in the cache.
 
         # Multi loads / stores complicate things... need to get all of the accesses from the same command and then pass them back one at a time
         # Cache lines are 8 Words... addresses need to lose last three bits (offset)
-        # SELECT l_s_addr FROM ls_inst WHERE cycles_total < 30500 AND L2_set = 1531 ORDER BY cycles_total DESC LIMIT 1;
+        # SELECT l_s_addr FROM ls_inst WHERE cycles_t < 30500 AND L2_set = 1531 ORDER BY cycles_t DESC LIMIT 1;
 
         # Get the cycles of the line that matches the criteria
-        # SELECT cycles_total FROM ls_inst WHERE cycles_total < 30500 AND L2_set = 1531 ORDER BY cycles_total DESC LIMIT 1;
-        c.execute("SELECT cycles_total FROM ls_inst WHERE cycles_total < {} AND L2_set = {} ORDER BY cycles_total DESC LIMIT 1".format(cycle, cache_set))
-        retval = c.fetchone()
+        # SELECT cycles_t FROM ls_inst WHERE cycles_t < 30500 AND L2_set = 1531 ORDER BY cycles_t DESC LIMIT 1;
+        retval = self.store.query_one("PreviousLdrStr", self.statements["PreviousLdrStr"], (cache_set, cycle))
         if retval == None:
             return None, None
         found_cycles = retval[0]
 
         # 32 bytes to a line, so shift the address right by 5
 
-        # Get all lines that match that cycles_total (accounts for multi loads / stores)
-        c.execute("SELECT l_s_addr FROM ls_inst WHERE cycles_total = {} AND L2_set = {}".format(found_cycles, cache_set))
-        retval = c.fetchall()
+        # Get all lines that match that cycles_t (accounts for multi loads / stores)
+        retval = self.store.query("PreviousLdrStr multi", self.statements["PreviousLdrStr multi"], (cache_set, found_cycles))
         if len(retval) > 1:
             # A single command is accessing multiple lines, save others for future calls... what if multple injections in a run?
             self.stored_address = []
@@ -415,74 +730,346 @@ class sqlite_database(object):
         return found_cycles, retval[0][0] >> 5 # Shift to remove byte offset from address.
 
 
+    # Return the sets, ways, line size, policy and trace end cycle of the stored residency timeline,
+    #   or None if it was not simulated with policy
+    def get_residency(self, policy):
+        try:
+            info = self.store.query_one("residency", "SELECT sets, ways, line_size, policy, end_cycle FROM {}".format(self.residency_info_tbl))
+        except OperationalError:
+            # Database not updated to the current schema
+            return None
+        if info is None or info[3] != policy:
+            return None
+        return info
+
+    # Simulate the L2 cache over the load / store table and store its residency timeline, unless
+    #   the stored one was simulated with the same geometry and policy from the same trace
+    def update_residency(self, sets, ways, line_size, policy):
+        info = (sets, ways, line_size, policy, self.get_end_cycle())
+        if self.get_residency(policy) == info:
+            self.residency = info
+            return
+        print(colored("Simulating {} {}-way L2 cache with {} sets of {} byte lines...".format(policy, ways, sets, line_size), 'yellow'))
+        start = perf_counter()
+        self.store.execute("residency", "DELETE FROM {}".format(self.residency_tbl))
+        self.store.execute("residency", "DELETE FROM {}".format(self.residency_info_tbl))
+        # The vulnerable intervals came from the old timeline, even with the same policy
+        self.store.execute("residency", "DELETE FROM {}".format(self.ace_tbl))
+        self.store.execute("residency", "DELETE FROM {}".format(self.ace_info_tbl))
+        self.ace = None
+        simulator = cache_simulator(sets, ways, line_size, policy)
+        if self.columnar_trace is not None:
+            accesses = (access[:2] for access in self.columnar_trace.accesses())
+        else:
+            accesses = self.store.connect().cursor().execute("SELECT {0}, {1} FROM {2} WHERE {1} IS NOT NULL ORDER BY {0}, rowid".format(
+                self.cycles_total_col, self.ldstr_addr_col, self.ldstr_inst_tbl))
+        self.store.connect().executemany("INSERT INTO {} VALUES (?, ?, ?, ?, ?)".format(self.residency_tbl), simulator.run(accesses))
+        self.store.execute("residency", "INSERT INTO {} VALUES (?, ?, ?, ?, ?)".format(self.residency_info_tbl), info)
+        self.store.commit()
+        self.residency = info
+        print(colored("\t{} accesses, {} misses in {:.1f} seconds".format(simulator.accesses, simulator.misses, perf_counter() - start), 'yellow'))
+
+    # Return the policy, trace end cycle, total length in word cycles and AVF of the stored vulnerable
+    #   intervals, or None if they do not match the residency timeline
+    def get_ace(self):
+        try:
+            info = self.store.query_one("ace", "SELECT policy, end_cycle, word_cycles, avf FROM {}".format(self.ace_info_tbl))
+        except OperationalError:
+            return None
+        if info is None or self.residency is None or info[:2] != (self.residency[3], self.residency[4]):
+            return None
+        return info
+
+    # Find the intervals in which a flipped bit of the L2 cache data is read before it is
+    #   overwritten or evicted, replaying the residency timeline, and report the AVF of the data
+    def update_ace(self):
+        sets, ways, line_size, policy, end_cycle = self.residency
+        self.ace = self.get_ace()
+        if self.ace is not None:
+            return
+        print(colored("Finding vulnerable intervals of the L2 cache data...", 'yellow'))
+        start = perf_counter()
+        self.store.execute("ace", "DELETE FROM {}".format(self.ace_tbl))
+        self.store.execute("ace", "DELETE FROM {}".format(self.ace_info_tbl))
+        if self.columnar_trace is not None:
+            accesses = self.columnar_trace.accesses()
+        else:
+            accesses = self.store.connect().cursor().execute(
+                "SELECT {0}, {1}, IFNULL({2}, 0), {3} FROM {4} WHERE {1} IS NOT NULL ORDER BY {0}, rowid".format(
+                    self.cycles_total_col, self.ldstr_addr_col, self.ldstr_col, self.cycles_diff_col, self.ldstr_inst_tbl))
+        word_cycles = [0]
+
+        def weighted(intervals):
+            for cache_set, way, word, start_cycle, end_cycle in intervals:
+                word_cycles[0] += end_cycle - start_cycle
+                yield cache_set, way, word, start_cycle, end_cycle, word_cycles[0]
+
+        self.store.connect().executemany("INSERT INTO {} VALUES (?, ?, ?, ?, ?, ?)".format(self.ace_tbl),
+                                         weighted(cache_simulator(sets, ways, line_size, policy).run_ace(accesses)))
+        cycles = max(end_cycle - self.get_start_cycle(), 1)
+        avf = word_cycles[0] * 32 / (sets * ways * line_size * 8 * cycles)
+        self.ace = (policy, end_cycle, word_cycles[0], avf)
+        self.store.execute("ace", "INSERT INTO {} VALUES (?, ?, ?, ?)".format(self.ace_info_tbl), self.ace)
+        self.store.commit()
+        print(colored("\tL2 data AVF: {:.4%} ({} vulnerable word cycles) in {:.1f} seconds".format(
+            avf, word_cycles[0], perf_counter() - start), 'yellow'))
+
+    # Pick a vulnerable word of the L2 cache and a cycle to flip it, weighted by interval length,
+    #   return the set, way, word and cycle
+    def sample_ace(self):
+        weight = randrange(self.ace[2])
+        cache_set, way, word, start_cycle, end_cycle, weight_end = self.store.query_one(
+            "sample_ace", self.statements["sample_ace"], (weight,))
+        return cache_set, way, word, start_cycle + weight - (weight_end - (end_cycle - start_cycle))
+
+    # Everything a plan depends on: the trace version and tags, the residency timeline and vulnerable
+    #   intervals, and the options used to choose the injections
+    def get_plan_key(self, options):
+        def selected(name):
+            # Targets and registers are case insensitive
+            values = getattr(options, name, None)
+            return sorted(str(value).lower() for value in values) if values else None
+        return dumps([list(self.get_trace_version()), list(self.get_tags()),
+                      list(self.residency) if self.residency is not None else None,
+                      list(self.ace) if self.ace is not None else None,
+                      getattr(options, 'cache_model', None), getattr(options, 'ace', False),
+                      getattr(options, 'injections', 1), selected('selected_targets'),
+                      selected('selected_target_indices'), selected('selected_registers')])
+
+    # Store the plans, (iteration number, JSON injections), made with key, replacing older plans of
+    #   the iterations
+    def log_plans(self, plans, key):
+        self.store.connect().executemany("INSERT OR REPLACE INTO {} VALUES (?, ?, ?)".format(self.plan_tbl),
+                                         ((iteration, key, injections) for iteration, injections in plans))
+        self.store.commit()
+
+    # Return the planned injections of an iteration, or None if it was not planned or was planned
+    #   with another key (a different trace or options)
+    def get_plan(self, iteration, key):
+        try:
+            plan = self.store.query_one("get_plan", self.statements["get_plan"], (iteration,))
+        except OperationalError:
+            # Database not updated to the current schema
+            return None
+        if plan is None or plan[0] != key:
+            return None
+        return loads(plan[1])
+
+    # Lines resident in each way of cache_set just before cycle (without the byte offset, like
+    #   PreviousLdrStr), None for an empty way
+    def get_resident_lines(self, cycle, cache_set):
+        lines = []
+        for way in range(self.residency[1]):
+            row = self.store.query_one("get_resident_line", self.statements["get_resident_line"], (cache_set, way, cycle))
+            if row is not None and (row[1] is None or row[1] >= cycle):
+                lines.append(row[0])
+            else:
+                lines.append(None)
+        return lines
+
+    # Names and types of the load / store table columns, in table order
+    def get_ldstr_columns(self):
+        return [(row[1], row[2]) for row in self.store.query("schema", "PRAGMA table_info({})".format(self.ldstr_inst_tbl))]
+
+    # Rows of a table as (column names, iterator over the rows), read from a cursor a batch at a
+    #   time. The load / store table can be limited to a window of cycles (inclusive), a set, an
+    #   instruction address and a load / store address, which its indexes answer, and is returned
+    #   in cycle order
+    def inspect(self, table=None, columns=None, cycles=None, cache_set=None, address=None, ldstr_addr=None,
+                limit=None, offset=0, batch_size=10000):
+        table = table or self.ldstr_inst_tbl
+        tables = [row[0] for row in self.store.query("schema", "SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if table not in tables:
+            raise Exception('invalid trace database table: {} (tables: {})'.format(table, ', '.join(sorted(tables))))
+        names = [row[1] for row in self.store.query("schema", "PRAGMA table_info({})".format(table))]
+        for column in columns or []:
+            if column not in names:
+                raise Exception('invalid {} column: {}'.format(table, column))
+        names = list(columns or names)
+        filters = [(self.cache_set_col, cache_set), (self.address_col, address), (self.ldstr_addr_col, ldstr_addr)]
+        conditions = []
+        parameters = []
+        if cycles is not None:
+            conditions.append("{0} >= ? AND {0} <= ?".format(self.cycles_total_col))
+            parameters.extend(cycles)
+        for column, value in filters:
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                parameters.append(value)
+        if conditions and table != self.ldstr_inst_tbl:
+            raise Exception('filters only apply to the load / store table ({})'.format(self.ldstr_inst_tbl))
+        statement = "SELECT {} FROM {}".format(", ".join('"{}"'.format(name) for name in names), table)
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+        if table == self.ldstr_inst_tbl:
+            statement += " ORDER BY {}, rowid".format(self.cycles_total_col)
+        else:
+            statement += " ORDER BY rowid"
+        if limit is not None or offset:
+            statement += " LIMIT ? OFFSET ?"
+            parameters.extend([-1 if limit is None else limit, offset])
+        cursor = self.store.execute("inspect", statement, parameters)
+        return names, fetch_rows(cursor, batch_size)
+
+    # Add a single access to the load / store table, use ingest for whole traces
+    def log_ldstr(self, cache_set, cycles, ldstr, ldstr_addr):
+        self.store.execute("log_ldstr", "INSERT INTO {} ({}, {}, {}, {}) VALUES (?, ?, ?, ?)".format(
+            self.ldstr_inst_tbl, self.cache_set_col, self.cycles_total_col, self.ldstr_col, self.ldstr_addr_col),
+                           (cache_set, cycles, ldstr, ldstr_addr))
+        self.store.commit()
+        self.metadata = None
+
+    # Bulk load records (sequences of values for columns, every column of the load / store table
+    #   by default) into the load / store table. The indexes are dropped so that inserts only append
+    #   to the table and built again after the load, with durability traded for speed until then.
+    #   Returns the number of rows loaded
+    def ingest(self, records, columns=None, batch_size=100000, transaction_size=1000000, replace=False):
+        if columns is None:
+            columns = [name for name, type_ in self.get_ldstr_columns()]
+        records = iter(records)
+        connection = self.store.connect()
+        connection.commit()
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("PRAGMA journal_mode = MEMORY")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        connection.execute("PRAGMA cache_size = {}".format(self.ingest_cache_size))
+        if replace:
+            print(colored("Deleting load / store table...", 'yellow'))
+            connection.execute("DELETE FROM {}".format(self.ldstr_inst_tbl))
+        for name in self.indexes:
+            connection.execute("DROP INDEX IF EXISTS {}".format(name))
+        connection.execute("INSERT INTO {0} SELECT IFNULL(MAX(generation), 0) + 1 FROM {0}".format(self.generation_tbl))
+        connection.execute("PRAGMA user_version = 0")
+        connection.commit()
+        statement = "INSERT INTO {} ({}) VALUES ({})".format(self.ldstr_inst_tbl, ", ".join(columns), ", ".join("?" * len(columns)))
+        print(colored("Loading trace...", 'yellow'))
+        start = perf_counter()
+        rows = committed = 0
+        try:
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                connection.executemany(statement, batch)
+                rows += len(batch)
+                if rows - committed >= transaction_size:
+                    connection.commit()
+                    committed = rows
+                    print(colored("\t{} rows ({:.0f} rows/sec)".format(rows, rows / (perf_counter() - start)), 'yellow'))
+        finally:
+            connection.commit()
+            elapsed = perf_counter() - start
+            print(colored("\tloaded {} rows in {:.1f} seconds ({:.0f} rows/sec)".format(rows, elapsed, rows / max(elapsed, 1e-9)), 'yellow'))
+            # The residency timeline, vulnerable intervals and plans came from the old trace
+            connection.execute("DELETE FROM {}".format(self.residency_info_tbl))
+            connection.execute("DELETE FROM {}".format(self.ace_info_tbl))
+            connection.execute("DELETE FROM {}".format(self.plan_tbl))
+            start = perf_counter()
+            self.update_schema()
+            print(colored("\tindexed in {:.1f} seconds".format(perf_counter() - start), 'yellow'))
+            self.update_metadata()
+            connection.execute("PRAGMA synchronous = FULL")
+            connection.execute("PRAGMA journal_mode = DELETE")
+            connection.execute("PRAGMA cache_size = {}".format(self.store.cache_size))
+        return rows
+
+    # Generation, last row and cycle count of the load / store table, which change whenever the
+    #   trace does
+    def get_trace_version(self):
+        try:
+            return tuple(self.store.query_one("get_trace_version", self.statements["get_trace_version"]))
+        except OperationalError:
+            # Database not updated to the current schema, so no trace was ingested into it since
+            return (0,) + tuple(self.store.query_one("get_trace_version", "SELECT (SELECT MAX(rowid) FROM {0}), (SELECT MAX({1}) FROM {0})".format(
+                self.ldstr_inst_tbl, self.cycles_total_col)))
+
+    # Start and end tag addresses and cycles from the single row of the injection info table
+    def get_tags(self):
+        tags = self.store.query_one("metadata", "SELECT {}, {}, {}, {} FROM {}".format(
+            self.start_addr_col, self.start_cycle_col, self.end_addr_col, self.end_cycle_col, self.inject_tbl))
+        return tuple(tags) if tags is not None else (None,) * 4
+
+    # Return the trace metadata as a dict keyed by metadata_cols, loading it on first use from the
+    #   metadata table, or computing it again when it was stored for another trace or tags
+    def get_metadata(self):
+        if self.metadata is not None:
+            return self.metadata
+        try:
+            row = self.store.query_one("metadata", "SELECT {} FROM {}".format(", ".join(self.metadata_cols), self.metadata_tbl))
+        except OperationalError:
+            # Database not updated to the current schema
+            row = None
+        previous = None
+        if row is not None:
+            previous = dict(zip(self.metadata_cols, row))
+            previous["set_accesses"] = loads(previous["set_accesses"])
+            if (previous["generation"], previous["last_row"], previous["end_cycle"]) == self.get_trace_version() and \
+                    (previous["start_tag_addr"], previous["start_tag_cycle"], previous["end_tag_addr"], previous["end_tag_cycle"]) == self.get_tags():
+                self.metadata = previous
+                return self.metadata
+        if self.store.read_only:
+            print(colored("Trace metadata is missing or out of date, open the trace database once for writing to store it", 'red'))
+        return self.update_metadata(previous)
+
+    # Compute the trace metadata, reusing the trace part of previous if the trace has not changed
+    #   since, and store it unless the database is open read-only
+    def update_metadata(self, previous=None):
+        version = self.get_trace_version()
+        if previous is not None and (previous["generation"], previous["last_row"], previous["end_cycle"]) == version:
+            rows, start_cycle, set_accesses = previous["rows"], previous["start_cycle"], previous["set_accesses"]
+        else:
+            print(colored("Computing trace metadata...", 'yellow'))
+            start = perf_counter()
+            rows = self.store.query_one("metadata", "SELECT COUNT(*) FROM {}".format(self.ldstr_inst_tbl))[0]
+            start_cycle = self.store.query_one("get_start_cycle", self.statements["get_start_cycle"])[0]
+            counts = self.store.query("get_set_accesses", self.statements["get_set_accesses"])
+            set_accesses = [0] * (max([cache_set for cache_set, count in counts] + [-1]) + 1)
+            for cache_set, count in counts:
+                set_accesses[cache_set] = count
+            print(colored("\t{} rows, cycles {} to {} in {:.1f} seconds".format(
+                rows, start_cycle, version[2], perf_counter() - start), 'yellow'))
+        generation, last_row, end_cycle = version
+        self.metadata = dict(zip(self.metadata_cols, (rows, generation, last_row, start_cycle, end_cycle) +
+                                 self.get_tags() + (set_accesses,)))
+        if not self.store.read_only:
+            self.store.execute("metadata", "DELETE FROM {}".format(self.metadata_tbl))
+            self.store.execute("metadata", "INSERT INTO {} VALUES ({})".format(self.metadata_tbl, ", ".join("?" * len(self.metadata_cols))),
+                               [dumps(value) if name == "set_accesses" else value for name, value in self.metadata.items()])
+            self.store.commit()
+        return self.metadata
+
     # Add the start and end addresses into the injection info table
     def log_tags(self, start_addr, end_addr):
         print("Adding start and end tag addresses.", start_addr, end_addr)
-        conn = connect(self.database)
-        c = conn.cursor()
-
-        c.execute("INSERT INTO {} (\"{}\", \"{}\") VALUES ({}, {})".format(self.inject_tbl, self.start_addr_col, self.end_addr_col, start_addr, end_addr))
-
-        conn.commit()
-        conn.close()
+        self.store.execute("log_tags", "INSERT INTO {} (\"{}\", \"{}\") VALUES (?, ?)".format(self.inject_tbl, self.start_addr_col, self.end_addr_col),
+                           (start_addr, end_addr))
+        self.store.commit()
+        self.metadata = None
 
     # Update the injection info table with the start and end cycles for the tags
     def log_start_end(self, start_cycle, end_cycle):
         print("Adding start and end cycle counts.", start_cycle, end_cycle)
-        conn = connect(self.database)
-        c = conn.cursor()
-
-        c.execute("UPDATE {} SET {} = {}, {} = {} WHERE {} = {}".format(self.inject_tbl, self.start_cycle_col, start_cycle, self.end_cycle_col, end_cycle, self.id_col, 1))
-
-        conn.commit()
-        conn.close()
+        self.store.execute("log_start_end", "UPDATE {} SET {} = ?, {} = ? WHERE {} = 1".format(self.inject_tbl, self.start_cycle_col, self.end_cycle_col, self.id_col),
+                           (start_cycle, end_cycle))
+        self.store.commit()
+        self.metadata = None
 
     # Return the start address from the single row of the injection info table
     def get_start_addr(self):
-        conn = connect(self.database)
-        c = conn.cursor()
-
-        c.execute("SELECT {} FROM {}".format(self.start_addr_col, self.inject_tbl))
-        retval = c.fetchone()[0]
-
-        conn.commit()
-        conn.close()
-        return retval
+        return self.get_metadata()["start_tag_addr"]
 
     # Returns the lowest cycle count from the load / store database
     def get_start_cycle(self):
-        conn = connect(self.database)
-        c = conn.cursor()
-
-        # SELECT MIN(cycles_total) FROM ls_inst
-        c.execute("SELECT MIN({}) FROM {}".format(self.cycles_total_col, self.ldstr_inst_tbl))
-        retval = c.fetchone()[0]
-
-        conn.commit()
-        conn.close()
-        return retval
+        if self.trace_index is not None:
+            return self.trace_index.start_cycle
+        return self.get_metadata()["start_cycle"]
 
     # Return the end address from the single row of the injection info table
     def get_end_addr(self):
-        conn = connect(self.database)
-        c = conn.cursor()
-
-        c.execute("SELECT {} FROM {}".format(self.end_addr_col, self.inject_tbl))
-        retval = c.fetchone()[0]
-
-        conn.commit()
-        conn.close()
-        return retval
+        return self.get_metadata()["end_tag_addr"]
 
     # Returns the highest cycle count from the load / store database
     def get_end_cycle(self):
-        conn = connect(self.database)
-        c = conn.cursor()
-
-        # SELECT MAX(cycles_total) FROM ls_inst
-        c.execute("SELECT MAX({}) FROM {}".format(self.cycles_total_col, self.ldstr_inst_tbl))
-        retval = c.fetchone()[0]
-
-        conn.commit()
-        conn.close()
-        return retval
+        if self.trace_index is not None:
+            return self.trace_index.end_cycle
+        return self.get_metadata()["end_cycle"]
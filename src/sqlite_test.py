@@ -1,6 +1,14 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from json import dumps, loads
+from os import devnull
+from os.path import exists
+from random import Random, seed
+from shutil import rmtree
+from types import SimpleNamespace
 from termcolor import cprint
-from .sqlite_database import sqlite_database, print_sqlite_database, delete_sqlite_database
-from sqlite3 import connect
+from .injection_plan import make_plans, plan_injections, previous_access
+from .sqlite_database import sqlite_database, print_sqlite_database, delete_sqlite_database, parse_trace_records, write_rows
 
 # Testing file for the sqlite_database class
 
@@ -20,11 +28,266 @@ def test_log_ldstr(sqlite_database):
     #cprint("Calling log_ldstr again with the same values, expect exit", 'cyan')
     #sqlite_database.log_ldstr(cache_section, cycles, ldstr, ldstr_addr)
 
+def test_get_load_register(sqlite_database):
+    loads = [(0x100a4c, "ldr r3, [r11, #-8]"), (0x100a50, "0x00100a50:\tldrb\tfp, [r1]"),
+             (0x100a54, "LDR r14, [sp], #4"), (0x100a58, "ldm r0, {r1, r2}"),
+             (0x100a5c, "ldrd r2, [r0, #8]"), (0x100a60, "ldrexd\tr4, r5, [r6]")]
+    for address, instruction in loads:
+        sqlite_database.store.execute("test", "INSERT INTO ls_inst (address, load0_store1, full_inst) VALUES (?, 0, ?)", (address, instruction))
+    sqlite_database.store.commit()
+
+    cprint("Calling get_load_register", 'cyan')
+    expected = ['r3', 'r11', 'lr', None, None, None]
+    for (address, instruction), register in zip(loads, expected):
+        if sqlite_database.get_load_register(address) != register:
+            cprint("get_load_register failed for " + instruction, 'red')
+
+def test_query_plans(sqlite_database):
+    cprint("Checking query plans", 'cyan')
+    for name, statement in sorted(sqlite_database.statements.items()):
+        parameters = (0,) * statement.count("?")
+        plan = sqlite_database.store.query("EXPLAIN", "EXPLAIN QUERY PLAN " + statement, parameters)
+        for row in plan:
+            # Searches use an index, scans read the whole table or index
+            if row[-1].startswith("SCAN") and row[-1] != "SCAN CONSTANT ROW":
+                cprint("{} scans the trace: {}".format(name, row[-1]), 'red')
+
+def test_metadata(sqlite_database):
+    sqlite_database.store.execute("test", "INSERT INTO ls_inst (cycles_t, L2_set) VALUES (100, 2), (300, 2), (200, 5)")
+    sqlite_database.store.commit()
+    sqlite_database.log_tags(0x100000, 0x100100)
+
+    cprint("Checking trace metadata", 'cyan')
+    if (sqlite_database.get_start_cycle(), sqlite_database.get_end_cycle()) != (100, 300):
+        cprint("trace metadata has wrong cycle bounds", 'red')
+    if sqlite_database.get_metadata()["set_accesses"][2:6] != [2, 0, 0, 1]:
+        cprint("trace metadata has wrong set accesses", 'red')
+    sqlite_database.log_start_end(100, 300)
+    if sqlite_database.get_metadata()["end_tag_cycle"] != 300:
+        cprint("trace metadata not updated with the tags", 'red')
+    sqlite_database.store.execute("test", "DELETE FROM ls_inst")
+    sqlite_database.store.execute("test", "DELETE FROM injection_info")
+    sqlite_database.store.commit()
+    sqlite_database.metadata = None
+
+# Loads / stores of a few instructions to the lines of four sets, with multi access instructions,
+#   stores and loads from backing memory
+def log_test_trace(sqlite_database, rows=2000):
+    random = Random(0)
+    cycles = 0
+    trace = []
+    while len(trace) < rows:
+        cycles += random.randint(1, 5)
+        pc = 0x100000 + 4 * random.randrange(16)
+        store = int(random.random() < 0.2)
+        for access in range(random.choice([1, 1, 1, 2, 4])):
+            ldstr_addr = 0x200000 + 32 * random.randrange(64) + 4 * random.randrange(8)
+            trace.append((cycles, 100 if random.random() < 0.1 else 14, pc, store, ldstr_addr,
+                          "LDM" if access else "LDR", "ldr r3, [r2]", (ldstr_addr >> 5) % 4))
+    sqlite_database.store.connect().executemany(
+        "INSERT INTO ls_inst (cycles_t, cycles_d, address, load0_store1, l_s_addr, instruction, full_inst, L2_set) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", trace)
+    sqlite_database.store.commit()
+    return trace
+
+def test_trace_lookups(sqlite_database):
+    try:
+        from .columnar_trace import load_columnar_trace
+        from .trace_index import load_trace_index
+    except ImportError:
+        cprint("NumPy is not installed, not checking the trace index and columnar trace", 'yellow')
+        return
+    trace = log_test_trace(sqlite_database)
+    cprint("Checking trace index and columnar trace lookups against SQL", 'cyan')
+    random = Random(1)
+    failures = set()
+    # The SQL lookups print every row they read
+    with open(devnull, 'w') as output, redirect_stdout(output):
+        indexes = {"trace index": load_trace_index(sqlite_database),
+                   "columnar trace": load_columnar_trace(sqlite_database)}
+        for check in range(200):
+            cycle = random.randint(0, trace[-1][0] + 10)
+            cache_set = random.randrange(5)
+            sqlite_database.stored_cache_set = None
+            lines = previous_access(sqlite_database, cycle, cache_set, 8)
+            address = random.choice(trace)[4]
+            accesses = [list(access) for access in sqlite_database.NextLdrStr(cycle, (address >> 5) % 4, address)]
+            pc = random.choice(trace)[2]
+            end_cycle = cycle + random.randint(0, 1000)
+            executions = sqlite_database.SkipCount(cycle, end_cycle, pc)
+            for name, index in indexes.items():
+                if index.previous_lines(cycle, cache_set, 8) != lines:
+                    failures.add("{} previous_lines differs from PreviousLdrStr".format(name))
+                if index.next_accesses(cycle, (address >> 5) % 4, address) != accesses:
+                    failures.add("{} next_accesses differs from NextLdrStr".format(name))
+                if index.count_executions(cycle, end_cycle, pc) != executions:
+                    failures.add("{} count_executions differs from SkipCount".format(name))
+        rows = sqlite_database.store.query("test", "SELECT * FROM ls_inst ORDER BY cycles_t, rowid")
+        columnar = indexes["columnar trace"]
+        if list(columnar.records()) != rows:
+            failures.add("columnar trace records differ from the load / store table")
+        sqlite_database.ingest(columnar.records(), columnar.columns, replace=True)
+        if sqlite_database.store.query("test", "SELECT * FROM ls_inst ORDER BY cycles_t, rowid") != rows:
+            failures.add("load / store table changed by ingesting the columnar trace")
+    for failure in sorted(failures):
+        cprint(failure, 'red')
+    delete_test_trace(sqlite_database)
+
+# Accesses as (cycles, load / store address, load0_store1, latency), all to set 0 of a cache with
+#   two sets of 32 byte lines
+def log_test_accesses(sqlite_database, accesses):
+    sqlite_database.store.connect().executemany(
+        "INSERT INTO ls_inst (cycles_t, l_s_addr, load0_store1, cycles_d, address, L2_set) VALUES (?, ?, ?, ?, 4096, 0)",
+        accesses)
+    sqlite_database.store.commit()
+    sqlite_database.metadata = None
+
+def test_residency(sqlite_database):
+    # Lines 0 and 2 fill both ways, line 0 is used again and line 4 evicts one of them
+    log_test_accesses(sqlite_database, [(10, 0x00, 0, 14), (20, 0x40, 0, 14), (30, 0x00, 0, 14), (40, 0x80, 0, 14)])
+    cprint("Checking residency timelines", 'cyan')
+    for policy, resident in (("lru", [0, 4]), ("round_robin", [4, 2])):
+        with open(devnull, 'w') as output, redirect_stdout(output):
+            sqlite_database.update_residency(2, 2, 32, policy)
+        if sqlite_database.get_resident_lines(35, 0) != [0, 2]:
+            cprint("{} residency timeline has wrong lines before the eviction".format(policy), 'red')
+        if sqlite_database.get_resident_lines(41, 0) != resident:
+            cprint("{} residency timeline has wrong lines after the eviction".format(policy), 'red')
+    delete_test_trace(sqlite_database)
+
+# Reads of words 0 and 1 of a line after it is filled, a read of a byte of word 0 (not followed
+#   by NextLdrStr), a store to word 0 and a read of it, and a load from backing memory
+ace_accesses = [(10, 0x00, 0, 14), (20, 0x00, 0, 14), (25, 0x01, 0, 14), (30, 0x04, 0, 14), (40, 0x00, 1, 14),
+                (50, 0x00, 0, 14), (60, 0x00, 0, 100)]
+
+def test_ace(sqlite_database):
+    log_test_accesses(sqlite_database, ace_accesses)
+    cprint("Checking vulnerable intervals", 'cyan')
+    with open(devnull, 'w') as output, redirect_stdout(output):
+        sqlite_database.update_residency(2, 2, 32, "lru")
+        sqlite_database.update_ace()
+    intervals = sqlite_database.store.query("test", "SELECT * FROM l2_ace ORDER BY weight_end")
+    if intervals != [(0, 0, 0, 11, 20, 9), (0, 0, 1, 11, 30, 28), (0, 0, 0, 40, 50, 38)]:
+        cprint("wrong vulnerable intervals: {}".format(intervals), 'red')
+    # 38 word cycles of 2 sets * 2 ways * 256 bits over 50 cycles
+    if sqlite_database.ace[2] != 38 or abs(sqlite_database.ace[3] - 38 * 32 / (2 * 2 * 256 * 50)) > 1e-12:
+        cprint("wrong AVF: {}".format(sqlite_database.ace), 'red')
+    with open(devnull, 'w') as output, redirect_stdout(output):
+        sqlite_database.update_residency(2, 1, 32, "lru")
+    if sqlite_database.get_ace() is not None:
+        cprint("vulnerable intervals kept with a different cache geometry", 'red')
+    delete_test_trace(sqlite_database)
+
+def test_ingest(sqlite_database):
+    lines = ["# cycles_t|cycles_d|address|load0_store1|l_s_addr|instruction|full_inst|L2_set\n",
+             "0x64|14|0x100a4c|0|0x2000|LDR|ldr r3, [r2]|0x100\n", "\n",
+             "200||0x100a50||0X2004|LDR||\n"]
+    columns = ["cycles_t", "cycles_d", "address", "load0_store1", "l_s_addr", "instruction", "full_inst", "L2_set"]
+    types = dict(sqlite_database.get_ldstr_columns())
+    cprint("Checking trace ingest", 'cyan')
+    with open(devnull, 'w') as output, redirect_stdout(output):
+        sqlite_database.ingest(parse_trace_records(lines, [types[name] for name in columns]), columns)
+        try:
+            sqlite_database.ingest(parse_trace_records(["300|14|0x100a54|1|0x2008|STR|str r3, [r2]|256\n", "300|14|pc|1|0|STR||1\n"],
+                                                       [types[name] for name in columns]), columns)
+            cprint("ingest did not fail on an invalid integer", 'red')
+        except Exception:
+            pass
+    rows = sqlite_database.store.query("test", "SELECT {} FROM ls_inst ORDER BY cycles_t".format(", ".join(columns)))
+    if rows != [(100, 14, 0x100a4c, 0, 0x2000, "LDR", "ldr r3, [r2]", 256), (200, None, 0x100a50, None, 0x2004, "LDR", None, None)]:
+        cprint("ingest loaded wrong rows: {}".format(rows), 'red')
+    pragmas = [sqlite_database.store.query_one("test", "PRAGMA {}".format(pragma))[0]
+               for pragma in ("synchronous", "journal_mode", "cache_size", "user_version")]
+    if pragmas != [2, "delete", sqlite_database.store.cache_size, sqlite_database.schema_version]:
+        cprint("ingest did not restore the pragmas: {}".format(pragmas), 'red')
+    indexes = [row[0] for row in sqlite_database.store.query("test", "SELECT name FROM sqlite_master WHERE type = 'index'")]
+    for name in sqlite_database.indexes:
+        if name not in indexes:
+            cprint("ingest did not restore index {}".format(name), 'red')
+    delete_test_trace(sqlite_database)
+
+def test_plans(sqlite_database):
+    log_test_accesses(sqlite_database, ace_accesses)
+    targets = {"CACHE_L2": {"registers": {"cacheline_{:04d}".format(cache_set): {"fields": [["data_0", [255, 0]], ["data_1", [511, 256]]]}
+                                          for cache_set in range(2)}}}
+    options = SimpleNamespace(cache_model="lru", ace=True, injections=1, selected_target_indices=None)
+    iterations = [(1, 1), (2, 2), (3, 3)]
+    cprint("Checking injection plans", 'cyan')
+    with open(devnull, 'w') as output, redirect_stdout(output):
+        sqlite_database.update_residency(2, 2, 32, "lru")
+        sqlite_database.update_ace()
+        make_plans(sqlite_database, targets, options, iterations, 1)
+        key = sqlite_database.get_plan_key(options)
+        injections = []
+        for number, iteration_seed in iterations:
+            seed(iteration_seed)
+            injections.append(loads(dumps(plan_injections(sqlite_database, targets, options))))
+    for (number, iteration_seed), expected in zip(iterations, injections):
+        plan = sqlite_database.get_plan(number, key)
+        if plan != expected:
+            cprint("plan of iteration {} does not replay its injections".format(number), 'red')
+        elif "error" in plan[0]["cache"]:
+            cprint("iteration {} has no plan for its L2 cache injection: {}".format(number, plan[0]["cache"]["error"]), 'red')
+    if sqlite_database.get_plan(1, sqlite_database.get_plan_key(SimpleNamespace(**dict(vars(options), injections=2)))) is not None:
+        cprint("plan replayed with different options", 'red')
+    delete_test_trace(sqlite_database)
+
+def test_inspect(sqlite_database):
+    log_test_accesses(sqlite_database, ace_accesses)
+    cprint("Checking trace inspection", 'cyan')
+    names, rows = sqlite_database.inspect(columns=["cycles_t", "l_s_addr"], cycles=(20, 50), ldstr_addr=0, limit=2, offset=1)
+    if list(rows) != [(40, 0), (50, 0)]:
+        cprint("inspect filters returned wrong rows", 'red')
+    output = StringIO()
+    names, rows = sqlite_database.inspect(columns=["cycles_t", "load0_store1"], cycles=(40, 40))
+    write_rows(output, "ls_inst", names, rows, "csv")
+    if output.getvalue() != "cycles_t,load0_store1\r\n40,1\r\n":
+        cprint("wrong CSV output: {!r}".format(output.getvalue()), 'red')
+    output = StringIO()
+    names, rows = sqlite_database.inspect(columns=["cycles_t", "cycles_d"], cycles=(50, 60))
+    write_rows(output, "ls_inst", names, rows, "jsonl")
+    if [loads(line) for line in output.getvalue().splitlines()] != [{"cycles_t": 50, "cycles_d": 14}, {"cycles_t": 60, "cycles_d": 100}]:
+        cprint("wrong JSON lines output: {!r}".format(output.getvalue()), 'red')
+    for arguments in ({"table": "no_such_table"}, {"columns": ["no_such_column"]}, {"table": "injection_info", "cache_set": 0}):
+        try:
+            sqlite_database.inspect(**arguments)
+            cprint("inspect accepted {}".format(arguments), 'red')
+        except Exception:
+            pass
+    delete_test_trace(sqlite_database)
+
+def delete_test_trace(sqlite_database):
+    for table in ("ls_inst", "l2_residency", "l2_residency_info", "l2_ace", "l2_ace_info", "injection_plan"):
+        sqlite_database.store.execute("test", "DELETE FROM {}".format(table))
+    sqlite_database.store.commit()
+    sqlite_database.metadata = None
+    sqlite_database.load_registers = None
+    sqlite_database.residency = None
+    sqlite_database.ace = None
+    try:
+        from .columnar_trace import get_columnar_trace_path
+        from .trace_index import get_trace_index_path
+    except ImportError:
+        return
+    for path in (get_trace_index_path(sqlite_database), get_columnar_trace_path(sqlite_database)):
+        if exists(path):
+            rmtree(path)
+
 def run_sqlite_tests(options):
 
     cprint("Running tests on sqlite_database", 'cyan')
     db = sqlite_database(options)
     print_sqlite_database(db)
     test_log_asm(db)
+    test_query_plans(db)
+    test_metadata(db)
+    test_trace_lookups(db)
+    test_residency(db)
+    test_ace(db)
+    test_ingest(db)
+    test_plans(db)
+    test_inspect(db)
+    test_get_load_register(db)
     test_log_ldstr(db)
+    db.close()
     delete_sqlite_database(db)
@@ -93,6 +93,35 @@ def calculate_target_bits(targets):
         targets[target]['total_bits'] = total_bits
 
 
+# sets, ways and line size (in bytes) of a cache target generated by cache_json_gen.py, defaulting
+# to the Zynq L2 cache when the target is missing
+def get_cache_geometry(targets, target='CACHE_L2'):
+    if target not in targets:
+        return 2048, 8, 32
+    registers = targets[target]['registers']
+    cacheline = registers[sorted(registers)[0]]
+    line_size = 32
+    for field, (high, low) in cacheline.get('fields', []):
+        if field.startswith('data'):
+            line_size = (high - low + 1) // 8
+            break
+    return len(registers), cacheline.get('ways', 8), line_size
+
+
+# Injection into bit of word of the data in way of cache_set of a cache target generated by
+# cache_json_gen.py
+def get_cache_injection(targets, cache_set, way, word, bit, target='CACHE_L2'):
+    register = 'cacheline_{:04d}'.format(cache_set)
+    field = 'data_{}'.format(way)
+    for name, (high, low) in targets[target]['registers'][register]['fields']:
+        if name == field:
+            break
+    else:
+        raise Exception('{} {} has no field {}'.format(target, register, field))
+    return {'target': target, 'target_name': target, 'register': register,
+            'field': field, 'bit': low + 32*word + bit}
+
+
 def get_targets(architecture, type_, selected_targets, selected_registers):
     targets = load_targets('', architecture)
     targets_info = targets[type_]
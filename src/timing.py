@@ -0,0 +1,40 @@
+from contextlib import contextmanager
+from threading import get_ident
+from time import perf_counter
+
+# phases of an injection iteration, each stored as a field of log.models.timing
+phases = ('reset', 'boot', 'send_files', 'inject', 'breakpoints', 'execution',
+          'check_output', 'get_logs', 'latent', 'database')
+
+
+class phase_timer(object):
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.times = dict.fromkeys(phases, 0.0)
+        self.__stack = []
+        self.__thread = get_ident()
+
+    # time is exclusive: a nested span pauses its parent, unless the parent
+    # is inclusive (e.g. latent runs) in which case nested spans are absorbed
+    @contextmanager
+    def span(self, phase, inclusive=False):
+        if get_ident() != self.__thread or \
+                (self.__stack and self.__stack[-1][2]):
+            yield
+            return
+        now = perf_counter()
+        if self.__stack:
+            parent = self.__stack[-1]
+            self.times[parent[0]] += now - parent[1]
+        span = [phase, now, inclusive]
+        self.__stack.append(span)
+        try:
+            yield
+        finally:
+            now = perf_counter()
+            self.__stack.pop()
+            self.times[phase] += now - span[1]
+            if self.__stack:
+                self.__stack[-1][1] = now
@@ -0,0 +1,189 @@
+from os import makedirs, rename
+from os.path import dirname, exists, join
+from shutil import rmtree
+from termcolor import colored
+from time import perf_counter
+
+import numpy as np
+
+from .cache_simulator import miss_latency
+
+# Copies of the load / store table of the golden run, each sorted for one kind
+#   of lookup made while injecting into the L2 cache, saved as .npy files and
+#   memory mapped by every injection process. Keys are searched with
+#   searchsorted, so each lookup is O(log n) in the trace length.
+#
+# by set:     set_offsets (first access of each set), set_cycles, set_lines
+#             (line address)
+# by access:  access_keys (set << 32 | load / store address), access_cycles,
+#             access_store, access_latency, access_pc
+# by pc:      pc_keys (instruction address), pc_cycles (one per execution)
+arrays = ['set_offsets', 'set_cycles', 'set_lines',
+          'access_keys', 'access_cycles', 'access_store', 'access_latency',
+          'access_pc', 'pc_keys', 'pc_cycles', 'info']
+
+
+def get_trace_index_path(sqlite_database):
+    return join(dirname(sqlite_database.database), 'trace_index')
+
+
+# Generation, last row and cycle count of the load / store table, used to spot
+#   an index built from an older trace (writes to the other tables do not
+#   matter)
+def get_trace_version(sqlite_database):
+    return [value or 0 for value in sqlite_database.get_trace_version()]
+
+
+def build_trace_index(sqlite_database):
+    print(colored("Building trace index...", 'yellow'))
+    start = perf_counter()
+    db = sqlite_database
+    version = get_trace_version(db)
+    cursor = db.store.execute(
+        "trace_index",
+        "SELECT {set}, {cycles}, {ldstr_addr}, IFNULL({ldstr}, 0), "
+        "IFNULL({diff}, 0), IFNULL({address}, 0) FROM {tbl} "
+        "WHERE {set} IS NOT NULL AND {cycles} IS NOT NULL "
+        "AND {ldstr_addr} IS NOT NULL".format(
+            set=db.cache_set_col, cycles=db.cycles_total_col,
+            ldstr_addr=db.ldstr_addr_col, ldstr=db.ldstr_col,
+            diff=db.cycles_diff_col, address=db.address_col,
+            tbl=db.ldstr_inst_tbl))
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(1000000)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.int64))
+    if chunks:
+        trace = np.concatenate(chunks)
+    else:
+        trace = np.zeros((0, 6), dtype=np.int64)
+    cache_set, cycles, address, store, latency, pc = trace.T
+    columns = {}
+
+    # The accesses of a multi access instruction by address, as PreviousLdrStr
+    #   finds them
+    order = np.lexsort((address, cycles, cache_set))
+    sets = int(cache_set.max()) + 1 if len(trace) else 0
+    columns['set_offsets'] = np.searchsorted(cache_set[order],
+                                             np.arange(sets + 1))
+    columns['set_cycles'] = cycles[order]
+    # 32 bytes to a line
+    columns['set_lines'] = address[order] >> 5
+
+    keys = (cache_set << 32) | address
+    order = np.lexsort((cycles, keys))
+    columns['access_keys'] = keys[order]
+    columns['access_cycles'] = cycles[order]
+    columns['access_store'] = store[order].astype(np.int8)
+    columns['access_latency'] = latency[order]
+    columns['access_pc'] = pc[order]
+
+    # A multi access instruction has a row for each access but is executed
+    #   once
+    executions = np.unique(np.stack((pc, cycles), axis=1), axis=0)
+    columns['pc_keys'] = executions[:, 0]
+    columns['pc_cycles'] = executions[:, 1]
+
+    columns['info'] = np.array(
+        version + [len(trace), cycles.min() if len(trace) else 0,
+                   cycles.max() if len(trace) else 0], dtype=np.int64)
+
+    # Written next to the final location and then renamed, so a partial index
+    #   is never loaded
+    path = get_trace_index_path(db)
+    if exists(path + '.tmp'):
+        rmtree(path + '.tmp')
+    makedirs(path + '.tmp')
+    for name in arrays:
+        np.save(join(path + '.tmp', name + '.npy'), columns[name])
+    if exists(path):
+        rmtree(path)
+    rename(path + '.tmp', path)
+    print(colored("\tindexed {} accesses in {:.1f} seconds".format(
+        len(trace), perf_counter() - start), 'yellow'))
+
+
+# Return the trace index for the database, building it first when it is
+#   missing or out of date unless the database is open read-only, in which
+#   case None is returned
+def load_trace_index(sqlite_database):
+    path = get_trace_index_path(sqlite_database)
+    current = False
+    if exists(join(path, 'info.npy')):
+        current = list(np.load(join(path, 'info.npy'))[:3]) == \
+            get_trace_version(sqlite_database)
+    if not current:
+        if sqlite_database.store.read_only:
+            print(colored("Trace index is missing or out of date, using SQL "
+                          "queries", 'red'))
+            return None
+        build_trace_index(sqlite_database)
+    return trace_index(path)
+
+
+class trace_index(object):
+    def __init__(self, path):
+        self.path = path
+        for name in arrays:
+            setattr(self, name,
+                    np.load(join(path, name + '.npy'), mmap_mode='r'))
+        self.accesses = int(self.info[3])
+        self.start_cycle = int(self.info[4])
+        self.end_cycle = int(self.info[5])
+
+    def set_range(self, cache_set):
+        if cache_set < 0 or cache_set + 1 >= len(self.set_offsets):
+            return 0, 0
+        return (int(self.set_offsets[cache_set]),
+                int(self.set_offsets[cache_set + 1]))
+
+    # Line addresses of the last count distinct lines accessed in cache_set
+    #   before cycle, most recent first (what injection_plan.previous_access
+    #   finds with repeated PreviousLdrStr calls)
+    def previous_lines(self, cycle, cache_set, count):
+        first, last = self.set_range(cache_set)
+        end = first + int(np.searchsorted(self.set_cycles[first:last], cycle,
+                                          'left'))
+        lines = []
+        window = 4 * count
+        while end > first and len(lines) < count:
+            begin = max(first, end - window)
+            recent = np.asarray(self.set_lines[begin:end])[::-1]
+            for line in recent[np.sort(
+                    np.unique(recent, return_index=True)[1])]:
+                if int(line) not in lines:
+                    lines.append(int(line))
+                    if len(lines) == count:
+                        break
+            end = begin
+            window *= 2
+        return lines
+
+    # Accesses to address in cache_set after cycle, up to the first store or
+    #   load from backing memory, as [cycles, pc] (what
+    #   sqlite_database.NextLdrStr returns)
+    def next_accesses(self, cycle, cache_set, address):
+        key = (int(cache_set) << 32) | int(address)
+        first = int(np.searchsorted(self.access_keys, key, 'left'))
+        last = int(np.searchsorted(self.access_keys, key, 'right'))
+        first += int(np.searchsorted(self.access_cycles[first:last], cycle,
+                                     'right'))
+        stops = np.flatnonzero(
+            (np.asarray(self.access_store[first:last]) == 1) |
+            (np.asarray(self.access_latency[first:last]) > miss_latency))
+        if len(stops):
+            last = first + int(stops[0])
+        return [[int(cycles), int(pc)] for cycles, pc in
+                zip(self.access_cycles[first:last],
+                    self.access_pc[first:last])]
+
+    # Executions of the instruction at pc between the two cycles, exclusive
+    #   (what sqlite_database.SkipCount returns)
+    def count_executions(self, start_cycle, end_cycle, pc):
+        first = int(np.searchsorted(self.pc_keys, pc, 'left'))
+        last = int(np.searchsorted(self.pc_keys, pc, 'right'))
+        cycles = self.pc_cycles[first:last]
+        return max(0, int(np.searchsorted(cycles, end_cycle, 'left')) -
+                   int(np.searchsorted(cycles, start_cycle, 'right')))
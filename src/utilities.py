@@ -3,8 +3,8 @@ from datetime import datetime
 from django.core.management import execute_from_command_line as django_command
 from django.db import connection
 from json import dump, load
-from multiprocessing import Process, Value
-from os import getcwd, listdir, mkdir, remove, walk
+from multiprocessing import Process, cpu_count
+from os import getcwd, listdir, makedirs, mkdir, remove, walk
 from os.path import abspath, dirname, exists, isdir, join
 from progressbar import ProgressBar
 from progressbar.widgets import Bar, Percentage, SimpleProgress, Timer
@@ -16,15 +16,23 @@ from terminaltables import AsciiTable
 from traceback import print_exc
 
 from .database import (backup_database, delete_database, get_campaign,
-                       new_campaign, restore_database)
+                       get_iteration_progress, new_campaign, plan_iterations,
+                       recover_iterations, restore_database)
+from .distributed import coordinator, run_agent
 from .fault_injector import fault_injector
+from .gold_cache import cache_folder as gold_cache_folder
+from .injection_plan import make_plans
 from .jtag import (find_all_uarts, find_p2020_uarts, find_zedboard_jtag_serials,
                    find_zedboard_uart_serials)
 from .jtag.openocd import openocd
+from .metrics import metrics
 from .power_switch import power_switch
-from .simics.config import simics_config
+from .simics.config import update_checkpoint_dependencies
 from .supervisor import supervisor
-from .sqlite_database import sqlite_database, print_sqlite_database, get_database_path
+from .sqlite_database import (get_database_path, parse_trace_records,
+                              print_sqlite_database, read_trace_source,
+                              sqlite_database, write_rows)
+from .targets import get_cache_geometry, get_targets
 
 
 def detect_power_switch_devices(options):
@@ -60,8 +68,9 @@ def detect_power_switch_devices(options):
                 devices.append({'outlet': outlet,
                                 'ftdi': ftdi_serials[0],
                                 'uart': uart_serials[0]})
-        for outlet in status:
-            ps.set_outlet(outlet['outlet'], outlet['status'], 1)
+        for state in ('off', 'on'):
+            ps.set_outlets([outlet['outlet'] for outlet in status
+                            if outlet['status'].lower() == state], state, 1)
     with open('devices.json', 'w') as device_file:
         dump(devices, device_file, indent=4)
     print('saved device information to "devices.json"')
@@ -268,6 +277,21 @@ def create_campaign(options):
         call("mv ../scripts/gdb_log_* ./campaign-data/{}/".format(campaign.id), shell=True)
         call(["scp", "pi@{}:~/jtag_eval/openOCD_cfg/mnt/output.txt".format(options.debugger_ip_address), "./campaign-data/{}/openOCD_output.txt".format(campaign.id)])
 
+def update_cache_model(options, database, architecture):
+    if options.ace and options.cache_model is None:
+        raise Exception('--ace requires --cache_model')
+    if options.cache_model is not None:
+        # Simulated once here and read by every injection process
+        database.update_residency(
+            *get_cache_geometry(get_targets(architecture, 'jtag', None, None)),
+            policy=options.cache_model)
+        if options.ace:
+            database.update_ace()
+            if not database.ace[2]:
+                raise Exception('no vulnerable intervals found for --ace, the '
+                                'golden run never reads the L2 cache data')
+
+
 def inject_campaign(options):
     campaign = get_campaign(options)
     architecture = campaign.architecture
@@ -275,17 +299,57 @@ def inject_campaign(options):
     print("In inject_campaign")
     cache_sqlite_path = get_database_path(options)
     database = sqlite_database(options, cache_sqlite_path)
+    update_cache_model(options, database, architecture)
+    database.get_metadata()
+    database.close()
     # print_sqlite_database(database)
-
-    def perform_injections(iteration_counter, switch):
+    # Opened once here with the trace metadata cached and shared by the injection processes,
+    #   each of which opens its own connection
+    options.cache_sqlite = sqlite_database(options, cache_sqlite_path,
+                                           read_only=True)
+    options.cache_sqlite.get_metadata()
+    options.cache_sqlite.store.close()
+
+    def perform_injections(switch, slot=0):
+        if options.metrics is not None:
+            options.metrics.assign(
+                slot, options.dut_serial_port or 'process {}'.format(slot))
         drseus = fault_injector(options, switch)
-        drseus.inject_campaign(iteration_counter)
+        try:
+            drseus.inject_campaign()
+        finally:
+            # atexit handlers do not run in multiprocessing children
+            drseus.db.flush_debugger_output()
 
 # def inject_campaign(options):
+    if options.resume:
+        recovered = recover_iterations(campaign)
+        if recovered:
+            print('recovered {} interrupted iteration(s)'.format(recovered))
+        options.first_iteration = 1
     if options.iterations is not None:
-        iteration_counter = Value('L', options.iterations)
+        first_iteration = plan_iterations(campaign, options.iterations)
+        if not options.resume:
+            options.first_iteration = first_iteration
+    progress = get_iteration_progress(campaign)
+    if options.resume:
+        print('campaign {}: {} iteration(s) completed, {} remaining'.format(
+            campaign.id, progress['completed'], progress['planned']))
+    elif progress['planned'] > (options.iterations or 0):
+        print('campaign {} has {} unfinished iteration(s), use "inject '
+              '--resume" to perform them'.format(
+                  campaign.id, progress['planned']-(options.iterations or 0)))
+    if options.metrics_port:
+        options.metrics = metrics(options.processes)
+        options.metrics.serve(options.metrics_port, campaign)
+        print('serving metrics at http://localhost:{}/metrics'.format(
+            options.metrics_port))
     else:
-        iteration_counter = None
+        options.metrics = None
+    if options.coordinator:
+        connection.close()
+        coordinator(options).serve()
+        return
     if not simics and architecture == 'a9' \
             and options.power_switch_ip_address:
         switch = power_switch(options)
@@ -306,8 +370,7 @@ def inject_campaign(options):
                     options.dut_serial_port = uarts[i]
                 else:
                     break
-            process = Process(target=perform_injections,
-                              args=[iteration_counter, switch])
+            process = Process(target=perform_injections, args=[switch, i])
             processes.append(process)
             process.start()
         try:
@@ -317,7 +380,94 @@ def inject_campaign(options):
             for process in processes:
                 process.join()
     else:
-        perform_injections(iteration_counter, switch)
+        perform_injections(switch)
+
+
+def ingest_trace(options):
+    campaign = get_campaign(options)
+    options.campaign_id = campaign.id
+    database_path = get_database_path(options)
+    if not exists(dirname(database_path)):
+        makedirs(dirname(database_path))
+    with sqlite_database(options, database_path) as database:
+        types = dict(database.get_ldstr_columns())
+        columns = options.columns or list(types)
+        for column in columns:
+            if column not in types:
+                raise Exception('invalid load/store table column: {}'.format(
+                    column))
+        records = parse_trace_records(
+            read_trace_source(options.source, options.listen),
+            [types[column] for column in columns], options.separator)
+        database.ingest(records, columns, options.batch_size,
+                        replace=options.replace)
+
+
+def convert_trace(options):
+    # Only imported when used, since it needs NumPy
+    from .columnar_trace import (columnar_trace, get_columnar_trace_path,
+                                 write_columnar_trace)
+    campaign = get_campaign(options)
+    options.campaign_id = campaign.id
+    with sqlite_database(options, get_database_path(options)) as database:
+        if options.format == 'columnar':
+            write_columnar_trace(database)
+            if options.drop:
+                print('deleting load/store table rows')
+                database.store.execute('convert', 'DELETE FROM {}'.format(
+                    database.ldstr_inst_tbl))
+                database.store.commit()
+                database.store.execute('convert', 'VACUUM')
+        else:
+            trace = columnar_trace(get_columnar_trace_path(database))
+            database.ingest(trace.records(), trace.columns, replace=True)
+
+
+def inspect_trace(options):
+    campaign = get_campaign(options)
+    options.campaign_id = campaign.id
+    database_path = get_database_path(options)
+    if not exists(database_path):
+        raise Exception('no trace database for campaign {}'.format(
+            campaign.id))
+    database = sqlite_database(options, database_path, read_only=True)
+    try:
+        names, rows = database.inspect(
+            options.table, options.columns, options.cycles, options.set,
+            options.address, options.ldstr_addr, options.limit,
+            options.offset)
+        if options.output:
+            with open(options.output, 'w', newline='') as output:
+                count = write_rows(output, options.table, names, rows,
+                                   options.format)
+            print('wrote {} rows to {}'.format(count, options.output))
+        else:
+            write_rows(stdout, options.table, names, rows, options.format)
+    finally:
+        # Without the query stats, which would end up in the output
+        database.store.close()
+
+
+def plan_campaign(options):
+    campaign = get_campaign(options)
+    if campaign.simics:
+        raise Exception('plans are only made for JTAG campaigns')
+    options.campaign_id = campaign.id
+    database = sqlite_database(options, get_database_path(options))
+    update_cache_model(options, database, campaign.architecture)
+    targets = get_targets(campaign.architecture, 'jtag',
+                          options.selected_targets, options.selected_registers)
+    if options.iterations is not None:
+        iterations = campaign.iteration_set.filter(
+            number__gte=plan_iterations(campaign, options.iterations))
+    else:
+        iterations = campaign.iteration_set.filter(status='planned')
+    iterations = list(iterations.order_by('number').values_list('number',
+                                                                'seed'))
+    connection.close()
+    make_plans(database, targets, options, iterations,
+               options.processes or cpu_count())
+    database.close()
 
 
 def regenerate(options):
@@ -346,23 +496,6 @@ def run_django_command(options):
 
 
 def update_dependencies(*args):
-
-    def update_checkpoint_dependencies(campaign_id):
-        for checkpoint in listdir('simics-workspace/gold-checkpoints/{}'.format(
-                campaign_id)):
-            with simics_config('simics-workspace/gold-checkpoints/{}/{}'.format(
-                    campaign_id, checkpoint)) as config:
-                paths = config.get(config, 'sim', 'checkpoint_path')
-                new_paths = []
-                for path in paths:
-                    path_list = path.split('/')
-                    path_list = path_list[path_list.index('simics-workspace'):]
-                    path_list[-2] = str(campaign_id)
-                    new_paths.append('"{}/{}'.format(getcwd(),
-                                                     '/'.join(path_list)))
-                config.set(config, 'sim', 'checkpoint_path', new_paths)
-                config.save()
-
     if exists('simics-workspace/gold-checkpoints'):
         print('updating gold checkpoint path dependencies...', end='')
         stdout.flush()
@@ -387,6 +520,10 @@ def launch_openocd(options):
         debugger.openocd.kill()
 
 
+def launch_agent(options):
+    run_agent(options)
+
+
 def launch_supervisor(options):
     supervisor(options).cmdloop()
 
@@ -503,6 +640,9 @@ def clean(options):
         print('deleted backups')
     if exists('power_switch_log.txt') and (options.all or options.power_log):
         remove('power_switch_log.txt')
+    if exists(gold_cache_folder) and (options.all or options.gold_cache):
+        rmtree(gold_cache_folder)
+        print('deleted gold cache')
 
 
 def launch_minicom(options):